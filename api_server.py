@@ -2,34 +2,97 @@
 FastAPI server for file streaming and download endpoints
 Integrated with File-Sharing Bot with Admin Panel Support
 """
-from fastapi import FastAPI, HTTPException, Response, UploadFile, File, Form, Depends
-from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, Response, Form, Depends, Query, Body
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
+import time
+import math
 import asyncio
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import aiofiles
-import tempfile
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import uuid
-import requests
+import json
+import shutil
+import hashlib
+import aiohttp
 import mimetypes
+from urllib.parse import urlparse, unquote, quote
 
-from telegram_downloader_integration import TelegramDownloader
+from telegram_downloader_integration import TelegramDownloader, worker_session_config, discard_worker_session
+from compression import JSONCompressionMiddleware, mount_static_dir
+from metrics import metrics, RequestMetricsMiddleware
+from rate_limiter import TokenBucketLimiter, check_all, create_bucket_store
+from stream_control import (
+    BandwidthScheduler, ReadAheadBuffer, CancellableStreamingResponse,
+    AdmissionController, AdmissionRejected, AdmissionTicket, SharedSlots
+)
+from stream_broadcast import BroadcastHub
+from stream_cache import PrefixCache, ChunkCache, HotChunkLRU
+from temp_janitor import TempJanitor, PinnedFileResponse
+from upload_stream import BodySizeLimitMiddleware, receive_multipart_upload
+from zip_stream import ZipMember, member_name, plan_archive, stream_zip, unique_names
 from database.sqlite_database import (
-    get_file_by_link_code, get_file, add_file, create_file_link,
-    get_files_by_category, get_categories, create_category, delete_category,
-    full_userbase, del_user, present_user
+    get_file_by_link_code, get_files_by_link_codes, get_files_by_ids, get_file, add_file, create_file_link,
+    get_files_by_category, list_files, get_category, get_categories, create_category, delete_category,
+    full_userbase, del_user, present_user, get_catalog_version
+)
+from config import (
+    TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_SIZE,
+    URL_FETCH_CHUNK_SIZE, URL_FETCH_MAX_CONNECTIONS, URL_FETCH_MAX_PER_HOST,
+    URL_FETCH_CONNECT_TIMEOUT, URL_FETCH_READ_TIMEOUT, URL_FETCH_RETRIES,
+    STATIC_BUILD_PATH, JSON_COMPRESS_MIN_SIZE, METRICS_FLUSH_INTERVAL,
+    RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_LINK_RATE, RATE_LIMIT_LINK_BURST,
+    RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, RATE_LIMIT_PRUNE_INTERVAL, RATE_LIMIT_TRUST_PROXY,
+    STREAM_MAX_RATE, STREAM_GLOBAL_MAX_RATE, STREAM_PRIORITY_WEIGHT,
+    STREAM_MAX_ACTIVE, STREAM_MAX_QUEUE, STREAM_QUEUE_TIMEOUT, STREAM_SESSION_WINDOW, STREAM_SLOT_DIR,
+    STREAM_READAHEAD_MIN_BYTES, STREAM_READAHEAD_MAX_BYTES, STREAM_READAHEAD_SECONDS,
+    STREAM_BROADCAST_WINDOW, STREAM_BROADCAST_MAX_BYTES, ZIP_MAX_FILES, ZIP_PREFETCH_FILES, ZIP_PREFETCH_BYTES,
+    INFO_BATCH_MAX_ITEMS,
+    PREFIX_CACHE_HEAD_BYTES, PREFIX_CACHE_TAIL_BYTES, PREFIX_CACHE_MAX_BYTES, PREFIX_CACHE_PATH,
+    CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_PATH, HOT_CHUNK_CACHE_BYTES, TG_PART_SIZE,
+    TEMP_MAX_BYTES, TEMP_MIN_FREE_BYTES, TEMP_MAX_AGE, TEMP_JANITOR_INTERVAL, TEMP_RECONCILE_INTERVAL,
+    FILE_OFFLOAD_MODE, FILE_OFFLOAD_PREFIX, API_DRAIN_FLAG, DOWNLOADER_INIT_TIMEOUT, API_PROCESS_COUNT,
+    TG_CONFIG_FILE
 )
-from config import TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH
+
+# Time every DB call made by the API
+(
+    get_file_by_link_code, get_files_by_link_codes, get_files_by_ids, get_file, add_file, create_file_link,
+    get_files_by_category, list_files, get_category, get_categories, create_category, delete_category,
+    full_userbase, del_user, present_user, get_catalog_version
+) = [metrics.track_db_call(func) for func in (
+    get_file_by_link_code, get_files_by_link_codes, get_files_by_ids, get_file, add_file, create_file_link,
+    get_files_by_category, list_files, get_category, get_categories, create_category, delete_category,
+    full_userbase, del_user, present_user, get_catalog_version
+)]
 
 # Create temp directory
 TEMP_DIR = Path(TEMP_PATH)
 TEMP_DIR.mkdir(exist_ok=True, parents=True)
 # APP_PATH = os.getenv("APP_PATH", "/app")
 
+# Fail at startup on an unknown mode rather than silently streaming everything from Python
+if FILE_OFFLOAD_MODE not in ("", "x-accel", "x-sendfile"):
+    raise ValueError(f"Unknown FILE_OFFLOAD_MODE: {FILE_OFFLOAD_MODE} (expected x-accel, x-sendfile or empty)")
+
+# Per-worker token buckets would multiply every request budget by the worker count
+if API_PROCESS_COUNT > 1 and RATE_LIMIT_BACKEND != "sqlite":
+    raise ValueError(f"API_WORKERS={API_PROCESS_COUNT} needs RATE_LIMIT_BACKEND=sqlite (got {RATE_LIMIT_BACKEND!r})")
+
+# Index-based temp cleanup (quota, free-space floor, max age)
+janitor = TempJanitor(
+    str(TEMP_DIR),
+    max_bytes=TEMP_MAX_BYTES,
+    min_free_bytes=TEMP_MIN_FREE_BYTES,
+    max_age=TEMP_MAX_AGE,
+    interval=TEMP_JANITOR_INTERVAL,
+    reconcile_interval=TEMP_RECONCILE_INTERVAL
+)
+
 app = FastAPI(title="UxB File Sharing API", version="2.0.0")
 
 # Add CORS middleware
@@ -41,24 +104,177 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for admin panel
+# Per-route request counts and latency, timed until the last body byte
+app.add_middleware(RequestMetricsMiddleware, registry=metrics)
+
+# Cap admin upload bodies on the raw receive stream (Content-Length or not)
+app.add_middleware(BodySizeLimitMiddleware, max_size=MAX_UPLOAD_SIZE, paths=["/api/admin/upload-file"])
+
+# Compress JSON API responses (brotli or gzip, by Accept-Encoding); file streams pass straight through
+app.add_middleware(JSONCompressionMiddleware, minimum_size=JSON_COMPRESS_MIN_SIZE)
+
+# Mount static files for admin panel (fingerprinted and precompressed at startup)
 try:
-    app.mount("/admin", StaticFiles(directory= APP_PATH + "/web_admin", html=True), name="admin")
+    mount_static_dir(app, "/admin", APP_PATH + "/web_admin", STATIC_BUILD_PATH, "admin")
 except:
     print("Warning: Could not mount admin static files")
 
 # Mount mini app static files
 try:
-    app.mount("/miniapp", StaticFiles(directory= APP_PATH + "/telegram_miniapp", html=True), name="miniapp")
+    mount_static_dir(app, "/miniapp", APP_PATH + "/telegram_miniapp", STATIC_BUILD_PATH, "miniapp")
 except:
     print("Warning: Could not mount miniapp static files")
 
-# Initialize Telegram Downloader
-try:
-    downloader = TelegramDownloader()
-except Exception as e:
-    print(f"Warning: Could not initialize TelegramDownloader: {e}")
-    downloader = None
+# Telegram Downloader: logged in by a startup task, so importing this module
+# (and /health) never waits on Telegram. Requests that need it await readiness.
+downloader: Optional[TelegramDownloader] = None
+downloader_state = "starting"   # starting | available | unavailable
+downloader_ready: Optional[asyncio.Task] = None
+# With several workers each one logs in from its own copy of the session
+worker_config: Optional[str] = None
+
+async def init_downloader() -> Optional[TelegramDownloader]:
+    global downloader, downloader_state, worker_config
+    started = time.perf_counter()
+    try:
+        if API_PROCESS_COUNT > 1:
+            worker_config = worker_session_config(TG_CONFIG_FILE)
+        instance = TelegramDownloader(config_file=worker_config, start=False)
+        await instance.astart()
+    except Exception as e:
+        print(f"Warning: Could not initialize TelegramDownloader: {e}")
+        downloader_state = "unavailable"
+        return None
+    downloader = instance
+    downloader_state = "available"
+    print(f"Telegram downloader ready in {time.perf_counter() - started:.2f}s")
+    return instance
+
+@app.on_event("startup")
+async def start_downloader():
+    global downloader_ready
+    downloader_ready = asyncio.get_event_loop().create_task(init_downloader())
+
+@app.on_event("shutdown")
+async def close_downloader():
+    if downloader is not None:
+        try:
+            await downloader.aclose()
+        except Exception as e:
+            print(f"Warning: Could not disconnect TelegramDownloader: {e}")
+    if worker_config is not None:
+        discard_worker_session(worker_config)
+
+async def require_downloader() -> TelegramDownloader:
+    """The ready downloader, waiting up to DOWNLOADER_INIT_TIMEOUT for login; 503 otherwise"""
+    if downloader is None and downloader_ready is not None and not downloader_ready.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(downloader_ready), DOWNLOADER_INIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+    if downloader is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Telegram downloader not available",
+            headers={"Retry-After": "5"} if downloader_state == "starting" else None
+        )
+    return downloader
+
+# Rate limiters for the public file endpoints; one store, so a request's IP and
+# link tokens are taken together or not at all
+rate_limit_store = create_bucket_store(RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, RATE_LIMIT_PRUNE_INTERVAL)
+ip_limiter = TokenBucketLimiter(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, rate_limit_store)
+link_limiter = TokenBucketLimiter(RATE_LIMIT_LINK_RATE, RATE_LIMIT_LINK_BURST, rate_limit_store)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def spend_rate_limits(charges: List[Tuple[TokenBucketLimiter, str, float]]):
+    """
+    Take tokens from every (limiter, key, cost) bucket, or from none of them;
+    429 with Retry-After when any bucket is short
+    """
+    waits = await check_all(charges)
+    retry_after = max(waits, default=0)
+    if retry_after > 0:
+        refused = next(key for (_, key, _), wait in zip(charges, waits) if wait > 0)
+        metrics.inc("uxb_rate_limited_total", scope=refused.split(":", 1)[0])
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+async def enforce_rate_limit(request: Request, link_code: str):
+    """Per-IP and per-link token buckets; 429 with Retry-After when empty"""
+    await enforce_batch_rate_limit(request, [link_code])
+
+async def enforce_batch_rate_limit(request: Request, link_codes: List[str]):
+    """
+    A request naming several links costs what requesting them one by one
+    would: one IP token per link, and a token from every link's bucket.
+    All buckets are checked before any is charged, so a refused request
+    spends nothing.
+    """
+    await spend_rate_limits(
+        [(ip_limiter, f"ip:{client_ip(request)}", len(link_codes))] +
+        [(link_limiter, f"link:{link_code}", 1) for link_code in link_codes]
+    )
+
+# Cap on concurrently served /stream and /download responses, with a bounded wait queue;
+# several workers share the cap through lock-file slots
+admission = AdmissionController(
+    STREAM_MAX_ACTIVE, STREAM_MAX_QUEUE, STREAM_QUEUE_TIMEOUT, STREAM_SESSION_WINDOW,
+    slots=SharedSlots.create(STREAM_SLOT_DIR, STREAM_MAX_ACTIVE) if API_PROCESS_COUNT > 1 else None
+)
+
+def stream_ticket(request: Request, link_code: str) -> AdmissionTicket:
+    """Admission ticket for this request; Range requests may continue an existing session"""
+    return admission.ticket(f"{client_ip(request)}:{link_code}", is_range="range" in request.headers)
+
+async def acquire_stream_slot(ticket: AdmissionTicket):
+    """Wait for a slot, or fail fast with 503 + Retry-After"""
+    try:
+        await ticket.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+# Byte-rate shaping for /stream responses; every worker gets an equal slice of the global ceiling
+bandwidth = BandwidthScheduler(global_rate=STREAM_GLOBAL_MAX_RATE / API_PROCESS_COUNT, per_stream_rate=STREAM_MAX_RATE)
+# Shared upstream fetches for concurrent viewers of the same file
+broadcasts = BroadcastHub(window=STREAM_BROADCAST_WINDOW, lead=STREAM_READAHEAD_MAX_BYTES,
+                          max_bytes=STREAM_BROADCAST_MAX_BYTES)
+# First/last bytes of streamed files, served before Telegram answers
+prefix_cache = PrefixCache(PREFIX_CACHE_PATH, PREFIX_CACHE_HEAD_BYTES, PREFIX_CACHE_TAIL_BYTES, PREFIX_CACHE_MAX_BYTES)
+
+# Aligned chunks of partially watched files (hot ones also in memory), evicted chunk by chunk
+chunk_cache = ChunkCache(CHUNK_CACHE_PATH, TG_PART_SIZE, CHUNK_CACHE_MAX_BYTES,
+                         hot=HotChunkLRU(HOT_CHUNK_CACHE_BYTES))
+
+def telegram_fetcher(chat_id, message_id):
+    """fetch(offset, length) over the parallel part fetcher, for the stream caches"""
+    def fetch(offset, length):
+        return downloader.stream_telegram_file_parallel(
+            chat_id, message_id, offset=offset, length=length
+        )
+    return fetch
+
+def cached_fetcher(chat_id, message_id, file_size: int):
+    """telegram_fetcher() behind the chunk cache: ranges are stitched from cached and fetched chunks"""
+    fetch = telegram_fetcher(chat_id, message_id)
+    
+    def cached_fetch(offset, length):
+        end = file_size - 1 if length is None else min(offset + length, file_size) - 1
+        return chunk_cache.stream(f"{chat_id}_{message_id}", fetch, offset, end, file_size)
+    return cached_fetch
 
 # Admin authentication middleware
 def verify_admin(user_id: int = 0):
@@ -67,6 +283,116 @@ def verify_admin(user_id: int = 0):
         raise HTTPException(status_code=403, detail="Access denied")
     return True
 
+# Cache-Control for catalog JSON: clients may keep it but must revalidate
+ADMIN_CACHE_CONTROL = "private, no-cache"
+INFO_CACHE_CONTROL = "public, no-cache"
+
+async def catalog_validators():
+    """Weak ETag and Last-Modified derived from the catalog version counter"""
+    meta = await get_catalog_version()
+    etag = f'W/"catalog-{meta["version"]}"'
+    last_modified = None
+    if meta['updated_at']:
+        last_modified = datetime.fromisoformat(meta['updated_at']).replace(tzinfo=timezone.utc)
+    return etag, last_modified
+
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-None-Match (weak comparison) and, only when it is absent,
+    If-Modified-Since against the current validators
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        opaque = etag[2:] if etag.startswith("W/") else etag
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+                return True
+        return False
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+# Shared HTTP session for URL ingestion; the connector enforces the
+# global and per-host connection limits for all concurrent fetches
+http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the pooled aiohttp session, creating it on first use"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=URL_FETCH_MAX_CONNECTIONS,
+            limit_per_host=URL_FETCH_MAX_PER_HOST
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=URL_FETCH_CONNECT_TIMEOUT,
+            sock_read=URL_FETCH_READ_TIMEOUT
+        )
+        http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return http_session
+
+@app.on_event("shutdown")
+async def close_http_session():
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+async def fetch_url_to_path(url: str, dest: Path) -> int:
+    """
+    Download url into dest without blocking the event loop.
+    Dropped connections are resumed with a Range request from the last
+    written byte, up to URL_FETCH_RETRIES times with exponential backoff.
+    Returns the number of bytes written.
+    """
+    session = get_http_session()
+    written = 0
+    attempt = 0
+    try:
+        async with aiofiles.open(dest, 'wb') as f:
+            while True:
+                headers = {"Range": f"bytes={written}-"} if written else {}
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        if written and response.status == 416:
+                            # Nothing left past our offset
+                            return written
+                        response.raise_for_status()
+                        if written and response.status != 206:
+                            # Server ignored the Range header, start over
+                            await f.seek(0)
+                            await f.truncate()
+                            written = 0
+                        async for chunk in response.content.iter_chunked(URL_FETCH_CHUNK_SIZE):
+                            written += len(chunk)
+                            if MAX_UPLOAD_SIZE > 0 and written > MAX_UPLOAD_SIZE:
+                                raise HTTPException(status_code=413, detail="File too large")
+                            await f.write(chunk)
+                        return written
+                except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    attempt += 1
+                    if attempt > URL_FETCH_RETRIES:
+                        raise
+                    await asyncio.sleep(min(2 ** attempt, 30))
+    except BaseException:
+        if dest.exists():
+            dest.unlink()
+        raise
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -149,13 +475,67 @@ async def get_recent_activities():
     return activities
 
 @app.get("/api/admin/files")
-async def get_admin_files():
-    """Get all files for admin management"""
+async def get_admin_files(
+    request: Request,
+    category: Optional[str] = None,
+    recursive: bool = False,
+    search: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
+    """
+    List files for admin management.
+    Filters by category (optionally its whole subtree), search text and
+    mime type; pages with an opaque cursor taken from next_cursor.
+    """
     try:
-        files = await get_files_by_category(None)
-        return files
+        etag, last_modified = await catalog_validators()
+        headers = cache_headers(etag, last_modified, ADMIN_CACHE_CONTROL)
+        if is_not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        
+        page = await list_files(
+            category_id=category or None,
+            recursive=recursive,
+            query=search,
+            mime_type=mime_type,
+            sort=sort,
+            descending=order.lower() != "asc",
+            cursor=cursor,
+            limit=limit
+        )
+        return JSONResponse(content=page, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/files/batch")
+async def get_admin_files_batch(file_ids: List[str] = Body(..., embed=True), admin: bool = Depends(verify_admin)):
+    """
+    Details and links for many files in one request. Items keep request
+    order with status ok or not_found; every link carries its own status
+    (ok, expired or limit_exceeded).
+    """
+    ids = batch_keys(file_ids)
+    try:
+        found = await get_files_by_ids(ids, with_links=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    items = []
+    for file_id in ids:
+        file_info = found.get(file_id)
+        if file_info is None:
+            items.append({"id": file_id, "status": "not_found"})
+            continue
+        for link in file_info['links']:
+            link['status'] = link_status(link)
+        items.append({"id": file_id, "status": "ok", "file": file_info})
+    return {"items": items}
 
 @app.delete("/api/admin/files/{file_id}")
 async def delete_admin_file(file_id: str, admin: bool = Depends(verify_admin)):
@@ -172,8 +552,8 @@ async def delete_admin_file(file_id: str, admin: bool = Depends(verify_admin)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/admin/files/{file_id}/links")
-async def generate_admin_links(file_id: str, admin: bool = Depends(verify_admin)):
-    """Generate download links for a file"""
+async def generate_admin_links(file_id: str, priority: int = 0, admin: bool = Depends(verify_admin)):
+    """Generate download links for a file (priority=1 for high-priority admin links)"""
     try:
         file_info = await get_file(file_id)
         if not file_info:
@@ -183,8 +563,16 @@ async def generate_admin_links(file_id: str, admin: bool = Depends(verify_admin)
         stream_code = str(uuid.uuid4())
         download_code = str(uuid.uuid4())
         
-        await create_file_link(file_id, "stream", stream_code)
-        await create_file_link(file_id, "download", download_code)
+        await create_file_link(file_id, "stream", stream_code, priority=priority)
+        await create_file_link(file_id, "download", download_code, priority=priority)
+        
+        # Warm the prefix cache so the first viewer does not wait on Telegram
+        if downloader and downloader.supports_ranges and file_info.get('file_size'):
+            prefix_cache.ensure(
+                f"{file_info['chat_id']}_{file_info['message_id']}",
+                telegram_fetcher(file_info['chat_id'], file_info['message_id']),
+                file_info['file_size']
+            )
         
         return {
             "stream_link": f"http://localhost:8000/stream/{stream_code}",
@@ -194,11 +582,16 @@ async def generate_admin_links(file_id: str, admin: bool = Depends(verify_admin)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin/categories")
-async def get_admin_categories():
+async def get_admin_categories(request: Request):
     """Get all categories"""
     try:
+        etag, last_modified = await catalog_validators()
+        headers = cache_headers(etag, last_modified, ADMIN_CACHE_CONTROL)
+        if is_not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        
         categories = await get_categories()
-        return categories
+        return JSONResponse(content=categories, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -256,24 +649,28 @@ async def delete_admin_user(user_id: int, admin: bool = Depends(verify_admin)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/admin/upload-file")
-async def upload_file_admin(
-    file: UploadFile = File(...),
-    category_id: Optional[str] = Form(None),
-    description: str = Form(""),
-    admin: bool = Depends(verify_admin)
-):
-    """Upload file via admin panel"""
+async def upload_file_admin(request: Request, admin: bool = Depends(verify_admin)):
+    """
+    Upload file via admin panel (multipart form: file, category_id, description).
+    The body is parsed as it arrives and the file part written straight to
+    TEMP_PATH in UPLOAD_CHUNK_SIZE pieces, with size and SHA-256 computed on the way.
+    """
     try:
-        # Save uploaded file temporarily
-        temp_path = TEMP_DIR / f"{uuid.uuid4()}_{file.filename}"
-        
-        async with aiofiles.open(temp_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        fields, upload = await receive_multipart_upload(
+            request,
+            lambda filename: TEMP_DIR / f"{uuid.uuid4()}_{Path(filename).name}",
+            max_size=MAX_UPLOAD_SIZE,
+            write_size=UPLOAD_CHUNK_SIZE
+        )
+        if upload is None:
+            raise HTTPException(status_code=400, detail="No file in upload")
+        temp_path = upload.path
+        file_size, sha256 = upload.size, upload.sha256.hexdigest()
+        category_id = fields.get("category_id") or None
+        description = fields.get("description", "")
         
         # Get file info
-        file_size = len(content)
-        mime_type = mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
+        mime_type = mimetypes.guess_type(upload.filename)[0] or 'application/octet-stream'
         
         # Upload to Telegram (simplified - you'd implement actual Telegram upload)
         message_id = 12345  # Mock message ID
@@ -281,8 +678,8 @@ async def upload_file_admin(
         
         # Add to database
         file_id = await add_file(
-            original_name=file.filename,
-            file_name=file.filename,
+            original_name=upload.filename,
+            file_name=upload.filename,
             message_id=message_id,
             chat_id=chat_id,
             file_size=file_size,
@@ -295,7 +692,14 @@ async def upload_file_admin(
         # Clean up temp file
         temp_path.unlink()
         
-        return {"id": file_id, "message": "File uploaded successfully"}
+        return {
+            "id": file_id,
+            "file_size": file_size,
+            "sha256": sha256,
+            "message": "File uploaded successfully"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -308,21 +712,14 @@ async def upload_url_admin(
 ):
     """Upload file from URL via admin panel"""
     try:
-        # Download file from URL
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
         # Extract filename from URL or generate one
-        filename = url.split('/')[-1] or f"file_{int(datetime.now().timestamp())}"
+        filename = unquote(Path(urlparse(url).path).name) or f"file_{int(datetime.now().timestamp())}"
         temp_path = TEMP_DIR / f"{uuid.uuid4()}_{filename}"
         
-        # Save downloaded file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        # Download file from URL
+        file_size = await fetch_url_to_path(url, temp_path)
         
         # Get file info
-        file_size = temp_path.stat().st_size
         mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
         
         # Upload to Telegram (simplified)
@@ -346,6 +743,8 @@ async def upload_url_admin(
         temp_path.unlink()
         
         return {"id": file_id, "message": "File uploaded from URL successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -363,125 +762,495 @@ async def get_admin_logs():
     except Exception as e:
         return f"Error reading logs: {str(e)}"
 
-@app.get("/stream/{link_code}")
-async def stream_file(link_code: str):
-    """
-    Stream file directly from Telegram without saving to server
-    This is the direct/stream download method
-    """
-    if not downloader:
-        raise HTTPException(status_code=503, detail="Telegram downloader not available")
-    
-    # Get file info from database
+def link_status(link: Dict[str, Any]) -> str:
+    """'expired', 'limit_exceeded' or 'ok' for a link row (expires_at, max_downloads, download_count)"""
+    if link['expires_at'] and datetime.now() > datetime.fromisoformat(str(link['expires_at'])):
+        return "expired"
+    if link['max_downloads'] > 0 and link['download_count'] >= link['max_downloads']:
+        return "limit_exceeded"
+    return "ok"
+
+async def get_usable_link(link_code: str) -> Dict[str, Any]:
+    """Look up a stream/download link and reject missing, expired or exhausted ones"""
     file_info = await get_file_by_link_code(link_code)
     if not file_info:
         raise HTTPException(status_code=404, detail="File not found or link expired")
     
-    # Check if link is expired
-    if file_info['expires_at']:
-        expires_at = datetime.fromisoformat(file_info['expires_at'])
-        if datetime.now() > expires_at:
-            raise HTTPException(status_code=410, detail="Download link has expired")
-    
-    # Check download limit
-    if file_info['max_downloads'] > 0 and file_info['download_count'] >= file_info['max_downloads']:
+    status = link_status(file_info)
+    if status == "expired":
+        raise HTTPException(status_code=410, detail="Download link has expired")
+    if status == "limit_exceeded":
         raise HTTPException(status_code=429, detail="Download limit exceeded")
+    return file_info
+
+def file_etag(file_info: Dict[str, Any]) -> str:
+    """Strong validator for a stored file's bytes (files never change in place)"""
+    return f'"{file_info["id"]}-{file_info["file_size"] or 0}"'
+
+def cached_temp_path(file_info: Dict[str, Any]) -> Path:
+    """Where /download keeps the server-side copy of a file (shared by all links to it)"""
+    return TEMP_DIR / f"{file_info['id']}_{file_info['original_name']}"
+
+def offload_response(path: Path, file_info: Dict[str, Any]) -> Optional[Response]:
+    """
+    Hand a cached temp file to the front proxy (FILE_OFFLOAD_MODE) instead of
+    streaming it from Python. The proxy serves the body, including Range
+    requests, so no Content-Length is sent from here. Returns None when disabled.
+    """
+    if FILE_OFFLOAD_MODE == "x-accel":
+        relative = path.relative_to(TEMP_DIR).as_posix()
+        header = ("X-Accel-Redirect", FILE_OFFLOAD_PREFIX.rstrip("/") + "/" + quote(relative))
+    elif FILE_OFFLOAD_MODE == "x-sendfile":
+        header = ("X-Sendfile", str(path.resolve()))
+    else:
+        return None
+    
+    try:
+        modified = path.stat().st_mtime
+    except OSError:
+        return None
+    janitor.touch(path)
+    response = Response(
+        media_type=file_info['mime_type'] or 'application/octet-stream',
+        headers={
+            header[0]: header[1],
+            "Content-Disposition": attachment_disposition(file_info['original_name']),
+            "Accept-Ranges": "bytes",
+            "ETag": file_etag(file_info),
+            "Last-Modified": format_datetime(datetime.fromtimestamp(modified, timezone.utc), usegmt=True),
+        }
+    )
+    # The body comes from the proxy; a Content-Length: 0 here would truncate it
+    del response.headers["content-length"]
+    return response
+
+def attachment_disposition(filename: str) -> str:
+    """Content-Disposition for a download, RFC 5987-encoded when the name is not plain ASCII"""
+    quoted_name = quote(filename)
+    if quoted_name != filename:
+        return f"attachment; filename*=utf-8''{quoted_name}"
+    return f'attachment; filename="{filename}"'
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single 'bytes=' range into inclusive (start, end).
+    Returns None to serve the whole file (no header, multi-range or
+    unparsable); raises 416 when the range lies outside the file.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, min(end, file_size - 1)
+
+async def fetch_telegram_file_to_path(chat_id, message_id, dest: Path) -> int:
+    """Write a Telegram file to dest using the parallel part fetcher"""
+    written = 0
+    async with aiofiles.open(dest, 'wb') as f:
+        async for chunk in downloader.stream_telegram_file_parallel(chat_id, message_id):
+            await f.write(chunk)
+            written += len(chunk)
+    return written
+
+@app.get("/stream/{link_code}", dependencies=[Depends(enforce_rate_limit)])
+async def stream_file(link_code: str, request: Request):
+    """
+    Stream file directly from Telegram without saving to server
+    This is the direct/stream download method (supports single byte ranges)
+    """
+    request_start = time.perf_counter()
+    await require_downloader()
+    
+    # Get file info from database (404/410/429 for unusable links)
+    file_info = await get_usable_link(link_code)
     
+    ticket = stream_ticket(request, link_code)
     try:
         # Get file stream from Telegram
         chat_id = file_info['chat_id']
         message_id = file_info['message_id']
         
+        # Already on disk from /download: let the front proxy send it
+        if FILE_OFFLOAD_MODE:
+            offloaded = offload_response(cached_temp_path(file_info), file_info)
+            if offloaded is not None:
+                return offloaded
+        
+        # Held until the response finishes (released by the response's on_close)
+        await acquire_stream_slot(ticket)
+        
+        file_size = file_info['file_size'] or 0
+        
+        # Resolve the requested byte range (only when parts can be fetched by offset)
+        can_seek = downloader.supports_ranges and file_size > 0
+        byte_range = parse_range_header(request.headers.get("range"), file_size) if can_seek else None
+        start, end = byte_range if byte_range else (0, file_size - 1)
+        
         # Create streaming generator
+        weight = STREAM_PRIORITY_WEIGHT if file_info.get('priority') else 1.0
+        
+        sent = [0]
+        
         async def file_stream():
+            first_chunk = True
+            metrics.add_gauge("uxb_active_streams", 1, route="stream")
             try:
-                async for chunk in downloader.stream_telegram_file(chat_id, message_id):
-                    yield chunk
+                with metrics.track_inflight("uxb_downloader_inflight", operation="stream"), \
+                        bandwidth.open(weight) as share:
+                    fetch = cached_fetcher(chat_id, message_id, file_size) if can_seek \
+                        else telegram_fetcher(chat_id, message_id)
+                    
+                    # Cached head/tail bytes go out first while Telegram catches up
+                    prefix = b""
+                    if can_seek:
+                        cache_key = f"{chat_id}_{message_id}"
+                        prefix = await prefix_cache.read(cache_key, start, end, file_size)
+                        prefix_cache.ensure(cache_key, fetch, file_size)
+                    rest = start + len(prefix)
+                    
+                    # An unknown size (0) leaves end at -1: stream until the upstream ends
+                    if file_size > 0 and rest > end:
+                        upstream = None
+                    elif can_seek and STREAM_BROADCAST_WINDOW > 0:
+                        upstream = broadcasts.stream((chat_id, message_id), fetch, rest, end, file_size)
+                    else:
+                        upstream = fetch(rest, (end - rest + 1) if can_seek else None)
+                    source = None
+                    if upstream is not None:
+                        source = ReadAheadBuffer(
+                            upstream,
+                            min_bytes=STREAM_READAHEAD_MIN_BYTES,
+                            max_bytes=STREAM_READAHEAD_MAX_BYTES,
+                            horizon=STREAM_READAHEAD_SECONDS
+                        )
+                        source.start()
+                    
+                    async def chunks():
+                        if prefix:
+                            yield prefix
+                        if source is not None:
+                            async for chunk in source:
+                                yield chunk
+                    
+                    try:
+                        async for chunk in chunks():
+                            if first_chunk:
+                                metrics.observe("uxb_time_to_first_byte_seconds",
+                                                time.perf_counter() - request_start, route="stream")
+                                first_chunk = False
+                            metrics.inc("uxb_stream_bytes_total", len(chunk), route="stream")
+                            yield chunk
+                            sent[0] += len(chunk)
+                            await share.throttle(len(chunk))
+                    finally:
+                        if source is not None:
+                            await source.aclose()
             except Exception as e:
-                print(f"Streaming error: {e}")
-                raise HTTPException(status_code=500, detail="Error streaming file")
+                # The status line is already out, so there is no error response to send.
+                # Re-raising makes the server abort the connection; ending the body
+                # quietly would let a truncated chunked response pass as complete.
+                print(f"Streaming error after {sent[0]} bytes: {e}")
+                raise
+            finally:
+                metrics.add_gauge("uxb_active_streams", -1, route="stream")
         
         # Set appropriate headers
         headers = {
-            'Content-Disposition': f'attachment; filename="{file_info["original_name"]}"',
+            'Content-Disposition': attachment_disposition(file_info['original_name']),
             'Content-Type': file_info['mime_type'] or 'application/octet-stream',
         }
         
-        if file_info['file_size'] > 0:
-            headers['Content-Length'] = str(file_info['file_size'])
+        headers['Accept-Ranges'] = 'bytes' if can_seek else 'none'
+        headers['ETag'] = file_etag(file_info)
+        if file_size > 0:
+            headers['Content-Length'] = str(end - start + 1)
+        if byte_range:
+            headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
         
-        return StreamingResponse(
+        def record_abort():
+            metrics.inc("uxb_stream_aborted_total", route="stream")
+            if file_size > 0:
+                metrics.inc("uxb_stream_aborted_bytes_total", max(end - start + 1 - sent[0], 0), route="stream")
+        
+        return CancellableStreamingResponse(
             file_stream(),
+            on_disconnect=record_abort,
+            on_close=ticket.release,
+            status_code=206 if byte_range else 200,
             media_type=file_info['mime_type'] or 'application/octet-stream',
             headers=headers
         )
         
+    except HTTPException:
+        ticket.release()
+        raise
     except Exception as e:
+        ticket.release()
         print(f"Stream error: {e}")
         raise HTTPException(status_code=500, detail="Error streaming file from Telegram")
 
-@app.get("/download/{link_code}")
-async def download_file(link_code: str):
+@app.get("/download/{link_code}", dependencies=[Depends(enforce_rate_limit)])
+async def download_file(link_code: str, request: Request):
     """
     Download file by first saving to server then serving
     This is the indirect download method
     """
-    if not downloader:
-        raise HTTPException(status_code=503, detail="Telegram downloader not available")
-    
-    # Get file info from database
-    file_info = await get_file_by_link_code(link_code)
-    if not file_info:
-        raise HTTPException(status_code=404, detail="File not found or link expired")
+    request_start = time.perf_counter()
+    await require_downloader()
     
-    # Check if link is expired
-    if file_info['expires_at']:
-        expires_at = datetime.fromisoformat(file_info['expires_at'])
-        if datetime.now() > expires_at:
-            raise HTTPException(status_code=410, detail="Download link has expired")
-    
-    # Check download limit
-    if file_info['max_downloads'] > 0 and file_info['download_count'] >= file_info['max_downloads']:
-        raise HTTPException(status_code=429, detail="Download limit exceeded")
+    # Get file info from database (404/410/429 for unusable links)
+    file_info = await get_usable_link(link_code)
     
+    ticket = stream_ticket(request, link_code)
     try:
         # Download file to temporary location
         chat_id = file_info['chat_id']
         message_id = file_info['message_id']
         
         # Create unique temp file path
-        temp_filename = f"{link_code}_{file_info['original_name']}"
-        temp_path = TEMP_DIR / temp_filename
+        temp_path = cached_temp_path(file_info)
+        temp_filename = temp_path.name
+        
+        # Proxy-served cache hits need no slot; everything else holds one until sent
+        if not (FILE_OFFLOAD_MODE and temp_path.exists()):
+            await acquire_stream_slot(ticket)
         
         # Check if file already exists in temp
         if not temp_path.exists():
-            # Download from Telegram
-            download_results = downloader.download_by_message_ids(
-                entity=chat_id,
-                message_ids=[message_id],
-                output_dir=str(TEMP_DIR),
-                overwrite=True
-            )
-            
-            if not download_results or "error" in download_results[0]:
-                raise HTTPException(status_code=500, detail="Failed to download file from Telegram")
+            metrics.inc("uxb_cache_requests_total", result="miss")
+            # Download from Telegram into a private staging dir, then move into place
+            staging_dir = TEMP_DIR / f".partial-{uuid.uuid4()}"
+            try:
+                with metrics.track_inflight("uxb_downloader_inflight", operation="download"):
+                    if downloader.supports_ranges:
+                        # Parallel aligned parts, without blocking the event loop
+                        staging_dir.mkdir(parents=True, exist_ok=True)
+                        staging_path = staging_dir / temp_filename
+                        await fetch_telegram_file_to_path(chat_id, message_id, staging_path)
+                        result = {"success": True, "local_path": str(staging_path)}
+                    else:
+                        download_results = downloader.download_by_message_ids(
+                            entity=chat_id,
+                            message_ids=[message_id],
+                            output_dir=str(staging_dir),
+                            overwrite=True
+                        )
+                        result = json.loads(download_results[0]) if download_results else {}
+                
+                if not result.get("success") or not result.get("local_path"):
+                    raise HTTPException(status_code=500, detail="Failed to download file from Telegram")
+                janitor.install(result["local_path"], temp_path)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        else:
+            metrics.inc("uxb_cache_requests_total", result="hit")
         
-        # Serve the downloaded file
+        # Serve the downloaded file (pinned so the janitor leaves it alone meanwhile)
         if temp_path.exists():
-            return FileResponse(
+            metrics.observe("uxb_time_to_first_byte_seconds", time.perf_counter() - request_start, route="download")
+            offloaded = offload_response(temp_path, file_info)
+            if offloaded is not None:
+                ticket.release()
+                return offloaded
+            if "range" not in request.headers:
+                metrics.inc("uxb_stream_bytes_total", temp_path.stat().st_size, route="download")
+            return PinnedFileResponse(
                 path=str(temp_path),
+                janitor=janitor,
+                on_close=ticket.release,
                 filename=file_info['original_name'],
-                media_type=file_info['mime_type'] or 'application/octet-stream'
+                media_type=file_info['mime_type'] or 'application/octet-stream',
+                headers={'ETag': file_etag(file_info)}
             )
         else:
             raise HTTPException(status_code=500, detail="File download failed")
             
+    except HTTPException:
+        ticket.release()
+        raise
     except Exception as e:
+        ticket.release()
         print(f"Download error: {e}")
         raise HTTPException(status_code=500, detail="Error downloading file")
 
-@app.get("/info/{link_code}")
-async def get_file_info(link_code: str):
+@app.head("/stream/{link_code}", dependencies=[Depends(enforce_rate_limit)])
+@app.head("/download/{link_code}", dependencies=[Depends(enforce_rate_limit)])
+async def head_file(link_code: str, request: Request):
+    """
+    Metadata-only answer for download managers and link previewers.
+    Uses the database and the temp cache only; Telegram is never contacted.
+    """
+    file_info = await get_usable_link(link_code)
+    media_type = file_info['mime_type'] or 'application/octet-stream'
+    file_size = file_info['file_size'] or 0
+    
+    if request.url.path.startswith("/download/"):
+        # /download is served from disk (or the front proxy), which handles ranges
+        accept_ranges = 'bytes'
+        temp_path = cached_temp_path(file_info)
+        try:
+            file_size = temp_path.stat().st_size
+        except OSError:
+            pass
+    else:
+        accept_ranges = 'bytes' if downloader and downloader.supports_ranges and file_size > 0 else 'none'
+    
+    headers = {
+        'Content-Type': media_type,
+        'Content-Disposition': attachment_disposition(file_info['original_name']),
+        'Accept-Ranges': accept_ranges,
+        'ETag': file_etag(file_info),
+    }
+    if file_size > 0:
+        headers['Content-Length'] = str(file_size)
+    return Response(status_code=200, headers=headers)
+
+def zip_member(file_info: Dict[str, Any], name: str) -> ZipMember:
+    """
+    Archive entry fed straight from Telegram. The chunk cache is bypassed on
+    purpose: a whole-category archive would otherwise evict the chunks of
+    files people are actually watching.
+    """
+    chat_id = file_info['chat_id']
+    message_id = file_info['message_id']
+    try:
+        modified = datetime.fromisoformat(file_info['created_at']) if file_info.get('created_at') else None
+    except (TypeError, ValueError):
+        modified = None
+    return ZipMember(
+        name,
+        file_info['file_size'] or None,
+        lambda: telegram_fetcher(chat_id, message_id)(0, None),
+        modified=modified
+    )
+
+async def zip_response(request: Request, files: List[Dict[str, Any]], names: List[str],
+                       archive_name: str, session: str) -> Response:
+    """
+    Stream files as one stored (uncompressed) ZIP, member after member.
+    Content-Length is exact when every file size is known; the next
+    ZIP_PREFETCH_FILES members download while the current one is sent.
+    """
+    if not files:
+        raise HTTPException(status_code=404, detail="No files to archive")
+    if len(files) > ZIP_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files for one archive (max {ZIP_MAX_FILES})")
+    await require_downloader()
+    
+    members = [zip_member(file_info, name) for file_info, name in zip(files, unique_names(names))]
+    archive_size = plan_archive(members)
+    
+    ticket = admission.ticket(f"{client_ip(request)}:zip:{session}", is_range=False)
+    await acquire_stream_slot(ticket)
+    try:
+        request_start = time.perf_counter()
+        sent = [0]
+        
+        async def archive_stream():
+            first_chunk = True
+            metrics.add_gauge("uxb_active_streams", 1, route="zip")
+            try:
+                with metrics.track_inflight("uxb_downloader_inflight", operation="zip"), \
+                        bandwidth.open() as share:
+                    async for chunk in stream_zip(members, prefetch=ZIP_PREFETCH_FILES,
+                                                  buffer_bytes=ZIP_PREFETCH_BYTES):
+                        if first_chunk:
+                            metrics.observe("uxb_time_to_first_byte_seconds",
+                                            time.perf_counter() - request_start, route="zip")
+                            first_chunk = False
+                        metrics.inc("uxb_stream_bytes_total", len(chunk), route="zip")
+                        yield chunk
+                        sent[0] += len(chunk)
+                        await share.throttle(len(chunk))
+            except Exception as e:
+                # Headers are already out: the client sees a truncated archive
+                print(f"ZIP streaming error: {e}")
+                raise
+            finally:
+                metrics.add_gauge("uxb_active_streams", -1, route="zip")
+        
+        headers = {'Content-Disposition': attachment_disposition(archive_name), 'Accept-Ranges': 'none'}
+        if archive_size is not None:
+            headers['Content-Length'] = str(archive_size)
+        
+        def record_abort():
+            metrics.inc("uxb_stream_aborted_total", route="zip")
+            if archive_size is not None:
+                metrics.inc("uxb_stream_aborted_bytes_total", max(archive_size - sent[0], 0), route="zip")
+        
+        return CancellableStreamingResponse(
+            archive_stream(),
+            on_disconnect=record_abort,
+            on_close=ticket.release,
+            media_type="application/zip",
+            headers=headers
+        )
+    except Exception:
+        ticket.release()
+        raise
+
+@app.get("/api/admin/categories/{category_id}/zip")
+async def download_category_zip(category_id: str, request: Request, admin: bool = Depends(verify_admin)):
+    """Download every file in a category and its subcategories as one ZIP"""
+    category = await get_category(category_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    
+    files: List[Dict[str, Any]] = []
+    cursor = None
+    while True:
+        page = await list_files(category_id=category_id, recursive=True, sort="name",
+                                descending=False, cursor=cursor, limit=200)
+        files.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor or len(files) > ZIP_MAX_FILES:
+            break
+    
+    # Files from subcategories go into a folder named after their category
+    names = [
+        member_name(file_info['original_name']) if file_info['category_id'] == category_id
+        else member_name(file_info.get('category_name') or file_info['category_id'], file_info['original_name'])
+        for file_info in files
+    ]
+    return await zip_response(request, files, names, f"{member_name(category['name'])}.zip", f"category:{category_id}")
+
+@app.get("/zip")
+async def download_links_zip(request: Request, codes: str = Query(..., description="Comma-separated link codes")):
+    """Download the files behind a batch of stream/download links as one ZIP"""
+    link_codes = list(dict.fromkeys(code.strip() for code in codes.split(",") if code.strip()))
+    if len(link_codes) > ZIP_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files for one archive (max {ZIP_MAX_FILES})")
+    await enforce_batch_rate_limit(request, link_codes)
+    batch_key = hashlib.sha1(",".join(sorted(link_codes)).encode()).hexdigest()[:16]
+    
+    # Every link must be usable (404/410/429 otherwise); the same file is archived once
+    files = {}
+    for link_code in link_codes:
+        file_info = await get_usable_link(link_code)
+        files.setdefault(file_info['id'], file_info)
+    files = list(files.values())
+    return await zip_response(request, files, [member_name(f['original_name']) for f in files],
+                              f"files-{batch_key[:8]}.zip", f"batch:{batch_key}")
+
+@app.get("/info/{link_code}", dependencies=[Depends(enforce_rate_limit)])
+async def get_file_info(link_code: str, request: Request):
     """
     Get file information without downloading
     """
@@ -490,11 +1259,18 @@ async def get_file_info(link_code: str):
         raise HTTPException(status_code=404, detail="File not found or link expired")
     
     # Check if link is expired
-    if file_info['expires_at']:
-        expires_at = datetime.fromisoformat(file_info['expires_at'])
-        if datetime.now() > expires_at:
-            raise HTTPException(status_code=410, detail="Download link has expired")
+    if link_status(file_info) == "expired":
+        raise HTTPException(status_code=410, detail="Download link has expired")
+    
+    etag, last_modified = await catalog_validators()
+    headers = cache_headers(etag, last_modified, INFO_CACHE_CONTROL)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
     
+    return JSONResponse(content=link_info(file_info), headers=headers)
+
+def link_info(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Public metadata of a link's file, as returned by /info"""
     return {
         "file_name": file_info['original_name'],
         "file_size": file_info['file_size'],
@@ -506,46 +1282,125 @@ async def get_file_info(link_code: str):
         "link_type": file_info['link_type']
     }
 
+def batch_keys(keys: List[str]) -> List[str]:
+    """De-duplicated keys in request order; 400 past INFO_BATCH_MAX_ITEMS"""
+    keys = list(dict.fromkeys(key.strip() for key in keys if key and key.strip()))
+    if len(keys) > INFO_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {INFO_BATCH_MAX_ITEMS})")
+    return keys
+
+@app.post("/info/batch")
+async def get_file_info_batch(request: Request, link_codes: List[str] = Body(..., embed=True)):
+    """
+    /info for many links in one request (one database query).
+    Each item has a status: ok, limit_exceeded, expired or not_found;
+    file metadata is included for the first two, as /info would return it.
+    """
+    codes = batch_keys(link_codes)
+    await enforce_batch_rate_limit(request, codes)
+    
+    found = await get_files_by_link_codes(codes)
+    items = []
+    for code in codes:
+        file_info = found.get(code)
+        if file_info is None:
+            items.append({"link_code": code, "status": "not_found"})
+            continue
+        status = link_status(file_info)
+        item = {"link_code": code, "status": status}
+        if status != "expired":
+            item["file"] = link_info(file_info)
+        items.append(item)
+    return JSONResponse(content={"items": items}, headers={"Cache-Control": "no-store"})
+
 @app.delete("/temp/{filename}")
 async def cleanup_temp_file(filename: str):
     """
     Clean up temporary files (admin only)
     """
-    temp_path = TEMP_DIR / filename
-    if temp_path.exists():
-        temp_path.unlink()
-        return {"message": "File deleted successfully"}
-    else:
+    temp_path = TEMP_DIR / Path(filename).name
+    if not temp_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
+    if not janitor.delete(temp_path):
+        raise HTTPException(status_code=409, detail="File is currently being served")
+    return {"message": "File deleted successfully"}
 
 @app.get("/temp/cleanup")
 async def cleanup_old_temp_files(max_age_hours: int = 24):
     """
-    Clean up old temporary files
+    Clean up temporary files not used for max_age_hours. Walks the janitor's
+    LRU index, which only knows other workers' files as of its last reconcile
+    scan (every TEMP_RECONCILE_INTERVAL seconds)
     """
-    import time
-    current_time = time.time()
-    deleted_count = 0
-    
-    for temp_file in TEMP_DIR.iterdir():
-        if temp_file.is_file():
-            file_age = current_time - temp_file.stat().st_mtime
-            if file_age > (max_age_hours * 3600):  # Convert hours to seconds
-                temp_file.unlink()
-                deleted_count += 1
-    
-    return {"message": f"Deleted {deleted_count} old temporary files"}
+    deleted_count = janitor.evict_older_than(max_age_hours * 3600)
+    return {"message": f"Deleted {deleted_count} old temporary files", "temp": janitor.stats()}
+
+@app.on_event("startup")
+async def start_temp_janitor():
+    janitor.reconcile()
+    loop = asyncio.get_event_loop()
+    loop.create_task(janitor.run())
+    # The stream caches reconciled when they were created; keep them reconciling
+    for cache in (prefix_cache, chunk_cache):
+        if cache.enabled:
+            loop.create_task(cache.janitor.run())
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics, merged across all workers"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_metrics_flusher():
+    async def flush_loop():
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            metrics.flush()
+    asyncio.get_event_loop().create_task(flush_loop())
+
+@app.on_event("shutdown")
+async def flush_metrics_on_shutdown():
+    # Counters and cache statistics of this worker; the cache indexes themselves
+    # are rebuilt from disk by the next start
+    metrics.flush()
+
+@app.on_event("startup")
+async def watch_drain_flag():
+    """Enter drain mode when the launcher creates API_DRAIN_FLAG (checked every second)"""
+    async def watch_loop():
+        while True:
+            draining = os.path.exists(API_DRAIN_FLAG)
+            if draining != admission.draining:
+                admission.set_draining(draining)
+                print("🚰 Draining: refusing new streams" if draining else "Drain cancelled")
+            if draining:
+                # Keep the merged active-stream count that /health reports fresh
+                metrics.flush()
+            await asyncio.sleep(1)
+    asyncio.get_event_loop().create_task(watch_loop())
+
+def active_streams_total() -> int:
+    """Admitted streams across all workers (from the metrics snapshots)"""
+    gauges = metrics.collect()["gauges"].get("uxb_admission_active", {})
+    return int(sum(gauges.values()))
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (503 while draining so load balancers move traffic away)"""
+    if admission.draining:
+        return JSONResponse(status_code=503, content={
+            "status": "draining",
+            "timestamp": datetime.now().isoformat(),
+            "active_streams": active_streams_total()
+        })
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "telegram_downloader": "available" if downloader else "unavailable"
+        "telegram_downloader": downloader_state
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    from config import API_HOST, API_PORT
+    uvicorn.run("api_server:app", host=API_HOST, port=API_PORT, workers=API_PROCESS_COUNT)
\ No newline at end of file
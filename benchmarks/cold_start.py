@@ -0,0 +1,97 @@
+"""
+Cold-start latency of the API server
+Starts `uvicorn api_server:app` in a fresh process --runs times and
+measures, from the moment the process is spawned, how long it takes
+until /health answers and until the first byte of --url (e.g. a
+/stream/<link_code>) arrives. Run from the repository root with the
+same environment the server uses in production:
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --url /stream/<link_code> --workers 1
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_env(workers: int = 1) -> dict:
+    """The caller's environment for `workers` API processes, with the bot log kept out of the repository"""
+    env = dict(os.environ)
+    env.setdefault("LOG_FILE_NAME", os.path.join(tempfile.gettempdir(), "uxb-benchmark.log"))
+    env["API_WORKERS"] = str(workers)
+    if workers > 1:
+        # The API refuses several workers with per-process request budgets
+        env["RATE_LIMIT_BACKEND"] = "sqlite"
+    return env
+
+
+def first_byte(url: str, timeout: float) -> bool:
+    """True once the server answered url with any status and sent a body byte (or an empty body)"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            resp.read(1)
+        return True
+    except urllib.error.HTTPError as e:
+        # 503 while the downloader logs in still counts as "not ready" for file URLs
+        return e.code != 503
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def wait_for(url: str, started: float, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        if first_byte(url, timeout=max(0.1, deadline - time.perf_counter())):
+            return time.perf_counter() - started
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def run_once(args) -> dict:
+    command = [sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1",
+               "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=server_env(args.workers),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + args.timeout
+        base = f"http://127.0.0.1:{args.port}"
+        result = {"health": wait_for(base + "/health", started, deadline)}
+        if args.url:
+            result["url"] = wait_for(base + args.url, started, deadline)
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--url", help="path whose first byte is timed as well, e.g. /stream/<code>")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    results = [run_once(args) for _ in range(args.runs)]
+    for key, label in (("health", "/health"), ("url", args.url)):
+        values = [r[key] for r in results if key in r]
+        if values:
+            print(f"{label}: median {statistics.median(values) * 1000:.0f} ms  "
+                  f"min {min(values) * 1000:.0f} ms  max {max(values) * 1000:.0f} ms  ({len(values)} runs)")
+
+
+if __name__ == "__main__":
+    main()
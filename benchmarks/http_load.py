@@ -0,0 +1,94 @@
+"""
+HTTP load generator for comparing API server configurations
+Sends --requests GET requests to URL with --concurrency in flight and
+reports throughput plus time-to-first-byte and total-time percentiles.
+Run it once per configuration against the same URL and compare, e.g.
+
+    API_WORKERS=1 ...                      (restart the server)
+    python benchmarks/http_load.py http://127.0.0.1:8000/info/<code> -c 64 -n 5000
+    API_WORKERS=4 RATE_LIMIT_BACKEND=sqlite ...   (restart the server)
+    python benchmarks/http_load.py http://127.0.0.1:8000/info/<code> -c 64 -n 5000
+
+Disable or raise RATE_LIMIT_* for the run, or the server answers 429.
+benchmarks/workers.py does both runs, starting the server itself.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from typing import List
+
+import aiohttp
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(url: str, requests: int, concurrency: int, headers: dict, read_size: int) -> dict:
+    """Run the load, print the report and return its headline numbers"""
+    ttfb: List[float] = []
+    total: List[float] = []
+    statuses: Counter = Counter()
+    received = 0
+    pending = iter(range(requests))
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal received
+        for _ in pending:
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers) as resp:
+                    first = True
+                    async for chunk in resp.content.iter_chunked(read_size):
+                        if first:
+                            ttfb.append(time.perf_counter() - started)
+                            first = False
+                        received += len(chunk)
+                    if first:
+                        ttfb.append(time.perf_counter() - started)
+                    statuses[resp.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            total.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    done = len(total)
+    print(f"{url}")
+    print(f"  requests: {done}/{requests} in {elapsed:.2f}s  ({done / elapsed:.1f} req/s, "
+          f"{received / elapsed / 1024 / 1024:.2f} MB/s)")
+    print(f"  status:   {dict(statuses)}")
+    for name, values in (("ttfb", ttfb), ("total", total)):
+        print(f"  {name:<6}    p50 {percentile(values, 50) * 1000:.1f} ms  "
+              f"p95 {percentile(values, 95) * 1000:.1f} ms  p99 {percentile(values, 99) * 1000:.1f} ms  "
+              f"max {max(values, default=0) * 1000:.1f} ms")
+    return {"rps": done / elapsed, "mbps": received / elapsed / 1024 / 1024, "statuses": dict(statuses),
+            "ttfb_p50": percentile(ttfb, 50), "ttfb_p99": percentile(ttfb, 99),
+            "total_p50": percentile(total, 50), "total_p99": percentile(total, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-H", "--header", action="append", default=[], help="'Name: value', repeatable")
+    parser.add_argument("--read-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+    headers = dict(h.split(":", 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+    asyncio.run(run(args.url, args.requests, args.concurrency, headers, args.read_size))
+
+
+if __name__ == "__main__":
+    main()
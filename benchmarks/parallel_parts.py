@@ -0,0 +1,80 @@
+"""
+Sequential vs parallel Telegram part fetches
+Reads the same byte range with iter_parts_in_order() at each requested
+parallelism and reports throughput and time to first byte. By default
+the upstream is simulated (fixed per-request latency plus a per-request
+transfer rate, like one Telegram getFile call); pass --chat and
+--message-id to read a real file through TelegramDownloader instead.
+
+    python benchmarks/parallel_parts.py --parallelism 1 2 4 8
+    python benchmarks/parallel_parts.py --chat -100123 --message-id 42 --size 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing config starts the bot log; keep benchmark runs from writing into the repo
+os.environ.setdefault("LOG_FILE_NAME", os.path.join(tempfile.gettempdir(), "uxb-benchmark.log"))
+
+from telegram_downloader_integration import TG_PART_SIZE, iter_parts_in_order  # noqa: E402
+
+
+def simulated_fetch(latency: float, rate: float):
+    async def fetch_part(offset: int, size: int) -> bytes:
+        await asyncio.sleep(latency + size / rate)
+        return bytes(size)
+    return fetch_part
+
+
+async def real_fetch(chat: str, message_id: int):
+    from telegram_downloader_integration import TelegramDownloader
+    downloader = TelegramDownloader(start=False)
+    await downloader.astart()
+    size = await downloader.get_file_size(chat, message_id)
+
+    async def fetch_part(offset: int, part_size: int) -> bytes:
+        return await downloader.fetch_part(chat, message_id, offset, part_size)
+    return fetch_part, size
+
+
+async def measure(fetch_part, length: int, part_size: int, parallelism: int):
+    started = time.perf_counter()
+    ttfb = None
+    received = 0
+    async for chunk in iter_parts_in_order(fetch_part, 0, length, part_size, parallelism):
+        if ttfb is None:
+            ttfb = time.perf_counter() - started
+        received += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"  parallelism {parallelism:>2}: {received / elapsed / 1024 / 1024:7.2f} MB/s  "
+          f"ttfb {ttfb * 1000:7.1f} ms  total {elapsed:6.2f} s")
+
+
+async def main(args):
+    length = args.size * 1024 * 1024
+    if args.chat:
+        fetch_part, file_size = await real_fetch(args.chat, args.message_id)
+        length = min(length, file_size)
+        print(f"message {args.message_id} in {args.chat}: {length} bytes, part size {args.part_size}")
+    else:
+        fetch_part = simulated_fetch(args.latency / 1000, args.rate * 1024 * 1024)
+        print(f"simulated: {args.latency:.0f} ms per request, {args.rate:.1f} MB/s per request, "
+              f"{length} bytes, part size {args.part_size}")
+    for parallelism in args.parallelism:
+        await measure(fetch_part, length, args.part_size, parallelism)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--size", type=int, default=32, help="MB to read")
+    parser.add_argument("--part-size", type=int, default=TG_PART_SIZE)
+    parser.add_argument("--latency", type=float, default=80, help="simulated ms per request")
+    parser.add_argument("--rate", type=float, default=8, help="simulated MB/s per request")
+    parser.add_argument("--chat")
+    parser.add_argument("--message-id", type=int)
+    asyncio.run(main(parser.parse_args()))
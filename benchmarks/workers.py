@@ -0,0 +1,70 @@
+"""
+Throughput of one API worker against N workers
+Starts `uvicorn api_server:app` once with a single worker and once with
+--workers N (RATE_LIMIT_BACKEND=sqlite, as the server requires), drives
+the same load against --path on each with http_load, and prints both
+reports plus the N-worker / 1-worker ratio. Rate limits are disabled for
+the runs. Run from the repository root with the production environment:
+
+    python benchmarks/workers.py --workers 4 --path /info/<link_code> -c 64 -n 5000
+    python benchmarks/workers.py --workers 4 --path /stream/<link_code> -c 16 -n 200
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cold_start import ROOT, server_env, wait_for  # noqa: E402
+from http_load import run  # noqa: E402
+
+
+def benchmark(args, workers: int) -> dict:
+    env = server_env(workers)
+    env["RATE_LIMIT_IP_RATE"] = "0"
+    env["RATE_LIMIT_LINK_RATE"] = "0"
+    command = [sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1",
+               "--port", str(args.port), "--workers", str(workers), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        wait_for(base + "/health", started, started + args.timeout)
+        # Every worker has to be accepting before the clock starts
+        time.sleep(args.warmup)
+        print(f"--- {workers} worker(s)")
+        return asyncio.run(run(base + args.path, args.requests, args.concurrency, {}, args.read_size))
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--path", default="/", help="request path, e.g. /info/<code> or /stream/<code>")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--read-size", type=int, default=64 * 1024)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to wait after /health answers")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    single = benchmark(args, 1)
+    multi = benchmark(args, args.workers)
+    print(f"--- {args.workers} workers vs 1")
+    print(f"  req/s     {multi['rps'] / single['rps']:.2f}x" if single["rps"] else "  req/s     n/a")
+    for key in ("ttfb_p50", "ttfb_p99", "total_p99"):
+        print(f"  {key:<9} {single[key] * 1000:.1f} ms -> {multi[key] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
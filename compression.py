@@ -0,0 +1,262 @@
+"""
+Response compression helpers for the API server
+- Accept-Encoding negotiation (brotli / gzip)
+- ASGI middleware compressing JSON responses
+- build step that fingerprints and precompresses the web assets
+- StaticFiles that serves the precompressed variants
+"""
+import os
+import re
+import gzip
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions worth compressing
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".json", ".svg", ".txt", ".xml", ".map"}
+# Fingerprinted asset names look like admin.3f2a9c01de.js
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{10}\.[A-Za-z0-9]+$")
+# Local src/href references inside HTML (absolute URLs are left alone)
+ASSET_REF_RE = re.compile(r'''((?:src|href)\s*=\s*["'])(?!https?:|//|data:|#)([^"'?#]+)(["'])''')
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce, in server preference order"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str], available: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Pick the best content-coding from an Accept-Encoding header.
+    Honours q-values (q=0 disables a coding) and the '*' wildcard.
+    """
+    if not accept_encoding:
+        return None
+    available = available if available is not None else available_encodings()
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best = None
+    best_q = 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class JSONCompressionMiddleware:
+    """
+    Pure ASGI middleware that compresses application/json responses of at
+    least minimum_size bytes (brotli or gzip, by Accept-Encoding). Every
+    other response, including file streams, passes through untouched.
+    Headers are edited in place, so duplicates (Set-Cookie) and existing
+    Vary values survive.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        start_message = None
+        body_parts: List[bytes] = []
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if not headers.get("content-type", "").startswith("application/json") \
+                        or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            # JSON bodies are small: collect them whole, then decide
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(body_parts)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if encoding and len(body) >= self.minimum_size:
+                body = compress_body(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write via a temp file + rename so concurrent workers never see partial files"""
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, str(path))
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def _write_with_variants(path: Path, data: bytes):
+    _atomic_write(path, data)
+    if path.suffix.lower() in COMPRESSIBLE_EXTENSIONS and len(data) >= 256:
+        _atomic_write(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9))
+        if brotli is not None:
+            _atomic_write(path.with_name(path.name + ".br"), brotli.compress(data, quality=11))
+
+
+def build_static_assets(source_dir: str, build_dir: str) -> Path:
+    """
+    Copy source_dir into build_dir with fingerprinted asset names.
+    Non-HTML files are written as name.<hash>.ext; HTML pages keep their
+    names (they are the entry points) and have local references rewritten
+    to the hashed names. Every compressible output also gets .gz/.br
+    siblings. Returns the build directory.
+    """
+    source = Path(source_dir)
+    build = Path(build_dir)
+    build.mkdir(parents=True, exist_ok=True)
+
+    # First pass: fingerprint everything that is not a page
+    renamed: Dict[str, str] = {}
+    pages: List[Path] = []
+    for path in sorted(source.rglob("*")):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(source).as_posix()
+        if path.suffix.lower() in (".html", ".htm"):
+            pages.append(path)
+            continue
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        hashed_relative = str(Path(relative).with_name(f"{path.stem}.{digest}{path.suffix}").as_posix())
+        renamed[relative] = hashed_relative
+        target = build / hashed_relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            _write_with_variants(target, data)
+
+    # Second pass: pages, with references pointing at the hashed files
+    for path in pages:
+        relative_dir = path.parent.relative_to(source)
+
+        def rewrite(match):
+            ref = match.group(2)
+            key = (relative_dir / ref).as_posix() if not ref.startswith("/") else None
+            if key in renamed:
+                hashed = Path(renamed[key]).relative_to(relative_dir).as_posix()
+                return f"{match.group(1)}{hashed}{match.group(3)}"
+            return match.group(0)
+
+        html = path.read_text(encoding="utf-8")
+        target = build / path.relative_to(source)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _write_with_variants(target, ASSET_REF_RE.sub(rewrite, html).encode("utf-8"))
+
+    return build
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves a prebuilt .br/.gz sibling when the client
+    accepts it, and marks fingerprinted assets as immutable
+    """
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse):
+            return response
+
+        file_path = str(response.path)
+        if HASHED_NAME_RE.search(file_path):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+
+        headers = dict((k.decode("latin-1"), v.decode("latin-1")) for k, v in scope.get("headers", []))
+        available = [
+            coding for coding, suffix in ENCODING_SUFFIXES.items()
+            if os.path.exists(file_path + suffix)
+        ]
+        encoding = choose_encoding(headers.get("accept-encoding"), available) if available else None
+
+        if encoding:
+            variant = file_path + ENCODING_SUFFIXES[encoding]
+            response = FileResponse(
+                variant,
+                media_type=response.media_type,
+                headers={"Content-Encoding": encoding},
+                stat_result=os.stat(variant),
+            )
+
+        response.headers["Cache-Control"] = cache_control
+        if available:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def mount_static_dir(app, mount_path: str, source_dir: str, build_root: str, name: str):
+    """Build source_dir into build_root/<name> and mount it with precompression"""
+    build_dir = os.path.join(build_root, name)
+    try:
+        build_static_assets(source_dir, build_dir)
+        app.mount(mount_path, PrecompressedStaticFiles(directory=build_dir, html=True), name=name)
+    except Exception as e:
+        print(f"Warning: Could not build {name} static assets, serving them as-is: {e}")
+        app.mount(mount_path, StaticFiles(directory=source_dir, html=True), name=name)
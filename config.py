@@ -39,6 +39,139 @@ USE_SQLITE = os.environ.get("USE_SQLITE", "True").lower() == "true"
 # Temporary files storage path
 TEMP_PATH = os.environ.get("TEMP_PATH", "/app/temp")
 APP_PATH = os.environ.get("APP_PATH", "/app")
+
+# Temp janitor: byte quota for TEMP_PATH, free-space floor, max idle age (seconds) and sweep interval
+TEMP_MAX_BYTES = int(os.environ.get("TEMP_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+TEMP_MIN_FREE_BYTES = int(os.environ.get("TEMP_MIN_FREE_BYTES", str(1024 * 1024 * 1024)))
+TEMP_MAX_AGE = int(os.environ.get("TEMP_MAX_AGE", str(24 * 3600)))
+TEMP_JANITOR_INTERVAL = float(os.environ.get("TEMP_JANITOR_INTERVAL", "60"))
+# Usage is a running total shared by the workers; a directory scan corrects it this often (seconds)
+TEMP_RECONCILE_INTERVAL = float(os.environ.get("TEMP_RECONCILE_INTERVAL", "600"))
+
+# Let a front proxy send cached temp files: "" (off), "x-accel" (nginx) or "x-sendfile" (Apache/lighttpd).
+# For x-accel, FILE_OFFLOAD_PREFIX must be an nginx `internal` location aliased to TEMP_PATH, e.g.
+#   location /_uxb_temp/ { internal; alias /app/temp/; }
+FILE_OFFLOAD_MODE = os.environ.get("FILE_OFFLOAD_MODE", "").lower()
+FILE_OFFLOAD_PREFIX = os.environ.get("FILE_OFFLOAD_PREFIX", "/_uxb_temp/")
+
+# Admin uploads are streamed to TEMP_PATH in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Largest accepted admin upload body in bytes (0 = unlimited)
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(2 * 1024 * 1024 * 1024)))
+
+# URL ingestion (/api/admin/upload-url): read size, connection limits, timeouts (seconds) and resume attempts
+URL_FETCH_CHUNK_SIZE = int(os.environ.get("URL_FETCH_CHUNK_SIZE", str(1024 * 1024)))
+URL_FETCH_MAX_CONNECTIONS = int(os.environ.get("URL_FETCH_MAX_CONNECTIONS", "16"))
+URL_FETCH_MAX_PER_HOST = int(os.environ.get("URL_FETCH_MAX_PER_HOST", "4"))
+URL_FETCH_CONNECT_TIMEOUT = float(os.environ.get("URL_FETCH_CONNECT_TIMEOUT", "15"))
+URL_FETCH_READ_TIMEOUT = float(os.environ.get("URL_FETCH_READ_TIMEOUT", "60"))
+URL_FETCH_RETRIES = int(os.environ.get("URL_FETCH_RETRIES", "3"))
+
+# Fingerprinted + precompressed copies of web_admin / telegram_miniapp are built here at startup
+STATIC_BUILD_PATH = os.environ.get("STATIC_BUILD_PATH", os.path.join(APP_PATH, "static_build"))
+# JSON responses smaller than this many bytes are sent uncompressed
+JSON_COMPRESS_MIN_SIZE = int(os.environ.get("JSON_COMPRESS_MIN_SIZE", "1024"))
+
+# Per-worker metric snapshots are written here and merged by /metrics
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(TEMP_PATH, ".metrics"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
+# Token-bucket limits for /stream, /download and /info (rate = requests/second refill, 0 disables)
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", "2"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_LINK_RATE = float(os.environ.get("RATE_LIMIT_LINK_RATE", "10"))
+RATE_LIMIT_LINK_BURST = float(os.environ.get("RATE_LIMIT_LINK_BURST", "100"))
+# memory (per worker) | sqlite (shared by all workers through RATE_LIMIT_DB_PATH)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB_PATH = os.environ.get("RATE_LIMIT_DB_PATH", os.path.join(os.path.dirname(DATABASE_PATH), "rate_limits.db"))
+RATE_LIMIT_PRUNE_INTERVAL = float(os.environ.get("RATE_LIMIT_PRUNE_INTERVAL", "60"))
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "False").lower() == "true"
+
+# Bandwidth ceilings for /stream in bytes/second (0 = unlimited): per stream, and for the whole
+# server (split evenly between the API worker processes)
+STREAM_MAX_RATE = int(os.environ.get("STREAM_MAX_RATE", "0"))
+STREAM_GLOBAL_MAX_RATE = int(os.environ.get("STREAM_GLOBAL_MAX_RATE", "0"))
+# Fair-share weight of high-priority (admin) links relative to normal links
+STREAM_PRIORITY_WEIGHT = float(os.environ.get("STREAM_PRIORITY_WEIGHT", "4"))
+
+# Admission control for /stream and /download: concurrently served streams for the whole server
+# (0 = no cap; with several workers the slots are lock files in STREAM_SLOT_DIR), requests allowed
+# to wait for a slot per worker and how long (seconds); range requests from a client that
+# streamed the same link within STREAM_SESSION_WINDOW seconds are admitted first
+STREAM_MAX_ACTIVE = int(os.environ.get("STREAM_MAX_ACTIVE", "64"))
+STREAM_MAX_QUEUE = int(os.environ.get("STREAM_MAX_QUEUE", "128"))
+STREAM_QUEUE_TIMEOUT = float(os.environ.get("STREAM_QUEUE_TIMEOUT", "10"))
+STREAM_SESSION_WINDOW = float(os.environ.get("STREAM_SESSION_WINDOW", "30"))
+STREAM_SLOT_DIR = os.environ.get("STREAM_SLOT_DIR", os.path.join(TEMP_PATH, ".slots"))
+
+# Read-ahead between Telegram and the client: depth adapts between MIN and MAX bytes per stream,
+# holding at most STREAM_READAHEAD_SECONDS of the client's observed drain rate
+STREAM_READAHEAD_MIN_BYTES = int(os.environ.get("STREAM_READAHEAD_MIN_BYTES", str(2 * 1024 * 1024)))
+STREAM_READAHEAD_MAX_BYTES = int(os.environ.get("STREAM_READAHEAD_MAX_BYTES", str(16 * 1024 * 1024)))
+STREAM_READAHEAD_SECONDS = float(os.environ.get("STREAM_READAHEAD_SECONDS", "2"))
+
+# Most link codes / file ids resolved by one POST /info/batch or admin files/batch request
+INFO_BATCH_MAX_ITEMS = int(os.environ.get("INFO_BATCH_MAX_ITEMS", "100"))
+
+# ZIP downloads of a category subtree or a batch of links: most files per archive, and how many
+# upcoming members are fetched in parallel with the one being written (each buffering up to N bytes)
+ZIP_MAX_FILES = int(os.environ.get("ZIP_MAX_FILES", "500"))
+ZIP_PREFETCH_FILES = int(os.environ.get("ZIP_PREFETCH_FILES", "2"))
+ZIP_PREFETCH_BYTES = int(os.environ.get("ZIP_PREFETCH_BYTES", str(4 * 1024 * 1024)))
+
+# Concurrent /stream viewers of one file share a single upstream fetch per worker; this is the
+# sliding window of recent bytes late joiners can attach to (0 = every viewer fetches on its own).
+# The shared fetch runs at most STREAM_READAHEAD_MAX_BYTES ahead of its viewers, and all windows
+# of a worker together hold at most STREAM_BROADCAST_MAX_BYTES (beyond it viewers fetch directly)
+STREAM_BROADCAST_WINDOW = int(os.environ.get("STREAM_BROADCAST_WINDOW", str(64 * 1024 * 1024)))
+STREAM_BROADCAST_MAX_BYTES = int(os.environ.get("STREAM_BROADCAST_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# On-disk cache of the first/last bytes of each streamed file (player probes), with a total byte budget
+PREFIX_CACHE_HEAD_BYTES = int(os.environ.get("PREFIX_CACHE_HEAD_BYTES", str(1024 * 1024)))
+PREFIX_CACHE_TAIL_BYTES = int(os.environ.get("PREFIX_CACHE_TAIL_BYTES", str(512 * 1024)))
+PREFIX_CACHE_MAX_BYTES = int(os.environ.get("PREFIX_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+PREFIX_CACHE_PATH = os.environ.get("PREFIX_CACHE_PATH", os.path.join(TEMP_PATH, ".prefix"))
+
+# Chunk-granular disk cache for ranges of partially watched files (chunks of TG_PART_SIZE bytes)
+CHUNK_CACHE_MAX_BYTES = int(os.environ.get("CHUNK_CACHE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+CHUNK_CACHE_PATH = os.environ.get("CHUNK_CACHE_PATH", os.path.join(TEMP_PATH, ".chunks"))
+
+# In-memory LRU of recently fetched chunks in front of the chunk cache, per worker (0 = off)
+HOT_CHUNK_CACHE_BYTES = int(os.environ.get("HOT_CHUNK_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Parallel Telegram fetch: parts in flight per file and part size (multiple of 4 KB dividing 1 MB)
+TG_PARALLEL_PARTS = int(os.environ.get("TG_PARALLEL_PARTS", "4"))
+TG_PART_SIZE = int(os.environ.get("TG_PART_SIZE", str(1024 * 1024)))
+# Mid-stream Telegram failures: attempts without progress before giving up, base backoff
+# (seconds, doubled per attempt) and the longest FloodWait that is waited out rather than raised
+TG_STREAM_RETRIES = int(os.environ.get("TG_STREAM_RETRIES", "5"))
+TG_STREAM_BACKOFF = float(os.environ.get("TG_STREAM_BACKOFF", "0.5"))
+TG_FLOOD_WAIT_MAX = float(os.environ.get("TG_FLOOD_WAIT_MAX", "60"))
+
+# FastAPI server process model (launched by plugins/route.py)
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+# Worker processes. Every worker logs in to Telegram from its own copy of the session
+# (<session>-w<pid>) and keeps its own caches and read-ahead buffers, so the STREAM_*/HOT_CHUNK_*
+# budgets marked "per worker" are multiplied by this. More than one worker needs
+# RATE_LIMIT_BACKEND=sqlite; the API server refuses to start otherwise.
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+# Development only: auto-reload on code changes (forces a single worker)
+API_RELOAD = os.environ.get("API_RELOAD", "False").lower() == "true"
+# Number of API processes actually started
+API_PROCESS_COUNT = 1 if API_RELOAD else max(1, API_WORKERS)
+# uvicorn stdout/stderr are appended here instead of an undrained pipe
+API_LOG_FILE = os.environ.get("API_LOG_FILE", os.path.join(APP_PATH, "api_server.log"))
+# Health-check the server every N seconds and restart it after M consecutive failures
+API_HEALTH_INTERVAL = float(os.environ.get("API_HEALTH_INTERVAL", "15"))
+API_HEALTH_FAILURES = int(os.environ.get("API_HEALTH_FAILURES", "3"))
+# Requests arriving while the Telegram downloader is still logging in wait up to this many seconds
+DOWNLOADER_INIT_TIMEOUT = float(os.environ.get("DOWNLOADER_INIT_TIMEOUT", "30"))
+# Graceful drain on stop/restart: workers refuse new streams while this file exists,
+# and active streams get up to API_DRAIN_TIMEOUT seconds to finish
+API_DRAIN_FLAG = os.environ.get("API_DRAIN_FLAG", os.path.join(APP_PATH, ".api_draining"))
+API_DRAIN_TIMEOUT = float(os.environ.get("API_DRAIN_TIMEOUT", "60"))
 #force sub channel id, if you want enable force sub
 FORCESUB_CHANNEL = int(os.environ.get("FORCESUB_CHANNEL", "0"))
 FORCESUB_CHANNEL2 = int(os.environ.get("FORCESUB_CHANNEL2", "0")) 
@@ -82,7 +215,8 @@ USER_REPLY_TEXT = "ʙᴀᴋᴋᴀ ! ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴍʏ ꜱᴇɴᴘ
 ADMINS.append(OWNER_ID)
 ADMINS.append(6695586027)
 
-LOG_FILE_NAME = "codeflixbots.txt"
+# Bot log file (tests and benchmarks point it at a temp path)
+LOG_FILE_NAME = os.environ.get("LOG_FILE_NAME", "codeflixbots.txt")
 
 logging.basicConfig(
     level=logging.INFO,
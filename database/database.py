@@ -16,8 +16,9 @@ if USE_SQLITE:
         create_category, get_category, get_categories, 
         update_category, delete_category,
         # File functions
-        add_file, get_file, get_files_by_category, search_files,
-        create_file_link, get_file_by_link_code
+        add_file, get_file, get_files_by_category, search_files, list_files,
+        create_file_link, get_file_by_link_code, get_files_by_link_codes, get_files_by_ids,
+        get_catalog_version
     )
 else:
     # Keep original MongoDB implementation
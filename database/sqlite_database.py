@@ -6,6 +6,7 @@ import sqlite3
 import asyncio
 import json
 import uuid
+import base64
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import os
@@ -94,6 +95,41 @@ class SQLiteDatabase:
             )
         ''')
         
+        # Link priority class (0 = normal, 1 = high / admin) for stream scheduling
+        cursor.execute('PRAGMA table_info(file_links)')
+        if 'priority' not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE file_links ADD COLUMN priority INTEGER DEFAULT 0')
+        
+        # Indexes for admin listing, filtering and link lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_category_created ON files (category_id, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_created ON files (created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_mime ON files (mime_type)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories (parent_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_links_file ON file_links (file_id)')
+        
+        # Catalog version counter (used for HTTP ETag / Last-Modified)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)')
+        
+        # Bump the version on every write, whichever module issues it
+        for table in ('categories', 'files', 'file_links'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE catalog_meta
+                        SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = 1;
+                    END
+                ''')
+        
         conn.commit()
         conn.close()
         
@@ -396,17 +432,128 @@ async def search_files(query: str, category_id: Optional[str] = None) -> List[Di
     conn.close()
     return [dict(row) for row in results]
 
+# Sortable columns for list_files: name -> (SQL expression, result key, value standing in for NULL).
+# The expression must never be NULL, or the keyset comparison would skip those rows.
+FILE_SORT_COLUMNS = {
+    'created_at': ('f.created_at', 'created_at', None),
+    'name': ('f.original_name', 'original_name', None),
+    'size': ('COALESCE(f.file_size, -1)', 'file_size', -1),
+}
+
+def _encode_cursor(sort_value, file_id: str) -> str:
+    raw = json.dumps([sort_value, file_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_cursor(cursor: str):
+    try:
+        sort_value, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return sort_value, file_id
+
+async def list_files(category_id: Optional[str] = None, recursive: bool = False,
+                     query: Optional[str] = None, mime_type: Optional[str] = None,
+                     sort: str = 'created_at', descending: bool = True,
+                     cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    Filtered, keyset-paginated file listing for the admin API.
+    category_id=None lists every file; recursive includes subcategories.
+    mime_type matches exactly, or by prefix when it ends with '/' or '/*'.
+    Returns {'items', 'total', 'next_cursor'}.
+    """
+    if sort not in FILE_SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+    sort_column, sort_key, null_value = FILE_SORT_COLUMNS[sort]
+    
+    conditions = []
+    params: List[Any] = []
+    prefix = ''
+    prefix_params: List[Any] = []
+    
+    if category_id is not None:
+        if recursive:
+            prefix = '''
+                WITH RECURSIVE subcategories AS (
+                    SELECT id FROM categories WHERE id = ?
+                    UNION ALL
+                    SELECT c.id FROM categories c
+                    INNER JOIN subcategories s ON c.parent_id = s.id
+                )
+            '''
+            prefix_params.append(category_id)
+            conditions.append('f.category_id IN (SELECT id FROM subcategories)')
+        else:
+            conditions.append('f.category_id = ?')
+            params.append(category_id)
+    
+    if query:
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        search_pattern = f"%{escaped}%"
+        conditions.append("(f.original_name LIKE ? ESCAPE '\\' OR f.description LIKE ? ESCAPE '\\')")
+        params.extend([search_pattern, search_pattern])
+    
+    if mime_type:
+        if mime_type.endswith('/*') or mime_type.endswith('/'):
+            conditions.append('f.mime_type LIKE ?')
+            params.append(mime_type.rstrip('*') + '%')
+        else:
+            conditions.append('f.mime_type = ?')
+            params.append(mime_type)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    conn = db.get_connection()
+    cursor_db = conn.cursor()
+    
+    cursor_db.execute(f'{prefix} SELECT COUNT(*) AS total FROM files f {where}', prefix_params + params)
+    total = cursor_db.fetchone()['total']
+    
+    # Keyset pagination on (sort column, id) keeps deep pages as cheap as the first one
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if cursor:
+        last_value, last_id = _decode_cursor(cursor)
+        op = '<' if descending else '>'
+        page_conditions.append(f'({sort_column} {op} ? OR ({sort_column} = ? AND f.id {op} ?))')
+        page_params.extend([last_value, last_value, last_id])
+    page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+    direction = 'DESC' if descending else 'ASC'
+    
+    cursor_db.execute(f'''
+        {prefix}
+        SELECT f.*, c.name AS category_name,
+               (SELECT COALESCE(SUM(fl.download_count), 0) FROM file_links fl
+                WHERE fl.file_id = f.id) AS download_count
+        FROM files f
+        LEFT JOIN categories c ON f.category_id = c.id
+        {page_where}
+        ORDER BY {sort_column} {direction}, f.id {direction}
+        LIMIT ?
+    ''', prefix_params + page_params + [limit + 1])
+    results = [dict(row) for row in cursor_db.fetchall()]
+    conn.close()
+    
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        sort_value = last[sort_key]
+        next_cursor = _encode_cursor(null_value if sort_value is None else sort_value, last['id'])
+    
+    return {'items': results, 'total': total, 'next_cursor': next_cursor}
+
 # File link management
 async def create_file_link(file_id: str, link_type: str, link_code: str, 
-                          expires_at: Optional[datetime] = None, max_downloads: int = -1) -> str:
+                          expires_at: Optional[datetime] = None, max_downloads: int = -1,
+                          priority: int = 0) -> str:
     """Create file download link"""
     link_id = str(uuid.uuid4())
     conn = db.get_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO file_links (id, file_id, link_type, link_code, expires_at, max_downloads)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (link_id, file_id, link_type, link_code, expires_at, max_downloads))
+        INSERT INTO file_links (id, file_id, link_type, link_code, expires_at, max_downloads, priority)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (link_id, file_id, link_type, link_code, expires_at, max_downloads, priority))
     conn.commit()
     conn.close()
     return link_id
@@ -416,7 +563,7 @@ async def get_file_by_link_code(link_code: str) -> Optional[Dict[str, Any]]:
     conn = db.get_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT f.*, fl.link_type, fl.download_count, fl.max_downloads, fl.expires_at
+        SELECT f.*, fl.link_type, fl.download_count, fl.max_downloads, fl.expires_at, fl.priority
         FROM files f
         JOIN file_links fl ON f.id = fl.file_id
         WHERE fl.link_code = ?
@@ -426,4 +573,69 @@ async def get_file_by_link_code(link_code: str) -> Optional[Dict[str, Any]]:
     
     if result:
         return dict(result)
-    return None
\ No newline at end of file
+    return None
+
+async def get_files_by_link_codes(link_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Batch get_file_by_link_code: one IN query, keyed by link code (unknown codes are absent)"""
+    if not link_codes:
+        return {}
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' for _ in link_codes)
+    cursor.execute(f'''
+        SELECT f.*, fl.link_code, fl.link_type, fl.download_count, fl.max_downloads, fl.expires_at, fl.priority
+        FROM files f
+        JOIN file_links fl ON f.id = fl.file_id
+        WHERE fl.link_code IN ({placeholders})
+    ''', list(link_codes))
+    results = cursor.fetchall()
+    conn.close()
+    return {row['link_code']: dict(row) for row in results}
+
+async def get_files_by_ids(file_ids: List[str], with_links: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Batch get_file: one IN query, keyed by file id (unknown ids are absent).
+    Rows carry category_name and total download_count; with_links adds each
+    file's links (one more IN query) under 'links'.
+    """
+    if not file_ids:
+        return {}
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' for _ in file_ids)
+    cursor.execute(f'''
+        SELECT f.*, c.name AS category_name,
+               (SELECT COALESCE(SUM(fl.download_count), 0) FROM file_links fl
+                WHERE fl.file_id = f.id) AS download_count
+        FROM files f
+        LEFT JOIN categories c ON f.category_id = c.id
+        WHERE f.id IN ({placeholders})
+    ''', list(file_ids))
+    files = {row['id']: dict(row) for row in cursor.fetchall()}
+    
+    if with_links and files:
+        for file_info in files.values():
+            file_info['links'] = []
+        cursor.execute(f'''
+            SELECT file_id, link_code, link_type, download_count, max_downloads, expires_at, priority, created_at
+            FROM file_links
+            WHERE file_id IN ({placeholders})
+            ORDER BY created_at
+        ''', list(file_ids))
+        for row in cursor.fetchall():
+            link = dict(row)
+            files[link.pop('file_id')]['links'].append(link)
+    conn.close()
+    return files
+
+async def get_catalog_version() -> Dict[str, Any]:
+    """Get catalog version counter and last change time (UTC)"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT version, updated_at FROM catalog_meta WHERE id = 1')
+    result = cursor.fetchone()
+    conn.close()
+    
+    if result:
+        return dict(result)
+    return {'version': 0, 'updated_at': None}
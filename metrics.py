@@ -0,0 +1,292 @@
+"""
+Prometheus-style metrics for the API server
+In-process counters, gauges and histograms. Every worker periodically
+dumps its own snapshot to METRICS_DIR/worker-<pid>.json; /metrics merges
+all snapshots so the numbers stay correct under `uvicorn --workers N`.
+"""
+import os
+import json
+import time
+import tempfile
+import functools
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional, Any
+
+from config import METRICS_DIR
+
+# Default latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help); only registered metrics are rendered with HELP/TYPE
+METRIC_DEFINITIONS = {
+    "uxb_http_requests_total": ("counter", "HTTP requests by route, method and status"),
+    "uxb_http_request_duration_seconds": ("histogram", "Time until the last response body byte was sent"),
+    "uxb_stream_bytes_total": ("counter", "Bytes sent by /stream and /download"),
+    "uxb_active_streams": ("gauge", "Responses currently streaming file data"),
+    "uxb_time_to_first_byte_seconds": ("histogram", "Time from request start to the first file byte"),
+    "uxb_cache_requests_total": ("counter", "Temp file cache lookups by result (hit/miss)"),
+    "uxb_cache_hit_ratio": ("gauge", "Temp file cache hits / lookups"),
+    "uxb_downloader_inflight": ("gauge", "Telegram downloader operations in progress (queue depth)"),
+    "uxb_db_call_duration_seconds": ("histogram", "SQLite call latency by function"),
+    "uxb_stream_buffer_bytes": ("gauge", "Bytes held in stream read-ahead buffers"),
+    "uxb_stream_stall_seconds_total": ("counter", "Time a stream waited on upstream data or on the client (side)"),
+    "uxb_stream_upstream_bytes_total": ("counter", "Bytes fetched from Telegram for /stream, shared (broadcast) or direct"),
+    "uxb_stream_shared_viewers": ("gauge", "/stream viewers reading from a shared broadcast"),
+    "uxb_stream_broadcast_bytes": ("gauge", "Bytes held by shared broadcast windows"),
+    "uxb_stream_broadcast_skipped_total": ("counter", "/stream requests served directly because the broadcast budget was used up"),
+    "uxb_prefix_cache_requests_total": ("counter", "/stream prefix cache lookups by result (hit/miss)"),
+    "uxb_chunk_cache_requests_total": ("counter", "/stream chunk cache lookups by result (hit/miss), per chunk"),
+    "uxb_hot_cache_requests_total": ("counter", "In-memory hot chunk lookups by result (hit/miss)"),
+    "uxb_hot_cache_hit_ratio": ("gauge", "In-memory hot chunk hits / lookups"),
+    "uxb_hot_cache_resident_bytes": ("gauge", "Bytes held by the in-memory hot chunk LRU"),
+    "uxb_stream_aborted_total": ("counter", "Streams cancelled because the client disconnected"),
+    "uxb_stream_aborted_bytes_total": ("counter", "Bytes of aborted streams that were never sent"),
+    "uxb_admission_active": ("gauge", "Streams holding an admission slot"),
+    "uxb_admission_queued": ("gauge", "Stream requests waiting for an admission slot"),
+    "uxb_admission_wait_seconds": ("histogram", "Time spent queued for an admission slot"),
+    "uxb_admission_rejected_total": ("counter", "Stream requests rejected with 503 by reason (queue_full/timeout/draining)"),
+    "uxb_rate_limited_total": ("counter", "Requests rejected with 429 by limiter scope (ip/link)"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = []
+    for k, v in items:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Cheap in-process metrics: plain dict updates on the hot path,
+    file I/O only on flush()/render()
+    """
+
+    def __init__(self, metrics_dir: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.metrics_dir = Path(metrics_dir)
+        self.buckets = buckets
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self.histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        try:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"Warning: Could not create metrics directory: {e}")
+
+    # ---------- recording ----------
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def add_gauge(self, name: str, delta: float, **labels):
+        series = self.gauges.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        data = series.get(key)
+        if data is None:
+            data = series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[i] += 1
+                break
+        data[-2] += value
+        data[-1] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def track_inflight(self, name: str, **labels):
+        self.add_gauge(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.add_gauge(name, -1, **labels)
+
+    def track_db_call(self, func):
+        """Wrap an async DB function so its latency lands in uxb_db_call_duration_seconds"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with self.time("uxb_db_call_duration_seconds", function=func.__name__):
+                return await func(*args, **kwargs)
+        return wrapper
+
+    # ---------- multi-worker aggregation ----------
+    def _snapshot(self) -> Dict[str, Any]:
+        def dump(table):
+            return {name: [[list(map(list, key)), value] for key, value in series.items()]
+                    for name, series in table.items()}
+        return {
+            "pid": os.getpid(),
+            "buckets": list(self.buckets),
+            "counters": dump(self.counters),
+            "gauges": dump(self.gauges),
+            "histograms": dump(self.histograms),
+        }
+
+    def flush(self):
+        """Write this worker's snapshot atomically"""
+        target = self.metrics_dir / f"worker-{os.getpid()}.json"
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=str(self.metrics_dir), prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_name, str(target))
+        except OSError as e:
+            print(f"Warning: Could not flush metrics: {e}")
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        if pid <= 0:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def collect(self) -> Dict[str, Dict[str, Dict[LabelKey, Any]]]:
+        """Merge the snapshots of every worker (counters and histograms summed)"""
+        self.flush()
+        merged = {"counters": {}, "gauges": {}, "histograms": {}}
+        snapshots = []
+        for path in self.metrics_dir.glob("worker-*.json"):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        for snapshot in snapshots:
+            # Gauges of dead workers describe nothing that still exists
+            kinds = ["counters", "histograms"]
+            if snapshot.get("pid") == os.getpid() or self._pid_alive(snapshot.get("pid", 0)):
+                kinds.append("gauges")
+            for kind in kinds:
+                for name, series in snapshot.get(kind, {}).items():
+                    target = merged[kind].setdefault(name, {})
+                    for raw_key, value in series:
+                        key = tuple(tuple(pair) for pair in raw_key)
+                        if kind == "histograms":
+                            if len(value) != len(self.buckets) + 2:
+                                continue
+                            current = target.setdefault(key, [0] * len(value))
+                            for i, v in enumerate(value):
+                                current[i] += v
+                        else:
+                            target[key] = target.get(key, 0) + value
+        return merged
+
+    # ---------- exposition ----------
+    def render(self) -> str:
+        merged = self.collect()
+
+        # Derived gauges: cache hit ratios over all workers
+        for counter, ratio in (("uxb_cache_requests_total", "uxb_cache_hit_ratio"),
+                               ("uxb_hot_cache_requests_total", "uxb_hot_cache_hit_ratio")):
+            cache = merged["counters"].get(counter, {})
+            hits = sum(v for k, v in cache.items() if ("result", "hit") in k)
+            lookups = sum(cache.values())
+            merged["gauges"][ratio] = {(): (hits / lookups) if lookups else 0.0}
+
+        lines: List[str] = []
+        for kind in ("counters", "gauges", "histograms"):
+            for name in sorted(merged[kind]):
+                metric_type, help_text = METRIC_DEFINITIONS.get(name, (kind.rstrip("s"), name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(merged[kind][name].items()):
+                    if kind != "histograms":
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, value):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(value[-1])}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {_format_value(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware: per-route request counts and latency.
+    Timing runs from scope entry until the final body message
+    (more_body=False) is sent, so streamed responses count in full.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            # FastAPI stores the matched route in the scope; use its template to keep labels bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.registry.inc("uxb_http_requests_total", method=scope["method"], route=route, status=status)
+            self.registry.observe("uxb_http_request_duration_seconds", time.perf_counter() - start, route=route)
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            # Errors and client disconnects end the request without a final body message
+            record()
+
+
+metrics = MetricsRegistry(METRICS_DIR)
@@ -233,6 +233,12 @@ async def handle_category_link_generation(client: Client, callback_query):
                 await client.send_message(callback_query.from_user.id, links_text)
                 links_text = ""
         
+        # The whole subtree as a single streamed archive (admin-only endpoint)
+        links_text += (
+            f"📦 **All files as ZIP:**\n"
+            f"`https://your-domain.com/api/admin/categories/{category_id}/zip?user_id={callback_query.from_user.id}`\n"
+        )
+        
         if links_text:
             await client.send_message(callback_query.from_user.id, links_text)
         
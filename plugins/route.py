@@ -11,11 +11,20 @@ import subprocess
 import os
 import signal
 import sys
+import glob
+import time
 import pathlib
+import urllib.error
+import urllib.request
 PARENT_PATH = pathlib.Path(__file__).parent.resolve()
 if PARENT_PATH not in ["",None] :
     sys.path.append(PARENT_PATH)
-    from config import TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH, DATABASE_PATH
+    from config import (
+        TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH, DATABASE_PATH,
+        API_HOST, API_PORT, API_WORKERS, API_PROCESS_COUNT, API_RELOAD, API_LOG_FILE, RATE_LIMIT_BACKEND,
+        API_HEALTH_INTERVAL, API_HEALTH_FAILURES, METRICS_DIR,
+        API_DRAIN_FLAG, API_DRAIN_TIMEOUT
+    )
 else:
     #DATABASE_PATH = os.getenv("DATABASE_PATH", "/app/data/file_sharing_bot.db")
     APP_PATH = os.getenv("APP_PATH", "/app")
@@ -24,6 +33,10 @@ routes = web.RouteTableDef()
 
 # Global variable to store FastAPI server process
 fastapi_process = None
+# Health watchdog task for the FastAPI server
+fastapi_watchdog = None
+# True while active streams are being drained (the watchdog stands by)
+fastapi_draining = False
 
 @routes.get("/", allow_head=True)
 async def root_route_handler(request):
@@ -33,7 +46,7 @@ async def root_route_handler(request):
         "features": {
             "categories": "✅ Active",
             "streaming": "✅ Active", 
-            "api_server": "✅ Running on port 8000",
+            "api_server": f"✅ Running on port {API_PORT}",
             "database": "SQLite"
         },
         "endpoints": {
@@ -50,7 +63,7 @@ async def api_status_handler(request):
     try:
         import aiohttp
         async with aiohttp.ClientSession() as session:
-            async with session.get('http://localhost:8000/health') as resp:
+            async with session.get(f'http://localhost:{API_PORT}/health') as resp:
                 if resp.status == 200:
                     health_data = await resp.json()
                     return web.json_response({
@@ -75,9 +88,7 @@ async def restart_api_handler(request):
     
     try:
         # Stop existing process
-        if fastapi_process and fastapi_process.poll() is None:
-            fastapi_process.terminate()
-            fastapi_process.wait()
+        await stop_fastapi_server()
         
         # Start new process
         fastapi_process = await start_fastapi_server()
@@ -92,44 +103,158 @@ async def restart_api_handler(request):
             "error": str(e)
         }, status=500)
 
+def build_server_command():
+    """uvicorn command line: N workers in production, single reloading worker in development"""
+    command = [
+        sys.executable, "-m", "uvicorn",
+        "api_server:app",
+        "--host", API_HOST,
+        "--port", str(API_PORT),
+    ]
+    if API_RELOAD:
+        command.append("--reload")
+    else:
+        command.extend(["--workers", str(API_PROCESS_COUNT), "--no-use-colors"])
+    return command
+
 async def start_fastapi_server():
     """Start FastAPI server as background process"""
     try:
-        process = subprocess.Popen([
-            sys.executable, "-m", "uvicorn", 
-            "api_server:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000",
-            "--reload"
-        ], 
-        cwd= APP_PATH,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-        )
+        # Metric snapshots of the previous run's workers are stale now
+        for snapshot in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+            os.remove(snapshot)
+        # A leftover drain flag would make the new workers refuse every stream
+        clear_drain_flag()
+        # The workers would refuse to start anyway; say why here instead of only in the log
+        if API_PROCESS_COUNT > 1 and RATE_LIMIT_BACKEND != "sqlite":
+            raise ValueError(f"API_WORKERS={API_WORKERS} needs RATE_LIMIT_BACKEND=sqlite (got {RATE_LIMIT_BACKEND!r})")
+        
+        # Output goes straight to a log file, so a full pipe can never block the server
+        log_file = open(API_LOG_FILE, "ab")
+        try:
+            process = subprocess.Popen(
+                build_server_command(),
+                cwd= APP_PATH,
+                stdout=log_file,
+                stderr=subprocess.STDOUT
+            )
+        finally:
+            log_file.close()
         
         # Give it a moment to start
         await asyncio.sleep(2)
         
         # Check if process started successfully
         if process.poll() is None:
-            print("✅ FastAPI server started successfully on port 8000")
+            print(f"✅ FastAPI server started successfully on port {API_PORT} ({API_PROCESS_COUNT} workers)")
             return process
         else:
-            stdout, stderr = process.communicate()
-            print(f"❌ FastAPI server failed to start: {stderr.decode()}")
+            print(f"❌ FastAPI server failed to start, see {API_LOG_FILE}")
             return None
             
     except Exception as e:
         print(f"❌ Error starting FastAPI server: {e}")
         return None
 
+def clear_drain_flag():
+    try:
+        os.remove(API_DRAIN_FLAG)
+    except FileNotFoundError:
+        pass
+
+def wait_for_drain(timeout: float = API_DRAIN_TIMEOUT):
+    """
+    Put the workers in drain mode (no new streams) and block until no stream
+    is active or the deadline passes. Blocking on purpose: the signal
+    handler uses it too.
+    """
+    with open(API_DRAIN_FLAG, "w") as f:
+        f.write(str(os.getpid()))
+    deadline = time.monotonic() + timeout
+    print(f"🚰 Draining FastAPI server (up to {timeout:.0f}s)...")
+    # Give every worker a moment to notice the flag
+    time.sleep(1.5)
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{API_PORT}/health', timeout=5) as resp:
+                body = resp.read()
+        except urllib.error.HTTPError as e:
+            body = e.read()
+        except Exception:
+            return  # not reachable: nothing left to drain
+        try:
+            active = json.loads(body).get("active_streams")
+        except ValueError:
+            active = None
+        if active == 0:
+            print("✅ All streams finished")
+            return
+        time.sleep(1)
+    print("⚠️ Drain deadline reached, stopping with streams still active")
+
+async def stop_fastapi_server(timeout: float = 10, drain: bool = True):
+    """
+    Stop the FastAPI server: drain active streams first (unless drain=False),
+    then terminate it, killing it if it does not exit in time
+    """
+    global fastapi_draining
+    if fastapi_process and fastapi_process.poll() is None:
+        loop = asyncio.get_event_loop()
+        if drain:
+            fastapi_draining = True
+            try:
+                await loop.run_in_executor(None, wait_for_drain)
+            finally:
+                fastapi_draining = False
+        print("🛑 Stopping FastAPI server...")
+        fastapi_process.terminate()
+        try:
+            await asyncio.wait_for(loop.run_in_executor(None, fastapi_process.wait), timeout)
+        except asyncio.TimeoutError:
+            fastapi_process.kill()
+            await loop.run_in_executor(None, fastapi_process.wait)
+    clear_drain_flag()
+
+async def check_fastapi_health() -> bool:
+    try:
+        import aiohttp
+        timeout = aiohttp.ClientTimeout(total=5)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(f'http://127.0.0.1:{API_PORT}/health') as resp:
+                return resp.status == 200
+    except Exception:
+        return False
+
+async def watch_fastapi_server():
+    """Restart the FastAPI server when it exits or fails consecutive health checks"""
+    global fastapi_process
+    failures = 0
+    while True:
+        await asyncio.sleep(API_HEALTH_INTERVAL)
+        if fastapi_draining:
+            # /health answers 503 "draining" on purpose
+            continue
+        if fastapi_process is None or fastapi_process.poll() is not None:
+            healthy = False
+            failures = API_HEALTH_FAILURES
+        else:
+            healthy = await check_fastapi_health()
+            failures = 0 if healthy else failures + 1
+        
+        if failures >= API_HEALTH_FAILURES:
+            print("⚠️ FastAPI server is unhealthy, restarting...")
+            await stop_fastapi_server(drain=False)
+            fastapi_process = await start_fastapi_server()
+            failures = 0
+
 async def web_server():
     """Create web application with integrated FastAPI server"""
-    global fastapi_process
+    global fastapi_process, fastapi_watchdog
     
     # Start FastAPI server
     print("🚀 Starting FastAPI server...")
     fastapi_process = await start_fastapi_server()
+    fastapi_watchdog = asyncio.get_event_loop().create_task(watch_fastapi_server())
     
     # Create aiohttp app
     web_app = web.Application(client_max_size=30000000)
@@ -137,10 +262,9 @@ async def web_server():
     
     # Add cleanup handler
     async def cleanup_handler(app):
-        if fastapi_process and fastapi_process.poll() is None:
-            print("🛑 Stopping FastAPI server...")
-            fastapi_process.terminate()
-            fastapi_process.wait()
+        if fastapi_watchdog:
+            fastapi_watchdog.cancel()
+        await stop_fastapi_server()
     
     web_app.on_cleanup.append(cleanup_handler)
     
@@ -148,11 +272,17 @@ async def web_server():
 
 # Handle cleanup on exit
 def signal_handler(signum, frame):
-    global fastapi_process
+    global fastapi_process, fastapi_draining
     if fastapi_process and fastapi_process.poll() is None:
+        fastapi_draining = True
+        wait_for_drain()
         print("🛑 Stopping FastAPI server...")
         fastapi_process.terminate()
-        fastapi_process.wait()
+        try:
+            fastapi_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            fastapi_process.kill()
+    clear_drain_flag()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
@@ -0,0 +1,190 @@
+"""
+Token-bucket rate limiting for the public streaming endpoints
+Buckets are keyed by strings such as "ip:1.2.3.4" or "link:<code>".
+Two stores are available:
+    - memory: per-process dict, pruned periodically
+    - sqlite: one shared database file, so every uvicorn worker sees
+      the same buckets
+check_all() charges several buckets of one store all or nothing, so a
+request refused by one bucket spends nothing from the others.
+"""
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# (key, rate, burst, cost)
+Charge = Tuple[str, float, float, float]
+
+
+def _merge_charges(charges: List[Charge]) -> Dict[str, List[float]]:
+    """key -> [rate, burst, cost]; a key named twice pays for both, capped at its burst"""
+    merged: Dict[str, List[float]] = {}
+    for key, rate, burst, cost in charges:
+        entry = merged.setdefault(key, [rate, burst, 0.0])
+        entry[2] = min(entry[2] + cost, burst)
+    return merged
+
+
+class MemoryBucketStore:
+    """Per-process buckets: key -> [tokens, last_refill, full_at]"""
+
+    def __init__(self, prune_interval: float = 60.0):
+        self.buckets: Dict[str, List[float]] = {}
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Spend cost tokens; returns 0 when allowed, else seconds until it would be"""
+        return (await self.take_all([(key, rate, burst, cost)]))[0]
+
+    async def take_all(self, charges: List[Charge]) -> List[float]:
+        """
+        Spend every charge or none: returns each charge's wait in seconds,
+        all 0 when the tokens were taken
+        """
+        now = time.monotonic()
+        if now - self._last_prune >= self.prune_interval:
+            self.prune(now)
+
+        merged = _merge_charges(charges)
+        waits: Dict[str, float] = {}
+        for key, (rate, burst, cost) in merged.items():
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [burst, now, now]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            waits[key] = 0.0 if bucket[0] >= cost else (cost - bucket[0]) / rate
+
+        allowed = not any(waits.values())
+        for key, (rate, burst, cost) in merged.items():
+            bucket = self.buckets[key]
+            if allowed:
+                bucket[0] -= cost
+            bucket[2] = now + (burst - bucket[0]) / rate
+        return [waits[key] for key, _, _, _ in charges]
+
+    def prune(self, now: float):
+        """Drop buckets that have refilled completely; they are equivalent to new ones"""
+        stale = [key for key, bucket in self.buckets.items() if bucket[2] <= now]
+        for key in stale:
+            del self.buckets[key]
+        self._last_prune = now
+
+
+class SQLiteBucketStore:
+    """Buckets shared by all workers through a small SQLite database"""
+
+    def __init__(self, db_path: str, prune_interval: float = 60.0):
+        self.db_path = db_path
+        self.prune_interval = prune_interval
+        self._last_prune = time.time()
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                full_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _take_all_sync(self, charges: List[Charge]) -> List[float]:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self._last_prune >= self.prune_interval:
+                conn.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+                self._last_prune = now
+
+            merged = _merge_charges(charges)
+            tokens: Dict[str, float] = {}
+            waits: Dict[str, float] = {}
+            for key, (rate, burst, cost) in merged.items():
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens[key] = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                waits[key] = 0.0 if tokens[key] >= cost else (cost - tokens[key]) / rate
+
+            allowed = not any(waits.values())
+            for key, (rate, burst, cost) in merged.items():
+                left = tokens[key] - cost if allowed else tokens[key]
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    (key, left, now, now + (burst - left) / rate)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [waits[key] for key, _, _, _ in charges]
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return (await self.take_all([(key, rate, burst, cost)]))[0]
+
+    async def take_all(self, charges: List[Charge]) -> List[float]:
+        """Spend every charge or none, in one transaction; returns each charge's wait"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._take_all_sync, charges)
+
+
+class TokenBucketLimiter:
+    """A rate (tokens/second) and burst size applied to any key"""
+
+    def __init__(self, rate: float, burst: float, store):
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+
+    async def check(self, key: str, cost: float = 1.0) -> float:
+        """
+        Returns 0 if the request may proceed, otherwise the Retry-After in seconds.
+        A cost above the burst is charged as the whole burst, so it can still pass.
+        """
+        if self.rate <= 0:
+            return 0.0
+        return await self.store.take(key, self.rate, self.burst, min(cost, self.burst))
+
+
+async def check_all(charges: List[Tuple[TokenBucketLimiter, str, float]]) -> List[float]:
+    """
+    Charge (limiter, key, cost) triples all or nothing: returns each one's
+    Retry-After in seconds, all 0 when every bucket had the tokens. The
+    limiters must share one store; disabled limiters (rate <= 0) always pass.
+    """
+    active = [(i, limiter, key, cost) for i, (limiter, key, cost) in enumerate(charges) if limiter.rate > 0]
+    waits = [0.0] * len(charges)
+    if not active:
+        return waits
+    stores = {id(limiter.store): limiter.store for _, limiter, _, _ in active}
+    if len(stores) > 1:
+        raise ValueError("check_all() needs limiters that share one bucket store")
+    store = next(iter(stores.values()))
+    taken = await store.take_all([(key, limiter.rate, limiter.burst, min(cost, limiter.burst))
+                                  for _, limiter, key, cost in active])
+    for (i, _, _, _), wait in zip(active, taken):
+        waits[i] = wait
+    return waits
+
+
+def create_bucket_store(backend: str, db_path: Optional[str] = None, prune_interval: float = 60.0):
+    if backend == "sqlite":
+        return SQLiteBucketStore(db_path, prune_interval=prune_interval)
+    if backend == "memory":
+        return MemoryBucketStore(prune_interval=prune_interval)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
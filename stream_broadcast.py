@@ -0,0 +1,234 @@
+"""
+Fan-out of one upstream Telegram fetch to many concurrent /stream viewers
+A Broadcast reads a file once and keeps a sliding window of the most
+recent bytes (a ring of chunks). Viewers attach at their own offset and
+read from the window; a viewer that falls behind the window (or asks for
+an offset the window cannot serve) continues with its own fetch. Upstream
+traffic therefore scales with distinct files per worker, not with viewers.
+
+The upstream reader stays at most `lead` bytes ahead of its leading
+viewer, and every ring in the worker is charged against one RingBudget.
+While the budget is used up, rings keep only what their leading viewer
+has not read yet and stop reading ahead (slower viewers carry on with
+their own fetch), and new viewers stream directly instead of starting
+a broadcast.
+"""
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from metrics import metrics
+
+# fetch(offset, length) -> async iterator of bytes for [offset, offset + length)
+FetchFunc = Callable[[int, Optional[int]], AsyncIterator[bytes]]
+
+
+class FellBehind(Exception):
+    """The window no longer holds the viewer's next byte"""
+
+    def __init__(self, offset: int):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class RingBudget:
+    """Bytes held by all broadcast rings of this worker, against max_bytes (0 = no limit)"""
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return 0 < self.max_bytes <= self.used
+
+    def charge(self, nbytes: int):
+        self.used += nbytes
+        metrics.set_gauge("uxb_stream_broadcast_bytes", self.used)
+
+    def release(self, nbytes: int):
+        self.charge(-nbytes)
+
+
+class Broadcast:
+    """One shared upstream reader with a window of `window` bytes, reading at most `lead` ahead"""
+
+    def __init__(self, key: Hashable, fetch: FetchFunc, start: int, file_size: int, window: int,
+                 lead: Optional[int] = None, budget: Optional[RingBudget] = None):
+        self.key = key
+        self.fetch = fetch
+        self.file_size = file_size
+        self.window = window
+        self.lead = window // 2 if lead is None else min(lead, window)
+        self.budget = budget if budget is not None else RingBudget()
+        # (offset, chunk), oldest first
+        self.ring: Deque[Tuple[int, bytes]] = deque()
+        self.ring_start = start
+        self.position = start  # end of the data received so far
+        self.buffered = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.viewers: Dict[int, int] = {}  # viewer id -> next offset it needs
+        self._next_viewer = 0
+        self._data = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- upstream ----------
+    def start(self):
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.fetch(self.position, None):
+                # Never run more than `lead` ahead of the leading viewer (or of the
+                # start, before anyone has attached), nor ahead at all once the budget is used up
+                while self.position - self._leader() > (0 if self.budget.exhausted else self.lead):
+                    self._progress.clear()
+                    await self._progress.wait()
+                self.ring.append((self.position, chunk))
+                self.position += len(chunk)
+                self.buffered += len(chunk)
+                self.budget.charge(len(chunk))
+                metrics.inc("uxb_stream_upstream_bytes_total", len(chunk), mode="shared")
+                self._trim()
+                self._wake()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+
+    def _leader(self) -> int:
+        return max(self.viewers.values()) if self.viewers else self.ring_start
+
+    def _trim(self):
+        """
+        Keep the ring within the window; over budget, also drop everything
+        behind the leading viewer (slower viewers continue on their own fetch)
+        """
+        leader = self._leader()
+        while len(self.ring) > 1:
+            offset, old = self.ring[0]
+            if self.buffered <= self.window and not (self.budget.exhausted and offset + len(old) <= leader):
+                break
+            self.ring.popleft()
+            self.buffered -= len(old)
+            self.budget.release(len(old))
+            self.ring_start = offset + len(old)
+
+    def _wake(self):
+        self._data.set()
+        self._data = asyncio.Event()
+
+    def stop(self):
+        """Stop reading upstream and give the ring's memory back to the budget"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self.budget.release(self.buffered)
+        self.ring.clear()
+        self.buffered = 0
+        self.ring_start = self.position
+
+    # ---------- viewers ----------
+    def can_attach(self, offset: int) -> bool:
+        if self.error is not None:
+            return False
+        if self.done:
+            return self.ring_start <= offset <= self.position
+        return self.ring_start <= offset <= self.position + self.lead
+
+    def _slice(self, offset: int) -> Optional[bytes]:
+        for chunk_offset, chunk in self.ring:
+            if chunk_offset <= offset < chunk_offset + len(chunk):
+                return chunk[offset - chunk_offset:]
+        return None
+
+    async def read(self, offset: int, end: int):
+        """Yield bytes [offset, end) from the window; raises FellBehind to hand over"""
+        viewer = self._next_viewer
+        self._next_viewer += 1
+        self.viewers[viewer] = offset
+        try:
+            while offset < end:
+                if offset < self.ring_start:
+                    raise FellBehind(offset)
+                if offset < self.position:
+                    data = self._slice(offset)
+                    if data is None:
+                        raise FellBehind(offset)
+                    data = data[:end - offset]
+                    offset += len(data)
+                    self.viewers[viewer] = offset
+                    self._progress.set()
+                    yield data
+                    continue
+                if self.done:
+                    if self.error is not None or offset < min(end, self.file_size):
+                        raise FellBehind(offset)
+                    return
+                await self._data.wait()
+        finally:
+            del self.viewers[viewer]
+            self._progress.set()
+
+
+class BroadcastHub:
+    """
+    Per-worker registry of live broadcasts, keyed by file. lead caps how far
+    each upstream reader runs ahead of its viewers; max_bytes is the budget
+    for all rings together (0 = no limit).
+    """
+
+    def __init__(self, window: int, lead: Optional[int] = None, max_bytes: int = 0):
+        self.window = window
+        self.lead = lead
+        self.budget = RingBudget(max_bytes)
+        self.broadcasts: Dict[Hashable, Broadcast] = {}
+
+    async def stream(self, key: Hashable, fetch: FetchFunc, offset: int, end: int, file_size: int):
+        """
+        Yield bytes [offset, end] (inclusive) of the file, sharing the upstream
+        fetch with other viewers of the same key whenever possible
+        """
+        stop = end + 1
+        broadcast = self.broadcasts.get(key)
+        if broadcast is None or (broadcast.done and not broadcast.viewers):
+            if broadcast is not None:
+                broadcast.stop()
+                del self.broadcasts[key]
+            if self.budget.exhausted:
+                broadcast = None
+                metrics.inc("uxb_stream_broadcast_skipped_total", reason="budget")
+            else:
+                broadcast = Broadcast(key, fetch, offset, file_size, self.window, self.lead, self.budget)
+                self.broadcasts[key] = broadcast
+                broadcast.start()
+        elif not broadcast.can_attach(offset):
+            broadcast = None
+
+        if broadcast is not None:
+            metrics.add_gauge("uxb_stream_shared_viewers", 1)
+            reader = broadcast.read(offset, stop)
+            try:
+                async for chunk in reader:
+                    offset += len(chunk)
+                    yield chunk
+            except FellBehind as e:
+                offset = e.offset
+            finally:
+                metrics.add_gauge("uxb_stream_shared_viewers", -1)
+                await reader.aclose()
+                if not broadcast.viewers and self.broadcasts.get(key) is broadcast:
+                    broadcast.stop()
+                    del self.broadcasts[key]
+
+        # Own fetch for whatever the broadcast could not serve
+        if offset < stop:
+            source = fetch(offset, stop - offset)
+            try:
+                async for chunk in source:
+                    metrics.inc("uxb_stream_upstream_bytes_total", len(chunk), mode="direct")
+                    yield chunk
+            finally:
+                await source.aclose()
@@ -0,0 +1,358 @@
+"""
+Caches in front of the Telegram fetch used by /stream
+    - PrefixCache: the first and last few hundred KB of each file on disk,
+      so player probes (header, MP4 moov atom) are answered without
+      waiting on Telegram
+    - ChunkCache: aligned chunks of partially watched files on disk, with a
+      per-file bitmap of the chunks present and chunk-granular eviction
+    - HotChunkLRU: byte-budgeted in-memory LRU of recent chunks in front of
+      the ChunkCache, served as memoryview slices (no copies)
+"""
+import os
+import asyncio
+import tempfile
+from pathlib import Path
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+
+from metrics import metrics
+from temp_janitor import TempJanitor
+
+# fetch(offset, length) -> async iterator of bytes for [offset, offset + length)
+FetchFunc = Callable[[int, Optional[int]], AsyncIterator[bytes]]
+
+
+async def _collect(source: AsyncIterator[bytes]) -> bytes:
+    parts = []
+    try:
+        async for chunk in source:
+            parts.append(chunk)
+    finally:
+        close = getattr(source, "aclose", None)
+        if close is not None:
+            await close()
+    return b"".join(parts)
+
+
+class PrefixCache:
+    """
+    <key>.head holds bytes [0, head_bytes) and <key>.tail the last
+    tail_bytes of a file. The directory is budgeted with a TempJanitor
+    (LRU eviction once max_bytes is exceeded).
+    """
+
+    def __init__(self, cache_dir: str, head_bytes: int, tail_bytes: int, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.enabled = max_bytes > 0 and (head_bytes > 0 or tail_bytes > 0)
+        self.janitor = TempJanitor(str(self.cache_dir), max_bytes=max_bytes)
+        self._filling: Dict[str, asyncio.Task] = {}
+        if self.enabled:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self.janitor.reconcile()
+            except OSError as e:
+                print(f"Warning: Could not create prefix cache directory: {e}")
+                self.enabled = False
+
+    def _path(self, key: str, part: str) -> Path:
+        return self.cache_dir / f"{key}.{part}"
+
+    # ---------- filling ----------
+    def _write(self, path: Path, data: bytes):
+        fd, tmp_name = tempfile.mkstemp(dir=str(self.cache_dir), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            self.janitor.install(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    async def _fill(self, key: str, fetch: FetchFunc, file_size: int):
+        head_len = min(self.head_bytes, file_size)
+        if head_len and not self._path(key, "head").exists():
+            self._write(self._path(key, "head"), await _collect(fetch(0, head_len)))
+        tail_start = max(file_size - self.tail_bytes, head_len)
+        if tail_start < file_size and not self._path(key, "tail").exists():
+            self._write(self._path(key, "tail"), await _collect(fetch(tail_start, file_size - tail_start)))
+        self.janitor.maybe_sweep()
+
+    def ensure(self, key: str, fetch: FetchFunc, file_size: int) -> Optional[asyncio.Task]:
+        """Start filling key in the background unless it is cached or already filling"""
+        if not self.enabled or file_size <= 0 or key in self._filling:
+            return self._filling.get(key)
+        head_missing = not self._path(key, "head").exists()
+        tail_missing = file_size > self.head_bytes and not self._path(key, "tail").exists()
+        if not (head_missing or tail_missing):
+            return None
+
+        async def run():
+            try:
+                await self._fill(key, fetch, file_size)
+            except Exception as e:
+                print(f"Prefix cache fill error for {key}: {e}")
+            finally:
+                self._filling.pop(key, None)
+
+        task = self._filling[key] = asyncio.ensure_future(run())
+        return task
+
+    # ---------- serving ----------
+    async def _read_part(self, path: Path, offset: int, length: int) -> Optional[bytes]:
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                await f.seek(offset)
+                data = await f.read(length)
+        except OSError:
+            return None
+        self.janitor.touch(path)
+        return data
+
+    async def read(self, key: str, start: int, end: int, file_size: int) -> bytes:
+        """
+        Cached bytes beginning at start (inclusive range end), possibly only
+        the first part of [start, end]; empty when nothing usable is cached
+        """
+        if not self.enabled:
+            return b""
+        data = b""
+        head = self._path(key, "head")
+        tail = self._path(key, "tail")
+        if start < self.head_bytes and head.exists():
+            data = await self._read_part(head, start, end - start + 1) or b""
+        else:
+            try:
+                tail_len = tail.stat().st_size
+            except OSError:
+                tail_len = 0
+            tail_start = file_size - tail_len
+            if tail_len and start >= tail_start:
+                data = await self._read_part(tail, start - tail_start, end - start + 1) or b""
+        metrics.inc("uxb_prefix_cache_requests_total", result="hit" if data else "miss")
+        return data
+
+
+class HotChunkLRU:
+    """(key, chunk index) -> chunk bytes, least recently used evicted past max_bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.resident_bytes = 0
+
+    def get(self, key: str, index: int) -> Optional[bytes]:
+        data = self.chunks.get((key, index))
+        metrics.inc("uxb_hot_cache_requests_total", result="hit" if data is not None else "miss")
+        if data is not None:
+            self.chunks.move_to_end((key, index))
+        return data
+
+    def contains(self, key: str, index: int) -> bool:
+        return (key, index) in self.chunks
+
+    def put(self, key: str, index: int, data: bytes):
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        old = self.chunks.pop((key, index), None)
+        if old is not None:
+            self.resident_bytes -= len(old)
+        self.chunks[(key, index)] = data
+        self.resident_bytes += len(data)
+        while self.resident_bytes > self.max_bytes:
+            _, evicted = self.chunks.popitem(last=False)
+            self.resident_bytes -= len(evicted)
+        metrics.set_gauge("uxb_hot_cache_resident_bytes", self.resident_bytes)
+
+
+class ChunkCache:
+    """
+    Chunk store: chunk i of a file (bytes [i * chunk_size, (i + 1) * chunk_size))
+    is the file <key>.<i>.chunk. A bitmap per key records which chunks this
+    worker knows to be present; a miss still checks the disk, so chunks
+    written by other workers are adopted. Eviction is LRU per chunk through
+    a TempJanitor limited to max_bytes. An optional HotChunkLRU is consulted
+    before the disk and keeps every chunk loaded or fetched.
+    """
+
+    def __init__(self, cache_dir: str, chunk_size: int, max_bytes: int,
+                 hot: Optional[HotChunkLRU] = None):
+        self.cache_dir = Path(cache_dir)
+        self.chunk_size = chunk_size
+        self.hot = hot if hot is not None and hot.max_bytes > 0 else None
+        self.enabled = max_bytes > 0 and chunk_size > 0
+        self.bitmaps: Dict[str, bytearray] = {}
+        self.janitor = TempJanitor(str(self.cache_dir), max_bytes=max_bytes, on_delete=self._evicted)
+        if self.enabled:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self.janitor.reconcile()
+            except OSError as e:
+                print(f"Warning: Could not create chunk cache directory: {e}")
+                self.enabled = False
+            for path in list(self.janitor.entries):
+                parsed = self._parse(path)
+                if parsed:
+                    self._set_bit(parsed[0], parsed[1], True)
+
+    # ---------- bitmap ----------
+    def _path(self, key: str, index: int) -> Path:
+        return self.cache_dir / f"{key}.{index}.chunk"
+
+    @staticmethod
+    def _parse(path: str) -> Optional[Tuple[str, int]]:
+        parts = os.path.basename(path).rsplit(".", 2)
+        if len(parts) != 3 or parts[2] != "chunk" or not parts[1].isdigit():
+            return None
+        return parts[0], int(parts[1])
+
+    def _set_bit(self, key: str, index: int, present: bool):
+        bitmap = self.bitmaps.get(key)
+        if bitmap is None:
+            if not present:
+                return
+            bitmap = self.bitmaps[key] = bytearray()
+        byte, bit = divmod(index, 8)
+        if byte >= len(bitmap):
+            if not present:
+                return
+            bitmap.extend(b"\0" * (byte + 1 - len(bitmap)))
+        if present:
+            bitmap[byte] |= 1 << bit
+        else:
+            bitmap[byte] &= ~(1 << bit) & 0xFF
+            if not any(bitmap):
+                del self.bitmaps[key]
+
+    def has_chunk(self, key: str, index: int) -> bool:
+        bitmap = self.bitmaps.get(key)
+        byte, bit = divmod(index, 8)
+        return bitmap is not None and byte < len(bitmap) and bool(bitmap[byte] & (1 << bit))
+
+    def present_ranges(self, key: str, file_size: int) -> List[Tuple[int, int]]:
+        """Cached byte ranges of a file as inclusive (start, end) pairs"""
+        ranges: List[Tuple[int, int]] = []
+        chunks = (file_size + self.chunk_size - 1) // self.chunk_size
+        for index in range(chunks):
+            if not self.has_chunk(key, index):
+                continue
+            start = index * self.chunk_size
+            end = min(start + self.chunk_size, file_size) - 1
+            if ranges and ranges[-1][1] == start - 1:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _evicted(self, path: str):
+        parsed = self._parse(path)
+        if parsed:
+            self._set_bit(parsed[0], parsed[1], False)
+
+    # ---------- chunk I/O ----------
+    def _might_have(self, key: str, index: int) -> bool:
+        if self.hot is not None and self.hot.contains(key, index):
+            return True
+        return self.enabled and (self.has_chunk(key, index) or self._path(key, index).exists())
+
+    async def _load(self, key: str, index: int) -> Optional[bytes]:
+        if self.hot is not None:
+            data = self.hot.get(key, index)
+            if data is not None:
+                return data
+        if not self.enabled:
+            return None
+        path = self._path(key, index)
+        if not self.has_chunk(key, index) and not path.exists():
+            return None
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+        except OSError:
+            # Evicted by another worker
+            self._set_bit(key, index, False)
+            self.janitor.forget(path)
+            return None
+        self._set_bit(key, index, True)
+        self.janitor.touch(path)
+        if self.hot is not None:
+            self.hot.put(key, index, data)
+        return data
+
+    async def _store(self, key: str, index: int, data: bytes):
+        if self.hot is not None:
+            self.hot.put(key, index, data)
+        if not self.enabled:
+            return
+        path = self._path(key, index)
+        fd, tmp_name = tempfile.mkstemp(dir=str(self.cache_dir), prefix=".tmp-")
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_name, "wb") as f:
+                await f.write(data)
+            self.janitor.install(tmp_name, path)
+        except OSError as e:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            print(f"Warning: Could not store chunk {path.name}: {e}")
+            return
+        self._set_bit(key, index, True)
+        self.janitor.maybe_sweep()
+
+    # ---------- serving ----------
+    async def stream(self, key: str, fetch: FetchFunc, start: int, end: int, file_size: int):
+        """
+        Yield bytes [start, end] (inclusive), stitched from cached chunks and
+        fetched runs of missing chunks; fetched chunks are stored on the way.
+        Cached chunks are yielded as memoryview slices, so overlapping ranges
+        share one buffer.
+        """
+        if not self.enabled and self.hot is None:
+            source = fetch(start, end - start + 1)
+            try:
+                async for chunk in source:
+                    yield chunk
+            finally:
+                await source.aclose()
+            return
+
+        size = self.chunk_size
+        index = start // size
+        last = end // size
+        while index <= last:
+            data = await self._load(key, index)
+            if data is not None:
+                metrics.inc("uxb_chunk_cache_requests_total", result="hit")
+                base = index * size
+                yield memoryview(data)[max(start - base, 0):end - base + 1]
+                index += 1
+                continue
+
+            # Fetch the whole run of missing chunks in one upstream request
+            run_end = index + 1
+            while run_end <= last and not self._might_have(key, run_end):
+                run_end += 1
+            metrics.inc("uxb_chunk_cache_requests_total", run_end - index, result="miss")
+            run_start = index * size
+            run_stop = min(run_end * size, file_size)
+            pending = bytearray()
+            source = fetch(run_start, run_stop - run_start)
+            try:
+                async for piece in source:
+                    pending += piece
+                    # Emit full chunks, and the short last chunk of the file
+                    while len(pending) >= size or (pending and index * size + len(pending) >= run_stop):
+                        data = bytes(pending[:size])
+                        del pending[:size]
+                        await self._store(key, index, data)
+                        base = index * size
+                        yield memoryview(data)[max(start - base, 0):end - base + 1]
+                        index += 1
+            finally:
+                await source.aclose()
+            if index < run_end:
+                raise IOError(f"Upstream ended early at chunk {index} of {key}")
@@ -0,0 +1,526 @@
+"""
+Flow control for file streams served by the API server
+    - BandwidthScheduler: per-stream and global byte-rate ceilings with
+      weighted fair sharing of the global rate among streams that are
+      currently sending
+    - ReadAheadBuffer: bounded, adaptive read-ahead between an upstream
+      chunk source and the HTTP writer
+    - CancellableStreamingResponse: stops the body generator (and with it
+      every upstream fetch) as soon as the client disconnects
+    - AdmissionController: caps concurrently served streams, with a bounded
+      wait queue in which range continuations go first; with SharedSlots
+      the cap holds across worker processes
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Set
+
+from starlette.responses import StreamingResponse
+
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: admission is per process only
+    fcntl = None
+
+
+class StreamShare:
+    """
+    One stream's slot in the scheduler. Pacing uses a virtual clock:
+    every chunk pushes next_send forward by len(chunk) / current rate.
+    The stream counts as sending until IDLE_GRACE seconds past next_send;
+    after that (slow client, stalled upstream) its share goes to the others.
+    """
+
+    # Allow up to this much "saved" time so short pauses do not turn into bursts
+    MAX_BURST_SECONDS = 0.25
+    IDLE_GRACE = 0.25
+
+    def __init__(self, scheduler: "BandwidthScheduler", weight: float):
+        self.scheduler = scheduler
+        self.weight = weight
+        self.next_send = time.monotonic()
+        self.bytes_sent = 0
+
+    def is_sending(self, now: float) -> bool:
+        return now < self.next_send + self.IDLE_GRACE
+
+    async def throttle(self, nbytes: int):
+        """Sleep as long as needed to keep this stream within its share"""
+        self.bytes_sent += nbytes
+        now = time.monotonic()
+        rate = self.scheduler.rate_for(self, now)
+        if rate <= 0:
+            self.next_send = now
+            return
+        self.next_send = max(self.next_send, now - self.MAX_BURST_SECONDS) + nbytes / rate
+        delay = self.next_send - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def close(self):
+        self.scheduler.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class BandwidthScheduler:
+    """
+    Splits global_rate among the streams that are currently sending, in
+    proportion to their weight, capped at per_stream_rate * weight; open
+    streams that sit idle do not hold bandwidth back from the others. A
+    rate of 0 means unlimited.
+    """
+
+    def __init__(self, global_rate: float = 0, per_stream_rate: float = 0):
+        self.global_rate = global_rate
+        self.per_stream_rate = per_stream_rate
+        self.active: Set[StreamShare] = set()
+
+    def open(self, weight: float = 1.0) -> StreamShare:
+        share = StreamShare(self, weight)
+        self.active.add(share)
+        return share
+
+    def release(self, share: StreamShare):
+        self.active.discard(share)
+
+    def sending_weight(self, share: StreamShare, now: float) -> float:
+        """Weight of the streams competing with share right now, share included"""
+        weight = share.weight
+        for other in self.active:
+            if other is not share and other.is_sending(now):
+                weight += other.weight
+        return weight
+
+    def rate_for(self, share: StreamShare, now: Optional[float] = None) -> float:
+        rate = 0.0
+        if self.global_rate > 0:
+            if now is None:
+                now = time.monotonic()
+            rate = self.global_rate * share.weight / self.sending_weight(share, now)
+        if self.per_stream_rate > 0:
+            cap = self.per_stream_rate * share.weight
+            rate = min(rate, cap) if rate > 0 else cap
+        return rate
+
+
+class ReadAheadBuffer:
+    """
+    Reads upstream chunks in a background task while the client drains
+    earlier ones. The target depth (bytes) doubles whenever the client
+    finds the buffer empty and is capped at horizon seconds of the
+    observed client drain rate, so slow clients do not pin memory;
+    max_bytes is a hard ceiling. Use as: async for chunk in buffer.
+    """
+
+    # Weight of the newest sample in the drain-rate moving average
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, source: AsyncIterator[bytes], min_bytes: int, max_bytes: int,
+                 horizon: float = 2.0, route: str = "stream"):
+        self.source = source
+        self.min_bytes = min_bytes
+        self.max_bytes = max(max_bytes, min_bytes)
+        self.horizon = horizon
+        self.route = route
+        self.target = min_bytes
+        self.chunks: Deque[bytes] = deque()
+        self.buffered = 0
+        self.drain_rate = 0.0
+        self.upstream_stall = 0.0
+        self.client_stall = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._data = asyncio.Event()
+        self._space = asyncio.Event()
+        self._last_return: Optional[float] = None
+        self._last_size = 0
+
+    async def _fill(self):
+        try:
+            async for chunk in self.source:
+                # Always admit one chunk, otherwise wait until the client makes room
+                while self.chunks and self.buffered + len(chunk) > self.target:
+                    self._space.clear()
+                    started = time.monotonic()
+                    await self._space.wait()
+                    self._record_stall("client", time.monotonic() - started)
+                self.chunks.append(chunk)
+                self.buffered += len(chunk)
+                metrics.add_gauge("uxb_stream_buffer_bytes", len(chunk), route=self.route)
+                self._data.set()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._data.set()
+
+    def _record_stall(self, side: str, seconds: float):
+        if side == "upstream":
+            self.upstream_stall += seconds
+        else:
+            self.client_stall += seconds
+        metrics.inc("uxb_stream_stall_seconds_total", seconds, route=self.route, side=side)
+
+    def _adapt(self, stalled: bool):
+        now = time.monotonic()
+        if self._last_return is not None and self._last_size:
+            interval = max(now - self._last_return, 1e-6)
+            sample = self._last_size / interval
+            if self.drain_rate:
+                sample = self.EWMA_ALPHA * sample + (1 - self.EWMA_ALPHA) * self.drain_rate
+            self.drain_rate = sample
+        target = self.target * 2 if stalled else self.target
+        if self.drain_rate:
+            target = min(target, self.drain_rate * self.horizon)
+        self.target = int(min(max(target, self.min_bytes), self.max_bytes))
+
+    def start(self):
+        """Begin reading ahead now (otherwise the first iteration starts it)"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._fill())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        self.start()
+        stalled = False
+        while not self.chunks:
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._data.clear()
+            started = time.monotonic()
+            await self._data.wait()
+            if self._last_return is not None:
+                # Waiting for the very first chunk is latency, not a stall
+                stalled = True
+                self._record_stall("upstream", time.monotonic() - started)
+        self._adapt(stalled)
+
+        chunk = self.chunks.popleft()
+        self.buffered -= len(chunk)
+        metrics.add_gauge("uxb_stream_buffer_bytes", -len(chunk), route=self.route)
+        self._space.set()
+        self._last_return = time.monotonic()
+        self._last_size = len(chunk)
+        return chunk
+
+    async def aclose(self):
+        """Stop reading ahead and release buffered chunks"""
+        # Synchronous part first: it must happen even if this await is cancelled
+        task = self._task
+        if task is not None and not task.done():
+            task.cancel()
+        if self.buffered:
+            metrics.add_gauge("uxb_stream_buffer_bytes", -self.buffered, route=self.route)
+        self.chunks.clear()
+        self.buffered = 0
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        close = getattr(self.source, "aclose", None)
+        if close is not None:
+            await close()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that watches for http.disconnect while sending and
+    cancels the body generator immediately, instead of noticing only when
+    the next write fails. The generator sees CancelledError at whatever it
+    is awaiting, so its finally blocks release upstream fetches and buffers.
+    on_disconnect() is called once when that happens.
+    """
+
+    def __init__(self, content, on_disconnect: Optional[Callable[[], None]] = None,
+                 on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_disconnect = on_disconnect
+        self.on_close = on_close
+        self.disconnected = False
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self._send_until_disconnect(receive, send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    async def _send_until_disconnect(self, receive, send):
+        async def wait_for_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+
+        sender = asyncio.ensure_future(self.stream_response(send))
+        watcher = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not sender.done():
+                self.disconnected = True
+                sender.cancel()
+            watcher.cancel()
+            for task in (sender, watcher):
+                try:
+                    await task
+                except (asyncio.CancelledError, OSError):
+                    pass
+        if self.disconnected:
+            if self.on_disconnect is not None:
+                self.on_disconnect()
+            return
+        if self.background is not None:
+            await self.background()
+
+
+class AdmissionRejected(Exception):
+    """No slot could be granted; retry_after is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SharedSlots:
+    """
+    max_slots stream slots shared by every worker process: slot i is the
+    lock file slot-<i>.lock in directory and is held while this process
+    has an exclusive flock() on it. The kernel drops the locks of a worker
+    that dies, so slots cannot leak.
+    """
+
+    def __init__(self, directory: str, max_slots: int):
+        os.makedirs(directory, exist_ok=True)
+        self.fds = [os.open(os.path.join(directory, f"slot-{i}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                    for i in range(max_slots)]
+        self.held: Set[int] = set()
+
+    @classmethod
+    def create(cls, directory: str, max_slots: int) -> Optional["SharedSlots"]:
+        """SharedSlots, or None where file locks are unavailable"""
+        if fcntl is None or max_slots <= 0:
+            return None
+        try:
+            return cls(directory, max_slots)
+        except OSError as e:
+            print(f"Warning: Could not create shared stream slots in {directory}: {e}")
+            return None
+
+    def try_acquire(self) -> Optional[int]:
+        for index, fd in enumerate(self.fds):
+            if index in self.held:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue  # held by another worker
+            self.held.add(index)
+            return index
+        return None
+
+    def release(self, index: int):
+        if index in self.held:
+            self.held.remove(index)
+            fcntl.flock(self.fds[index], fcntl.LOCK_UN)
+
+
+class AdmissionTicket:
+    """One request's claim on a stream slot; release() is idempotent"""
+
+    def __init__(self, controller: "AdmissionController", session: Optional[str], continuation: bool):
+        self.controller = controller
+        self.session = session
+        self.continuation = continuation
+        self.admitted = False
+        self.released = False
+        # Shared slot index, or LOCAL_SLOT
+        self.slot = AdmissionController.LOCAL_SLOT
+
+    async def acquire(self):
+        self.slot = await self.controller._acquire(self)
+        self.admitted = True
+
+    def release(self):
+        if self.admitted and not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    At most max_active admitted streams; up to max_queue more wait at most
+    queue_timeout seconds for a slot. Freed slots go to queued range
+    continuations of a session (client + link) that is active or was seen
+    within session_window seconds, before other waiters. max_active <= 0
+    disables the cap.
+    With `slots` (SharedSlots for max_active) the cap is shared by all
+    workers: a slot freed in this worker goes straight to a local waiter,
+    and slots freed elsewhere are polled for every POLL_INTERVAL seconds.
+    """
+
+    # Slot token of a process-local admission (no shared slot behind it)
+    LOCAL_SLOT = -1
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, max_active: int, max_queue: int, queue_timeout: float, session_window: float = 30.0,
+                 slots: Optional[SharedSlots] = None):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_window = session_window
+        self.slots = slots if max_active > 0 else None
+        self.active = 0
+        self.draining = False
+        self.priority_waiters: Deque[asyncio.Future] = deque()
+        self.waiters: Deque[asyncio.Future] = deque()
+        # session -> [active tickets, last release time]
+        self.sessions: Dict[str, list] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def queued(self) -> int:
+        return len(self.priority_waiters) + len(self.waiters)
+
+    def is_continuation(self, session: Optional[str]) -> bool:
+        state = self.sessions.get(session) if session else None
+        return state is not None and (state[0] > 0 or time.monotonic() - state[1] < self.session_window)
+
+    def ticket(self, session: Optional[str] = None, is_range: bool = False) -> AdmissionTicket:
+        return AdmissionTicket(self, session, is_range and self.is_continuation(session))
+
+    def _retry_after(self) -> float:
+        return max(1.0, self.queue_timeout)
+
+    def _publish(self):
+        metrics.set_gauge("uxb_admission_active", self.active)
+        metrics.set_gauge("uxb_admission_queued", self.queued)
+
+    def set_draining(self, draining: bool):
+        """While draining, new and queued requests are rejected; admitted ones finish"""
+        self.draining = draining
+        if draining:
+            for queue in (self.priority_waiters, self.waiters):
+                while queue:
+                    waiter = queue.popleft()
+                    if not waiter.done():
+                        waiter.set_exception(AdmissionRejected("draining", self._retry_after()))
+            self._publish()
+
+    def _take(self) -> Optional[int]:
+        """Claim a free slot (a token for _free), or None when all are in use"""
+        if self.max_active > 0 and self.active >= self.max_active:
+            return None
+        slot = self.LOCAL_SLOT
+        if self.slots is not None:
+            slot = self.slots.try_acquire()
+            if slot is None:
+                return None
+        self.active += 1
+        return slot
+
+    def _free(self, slot: int):
+        self.active -= 1
+        if self.slots is not None and slot != self.LOCAL_SLOT:
+            self.slots.release(slot)
+
+    def _grant(self, slot: int) -> bool:
+        """Hand a slot to the next waiter; False when nobody is waiting"""
+        for queue in (self.priority_waiters, self.waiters):
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(slot)
+                    return True
+        return False
+
+    def _handoff(self, slot: int):
+        """Give the slot of a finished stream to the next waiter, or free it"""
+        if not self._grant(slot):
+            self._free(slot)
+
+    async def _poll_shared(self):
+        """While requests are queued, pick up slots released by other workers"""
+        try:
+            while self.queued:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                while self.queued:
+                    slot = self._take()
+                    if slot is None:
+                        break
+                    self._handoff(slot)
+                self._publish()
+        finally:
+            self._poller = None
+
+    async def _acquire(self, ticket: AdmissionTicket) -> int:
+        if self.draining:
+            metrics.inc("uxb_admission_rejected_total", reason="draining")
+            raise AdmissionRejected("draining", self._retry_after())
+        slot = self._take()
+        if slot is None:
+            if self.queued >= self.max_queue:
+                metrics.inc("uxb_admission_rejected_total", reason="queue_full")
+                raise AdmissionRejected("queue_full", self._retry_after())
+            waiter = asyncio.get_event_loop().create_future()
+            queue = self.priority_waiters if ticket.continuation else self.waiters
+            queue.append(waiter)
+            if self.slots is not None and self._poller is None:
+                self._poller = asyncio.ensure_future(self._poll_shared())
+            self._publish()
+            started = time.monotonic()
+            try:
+                # A released slot is transferred to us; active is unchanged
+                slot = await asyncio.wait_for(waiter, self.queue_timeout)
+            except AdmissionRejected:
+                metrics.inc("uxb_admission_rejected_total", reason="draining")
+                raise
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    # The slot was handed over just as we gave up: pass it on
+                    self._handoff(waiter.result())
+                elif waiter in queue:
+                    queue.remove(waiter)
+                self._publish()
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.inc("uxb_admission_rejected_total", reason="timeout")
+                    raise AdmissionRejected("timeout", self._retry_after())
+                raise
+            finally:
+                metrics.observe("uxb_admission_wait_seconds", time.monotonic() - started)
+        if ticket.session:
+            state = self.sessions.setdefault(ticket.session, [0, 0.0])
+            state[0] += 1
+        self._publish()
+        return slot
+
+    def _release(self, ticket: AdmissionTicket):
+        now = time.monotonic()
+        if ticket.session and ticket.session in self.sessions:
+            state = self.sessions[ticket.session]
+            state[0] -= 1
+            state[1] = now
+        self._handoff(ticket.slot)
+        # Forget idle sessions that can no longer count as continuations
+        if len(self.sessions) > 1024:
+            stale = [key for key, (count, seen) in self.sessions.items()
+                     if count <= 0 and now - seen >= self.session_window]
+            for key in stale:
+                del self.sessions[key]
+        self._publish()
@@ -6,21 +6,173 @@ Author: Modified for File-Sharing Bot
 
 import json
 import os
+import re
 import time
+import sqlite3
+import asyncio
+import inspect
 import tempfile
 import datetime as dt
-from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Union, Callable, Awaitable, AsyncIterator
 from dataclasses import dataclass, asdict
 from pathlib import Path
 
 
-from config import TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH, DATABASE_PATH
+from config import (
+    TEMP_PATH, CHANNEL_ID, ADMINS, APP_PATH, DATABASE_PATH, TG_PARALLEL_PARTS, TG_PART_SIZE,
+    TG_STREAM_RETRIES, TG_STREAM_BACKOFF, TG_FLOOD_WAIT_MAX
+)
 if TEMP_PATH is None or TEMP_PATH == "":
     TEMP_PATH = Path(tempfile.gettempdir()) / "tg_gdrive_cache"
 # ---------- config ----------
 TEMP_DIR = Path(TEMP_PATH)
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Telegram serves files in requests of at most 1 MB that may not cross a 1 MB
+# boundary; any part size that is a multiple of 4 KB and divides 1 MB is valid
+TG_MAX_PART_SIZE = 1024 * 1024
+if TG_PART_SIZE <= 0 or TG_PART_SIZE % 4096 or TG_MAX_PART_SIZE % TG_PART_SIZE:
+    TG_PART_SIZE = TG_MAX_PART_SIZE
+
+# ---------- parallel part fetch ----------
+async def iter_parts_in_order(
+    fetch_part: Callable[[int, int], Awaitable[bytes]],
+    offset: int,
+    end: int,
+    part_size: int = TG_PART_SIZE,
+    parallelism: int = TG_PARALLEL_PARTS,
+) -> AsyncIterator[bytes]:
+    """
+    Yield bytes [offset, end) of a file, fetched as part_size-aligned parts
+    with up to `parallelism` fetch_part(part_offset, part_size) calls in
+    flight. Parts are yielded strictly in order; the first and last are
+    trimmed to the requested range.
+    """
+    next_part = offset - offset % part_size
+    pending = deque()
+    try:
+        while pending or next_part < end:
+            while next_part < end and len(pending) < max(1, parallelism):
+                task = asyncio.ensure_future(fetch_part(next_part, part_size))
+                pending.append((next_part, task))
+                next_part += part_size
+
+            part_offset, task = pending.popleft()
+            data = await task
+            lo = max(offset - part_offset, 0)
+            hi = min(end - part_offset, len(data))
+            if lo < hi:
+                yield data if (lo == 0 and hi == len(data)) else data[lo:hi]
+            if len(data) < part_size:
+                # Short part: end of file
+                break
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+# ---------- resumable streams ----------
+async def iter_resumable(
+    open_source: Callable[[int], AsyncIterator[bytes]],
+    offset: int,
+    end: int,
+    retries: int = TG_STREAM_RETRIES,
+    backoff: float = TG_STREAM_BACKOFF,
+    recover: Optional[Callable[[BaseException, int], Awaitable[Optional[float]]]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yield bytes [offset, end) from open_source(position), reopening it at
+    the last delivered byte when it fails. Up to `retries` consecutive
+    failures (without progress in between) are retried with exponential
+    backoff; recover(error, attempt) may refresh state, re-raise errors
+    that cannot be retried, or return a minimum wait in seconds.
+    """
+    position = offset
+    failures = 0
+    while position < end:
+        source = open_source(position)
+        try:
+            async for chunk in source:
+                position += len(chunk)
+                failures = 0
+                yield chunk
+            return
+        except Exception as e:
+            failures += 1
+            if failures > retries:
+                raise
+            delay = backoff * (2 ** (failures - 1))
+            if recover is not None:
+                delay = max(delay, await recover(e, failures) or 0)
+            print(f"Upstream error at byte {position} ({type(e).__name__}: {e}), "
+                  f"resuming in {delay:.1f}s (attempt {failures}/{retries})")
+            await asyncio.sleep(delay)
+        finally:
+            close = getattr(source, "aclose", None)
+            if close is not None:
+                await close()
+
+# ---------- per-worker sessions ----------
+# telegram-upload's session when the config file does not name one
+DEFAULT_SESSION = "~/.config/telegram-upload"
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def worker_session_config(config_file: str, worker_id: Optional[int] = None) -> str:
+    """
+    Write a copy of the telegram-upload config whose session is a private
+    copy of the configured one (<session>-w<pid>) and return its path.
+    Telethon keeps its session in SQLite, which several processes cannot
+    share, so every API worker logs in from its own copy of the authorized
+    session. Copies left behind by workers that no longer exist are removed.
+    """
+    worker_id = os.getpid() if worker_id is None else worker_id
+    config_path = Path(os.path.expanduser(config_file))
+    with open(config_path) as f:
+        config = json.load(f)
+    session = os.path.expanduser(config.get("session") or DEFAULT_SESSION)
+    if session.endswith(".session"):
+        session = session[:-len(".session")]
+
+    base = Path(session)
+    pattern = re.compile(re.escape(base.name) + r"-w(\d+)\.(session|json)$")
+    for leftover in base.parent.glob(f"{base.name}-w*"):
+        match = pattern.match(leftover.name)
+        if match and int(match.group(1)) != worker_id and not _pid_alive(int(match.group(1))):
+            leftover.unlink()
+
+    worker_session = base.parent / f"{base.name}-w{worker_id}"
+    source = Path(session + ".session")
+    if source.exists():
+        # SQLite backup copies a consistent snapshot even while the main session is open
+        src, dst = sqlite3.connect(str(source)), sqlite3.connect(str(worker_session) + ".session")
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+
+    worker_config = base.parent / f"{base.name}-w{worker_id}.json"
+    with open(worker_config, "w") as f:
+        json.dump(dict(config, session=str(worker_session)), f)
+    return str(worker_config)
+
+def discard_worker_session(worker_config: str):
+    """Remove a config written by worker_session_config() and its session copy"""
+    path = Path(worker_config)
+    for leftover in (path, path.with_suffix(".session")):
+        try:
+            leftover.unlink()
+        except FileNotFoundError:
+            pass
+
 # ---------- JSON response ----------
 @dataclass
 class DownloadResp:
@@ -44,7 +196,11 @@ class TelegramDownloader:
         - zero DB touch
     """
 
-    def __init__(self, config_file: Optional[str] = None):
+    def __init__(self, config_file: Optional[str] = None, start: bool = True):
+        """
+        start=False only creates the client; call `await astart()` from the
+        event loop to log in without blocking it
+        """
         try:
             from telegram_uploader import create_client
             from telegram_uploader.download_files import KeepDownloadSplitFiles, JoinDownloadSplitFiles
@@ -54,9 +210,26 @@ class TelegramDownloader:
             self.JoinDownloadSplitFiles = JoinDownloadSplitFiles
             
             self.client = create_client(config_file=config_file)
-            self.client.start()
+            if start:
+                self.client.start()
         except ImportError:
             raise ImportError("telegram-uploader package not found. Please install it.")
+        
+        # (chat, message_id) -> message with media, for offset-based part fetches
+        self._message_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._message_cache_size = 256
+
+    async def astart(self):
+        """Log in from a running event loop (the sync client returns a coroutine there)"""
+        result = self.client.start()
+        if inspect.isawaitable(result):
+            await result
+
+    async def aclose(self):
+        """Disconnect from a running event loop"""
+        result = self.client.disconnect()
+        if inspect.isawaitable(result):
+            await result
 
     # -------------------------------------------------
     # 1. download by entity (chat) → ALL latest files
@@ -281,6 +454,105 @@ class TelegramDownloader:
         async for chunk in self.client.stream_file(chat, message_id, chunk_size=chunk_size):
             yield chunk
 
+    # -------------------------------------------------
+    # 4b. offset-based / parallel streaming
+    # -------------------------------------------------
+    @property
+    def supports_ranges(self) -> bool:
+        """True when the client can fetch arbitrary aligned parts of a file"""
+        return hasattr(self.client, 'iter_download')
+
+    @staticmethod
+    def _entity(chat: Union[str, int]) -> Union[str, int]:
+        chat_str = str(chat)
+        return int(chat_str) if chat_str.lstrip('-').isdigit() else chat
+
+    async def get_media_message(self, chat: Union[str, int], message_id: int):
+        """Fetch (and cache) the message that carries the file"""
+        key = (str(chat), int(message_id))
+        msg = self._message_cache.get(key)
+        if msg is not None:
+            self._message_cache.move_to_end(key)
+            return msg
+        
+        msg = await self.client.get_messages(self._entity(chat), ids=int(message_id))
+        if not msg or not msg.media:
+            raise FileNotFoundError("Message not found or does not contain a file")
+        self._message_cache[key] = msg
+        if len(self._message_cache) > self._message_cache_size:
+            self._message_cache.popitem(last=False)
+        return msg
+
+    async def get_file_size(self, chat: Union[str, int], message_id: int) -> int:
+        msg = await self.get_media_message(chat, message_id)
+        if getattr(msg, 'file', None) is not None and msg.file.size:
+            return msg.file.size
+        return msg.document.size if msg.document else 0
+
+    async def fetch_part(self, chat: Union[str, int], message_id: int, offset: int, size: int) -> bytes:
+        """Fetch one aligned part [offset, offset + size) in a single request"""
+        msg = await self.get_media_message(chat, message_id)
+        async for chunk in self.client.iter_download(msg.media, offset=offset, request_size=size, limit=1):
+            return bytes(chunk)
+        return b""
+
+    async def stream_telegram_file_parallel(
+        self,
+        chat: Union[str, int],
+        message_id: int,
+        offset: int = 0,
+        length: Optional[int] = None,
+        parallelism: int = TG_PARALLEL_PARTS,
+        part_size: int = TG_PART_SIZE,
+    ):
+        """
+        Stream bytes [offset, offset + length) with several aligned parts
+        in flight at once, yielded in order. Falls back to the sequential
+        stream_telegram_file() (whole file) when ranges are unsupported.
+        """
+        if not self.supports_ranges:
+            async for chunk in self.stream_telegram_file(chat, message_id):
+                yield chunk
+            return
+        
+        file_size = await self.get_file_size(chat, message_id)
+        end = file_size if length is None else min(file_size, offset + length)
+        
+        async def fetch(part_offset: int, size: int) -> bytes:
+            return await self.fetch_part(chat, message_id, part_offset, size)
+        
+        def open_at(position: int):
+            return iter_parts_in_order(fetch, position, end, part_size, parallelism)
+        
+        async def recover(error: BaseException, attempt: int) -> Optional[float]:
+            return await self._recover_stream(chat, message_id, error)
+        
+        async for chunk in iter_resumable(open_at, offset, end, recover=recover):
+            yield chunk
+
+    async def _recover_stream(self, chat: Union[str, int], message_id: int, error: BaseException) -> Optional[float]:
+        """
+        Prepare a failed part fetch for a retry; returns the minimum wait.
+        Telethon errors are matched by name since the client comes from
+        telegram-uploader.
+        """
+        name = type(error).__name__
+        if isinstance(error, FileNotFoundError):
+            raise error
+        if name.startswith("FileReference"):
+            # Expired/invalid file reference: the next fetch re-reads the message
+            self._message_cache.pop((str(chat), int(message_id)), None)
+            return None
+        if name == "FloodWaitError":
+            seconds = getattr(error, "seconds", 0) or 0
+            if seconds > TG_FLOOD_WAIT_MAX:
+                raise error
+            return float(seconds)
+        is_connected = getattr(self.client, "is_connected", None)
+        if is_connected is not None and not is_connected():
+            await self.client.connect()
+        return None
+
     # -------------------------------------------------
     # 5. get file info
     # -------------------------------------------------
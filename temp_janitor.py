@@ -0,0 +1,337 @@
+"""
+Background janitor for TEMP_PATH
+Keeps an in-memory index of the temp files in a directory (size + last
+access, in LRU order) and evicts from it to honour a byte quota, a
+minimum amount of free disk space and a maximum age.
+
+Usage is a running total kept in <temp_dir>/.usage and shared by every
+worker process through flock(): storing a file adds its size, deleting
+one subtracts it. Nothing on the write path scans the directory;
+reconcile() rebuilds the index and resets the total from a scan, at
+startup and every `reconcile_interval` seconds from run(), which also
+adopts files other workers wrote and corrects any drift.
+
+maybe_sweep() is cheap enough to call after every write: it only evicts
+once the shared usage crosses max_bytes, and then down to LOW_WATER of it.
+
+Files being served are pinned: in-process via a refcount and across
+worker processes via a shared flock(), so they are never deleted.
+"""
+import os
+import time
+import shutil
+import asyncio
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from starlette.responses import FileResponse
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: in-process pins only
+    fcntl = None
+
+
+class TempJanitor:
+    # A sweep triggered by the quota frees space down to this fraction of max_bytes
+    LOW_WATER = 0.9
+    # Shared usage counter, fixed width so updates never need a truncate
+    USAGE_FILE = ".usage"
+    USAGE_WIDTH = 20
+
+    def __init__(self, temp_dir: str, max_bytes: int = 0, min_free_bytes: int = 0,
+                 max_age: float = 0, interval: float = 60, reconcile_interval: float = 600,
+                 on_delete=None):
+        self.temp_dir = Path(temp_dir)
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        # path -> [size, last_access]; least recently used first
+        self.entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        # Usage of temp_dir by all workers, as of this worker's last counter update
+        self.total_bytes = 0
+        self._usage_fd: Optional[int] = None
+        # path -> (refcount, lock fd)
+        self.pins: Dict[str, List[int]] = {}
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        # Called with the path of every file this janitor deletes or finds gone
+        self.on_delete = on_delete
+        self.last_reconcile = 0.0
+
+    # ---------- shared usage ----------
+    def _update_usage(self, delta: int = 0, reset: Optional[int] = None) -> None:
+        """Add delta to (or reset) the usage counter shared through USAGE_FILE"""
+        if fcntl is not None and self._usage_fd is None:
+            try:
+                self._usage_fd = os.open(str(self.temp_dir / self.USAGE_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                pass
+        if self._usage_fd is None:
+            # No shared counter (non-POSIX, or the directory is missing): this worker's view only
+            self.total_bytes = max(0, self.total_bytes + delta if reset is None else reset)
+            return
+        fd = self._usage_fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            try:
+                current = int(os.pread(fd, self.USAGE_WIDTH, 0) or 0)
+            except ValueError:
+                current = 0
+            value = max(0, current + delta if reset is None else reset)
+            if value != current or reset is not None:
+                os.pwrite(fd, str(value).encode().ljust(self.USAGE_WIDTH), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.total_bytes = value
+
+    # ---------- index maintenance ----------
+    def reconcile(self):
+        """
+        Rebuild the index from a scan of temp_dir and reset the shared usage
+        to what is on disk: adopts files other workers wrote, drops the ones
+        they deleted, keeps this worker's access times. Too slow for the
+        write path; run() calls it every reconcile_interval.
+        """
+        found = []
+        try:
+            with os.scandir(self.temp_dir) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    known = self.entries.get(entry.path)
+                    last_access = max(st.st_atime, st.st_mtime, known[1] if known else 0)
+                    found.append((last_access, entry.path, st.st_size))
+        except OSError:
+            return
+        self.last_reconcile = time.monotonic()
+        present = {path for _, path, _ in found}
+        gone = [path for path in self.entries if path not in present]
+        found.sort()
+        self.entries = OrderedDict((path, [size, last_access]) for last_access, path, size in found)
+        self._update_usage(reset=sum(size for _, _, size in found))
+        if self.on_delete is not None:
+            for path in gone:
+                self.on_delete(path)
+
+    def _index(self, path: str, size: int) -> int:
+        """Index path as just used; returns the size it was indexed with before (0 if new)"""
+        old = self.entries.pop(path, None)
+        self.entries[path] = [size, time.time()]
+        return int(old[0]) if old else 0
+
+    def register(self, path) -> None:
+        """Record a file that was just written to temp_dir"""
+        path = str(path)
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return
+        self._update_usage(size - self._index(path, size))
+
+    def install(self, tmp_path, path) -> None:
+        """
+        Move a finished temp file over path (os.replace) and account for it;
+        a file it replaces, possibly written by another worker, is subtracted
+        """
+        path = str(path)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        size = os.stat(str(tmp_path)).st_size
+        os.replace(str(tmp_path), path)
+        self._index(path, size)
+        self._update_usage(size - replaced)
+
+    def touch(self, path) -> None:
+        """Mark a file as just used (moves it to the MRU end)"""
+        path = str(path)
+        entry = self.entries.get(path)
+        if entry is None:
+            self.register(path)
+            return
+        entry[1] = time.time()
+        self.entries.move_to_end(path)
+
+    def forget(self, path) -> None:
+        """Drop a file another worker deleted (and accounted for) from the index"""
+        self.entries.pop(str(path), None)
+
+    # ---------- pinning ----------
+    def pin(self, path) -> None:
+        path = str(path)
+        pin = self.pins.get(path)
+        if pin:
+            pin[0] += 1
+            return
+        fd = -1
+        if fcntl is not None:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            except OSError:
+                if fd >= 0:
+                    os.close(fd)
+                fd = -1
+        self.pins[path] = [1, fd]
+
+    def unpin(self, path) -> None:
+        path = str(path)
+        pin = self.pins.get(path)
+        if not pin:
+            return
+        pin[0] -= 1
+        if pin[0] <= 0:
+            del self.pins[path]
+            if pin[1] >= 0:
+                os.close(pin[1])  # closing drops the flock
+
+    def is_pinned(self, path) -> bool:
+        path = str(path)
+        if path in self.pins:
+            return True
+        if fcntl is None:
+            return False
+        # Another worker may be serving it: it holds a shared lock
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return False
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+
+    # ---------- eviction ----------
+    def delete(self, path) -> bool:
+        """Delete one indexed file unless it is pinned"""
+        path = str(path)
+        if self.is_pinned(path):
+            return False
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            # Already deleted, and subtracted, by another worker
+            size = 0
+        except OSError as e:
+            print(f"Warning: Could not delete temp file {path}: {e}")
+            return False
+        self.forget(path)
+        if size:
+            self._update_usage(-size)
+        self.evicted_files += 1
+        self.evicted_bytes += size
+        if self.on_delete is not None:
+            self.on_delete(path)
+        return True
+
+    def free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(str(self.temp_dir)).free
+        except OSError:
+            return 0
+
+    def evict_older_than(self, max_age: float) -> int:
+        """Delete files not accessed for max_age seconds; returns how many"""
+        cutoff = time.time() - max_age
+        victims = []
+        # LRU order means we can stop at the first recent entry
+        for path, (size, last_access) in self.entries.items():
+            if last_access > cutoff:
+                break
+            victims.append(path)
+        return sum(1 for path in victims if self.delete(path))
+
+    def sweep(self) -> int:
+        """Enforce max_age, max_bytes and min_free_bytes; returns files deleted"""
+        deleted = 0
+        if self.max_age > 0:
+            deleted += self.evict_older_than(self.max_age)
+
+        excess = 0
+        if self.max_bytes > 0 and self.total_bytes > self.max_bytes:
+            excess = self.total_bytes - int(self.max_bytes * self.LOW_WATER)
+        if self.min_free_bytes > 0:
+            excess = max(excess, self.min_free_bytes - self.free_bytes())
+        skipped = set(self.pins)
+        while excess > 0:
+            # Pick LRU victims first: the index must not change while it is iterated
+            victims = []
+            planned = 0
+            for path, (size, _) in self.entries.items():
+                if planned >= excess:
+                    break
+                if path not in skipped:
+                    victims.append((path, size))
+                    planned += size
+            if not victims:
+                break
+            for path, size in victims:
+                if self.delete(path):
+                    deleted += 1
+                    excess -= size
+                else:
+                    skipped.add(path)
+        return deleted
+
+    def maybe_sweep(self) -> int:
+        """Sweep once the shared usage crossed max_bytes; no directory access otherwise"""
+        if self.max_bytes > 0 and self.total_bytes > self.max_bytes:
+            return self.sweep()
+        return 0
+
+    async def run(self):
+        """Background loop; start with loop.create_task(janitor.run())"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if time.monotonic() - self.last_reconcile >= self.reconcile_interval:
+                    self.reconcile()
+                else:
+                    # Pick up what other workers stored since this worker last wrote
+                    self._update_usage()
+                self.sweep()
+            except Exception as e:
+                print(f"Temp janitor error: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tracked_files": len(self.entries),
+            "tracked_bytes": self.total_bytes,
+            "pinned_files": len(self.pins),
+            "evicted_files": self.evicted_files,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+class PinnedFileResponse(FileResponse):
+    """FileResponse that keeps its file pinned in the janitor until sending ends"""
+
+    def __init__(self, path, janitor: TempJanitor, on_close=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.janitor = janitor
+        self.pinned_path = str(path)
+        self.on_close = on_close
+        janitor.pin(self.pinned_path)
+        janitor.touch(self.pinned_path)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.janitor.unpin(self.pinned_path)
+            if self.on_close is not None:
+                self.on_close()
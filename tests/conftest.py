@@ -0,0 +1,21 @@
+"""
+Test setup: point every path setting at a throwaway directory before the
+application modules (which read config at import time) are imported.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_base = tempfile.mkdtemp(prefix="uxb-tests-")
+os.environ.setdefault("APP_PATH", _base)
+os.environ.setdefault("TEMP_PATH", os.path.join(_base, "temp"))
+os.environ.setdefault("DATABASE_PATH", os.path.join(_base, "data", "file_sharing_bot.db"))
+os.environ.setdefault("STATIC_BUILD_PATH", os.path.join(_base, "static_build"))
+# config.py logs to a file relative to the working directory; keep test runs out of the repo
+os.environ.setdefault("LOG_FILE_NAME", os.path.join(_base, "bot.log"))
+# Rate limiting is exercised by its own tests; keep it out of the way elsewhere
+os.environ.setdefault("RATE_LIMIT_IP_RATE", "0")
+os.environ.setdefault("RATE_LIMIT_LINK_RATE", "0")
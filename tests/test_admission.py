@@ -0,0 +1,66 @@
+"""Admission control: one stream cap shared by all workers through lock-file slots"""
+import asyncio
+
+import pytest
+
+from stream_control import AdmissionController, AdmissionRejected, SharedSlots
+
+
+def worker(slot_dir, max_active=2, queue_timeout=2.0):
+    # Each controller opens its own lock files, exactly like a separate process
+    return AdmissionController(max_active, max_queue=8, queue_timeout=queue_timeout,
+                               slots=SharedSlots.create(str(slot_dir), max_active))
+
+
+def test_cap_holds_across_workers(tmp_path):
+    async def scenario():
+        first, second = worker(tmp_path), worker(tmp_path, queue_timeout=0.2)
+        held = [first.ticket(), first.ticket()]
+        for ticket in held:
+            await ticket.acquire()
+        # The other worker has no local streams but the shared cap is reached
+        with pytest.raises(AdmissionRejected) as rejected:
+            await second.ticket().acquire()
+        assert rejected.value.reason == "timeout"
+        for ticket in held:
+            ticket.release()
+        assert first.active == 0
+    asyncio.run(scenario())
+
+
+def test_slot_released_in_one_worker_admits_a_waiter_in_another(tmp_path):
+    async def scenario():
+        first, second = worker(tmp_path), worker(tmp_path)
+        held = [first.ticket(), first.ticket()]
+        for ticket in held:
+            await ticket.acquire()
+        waiting = second.ticket()
+        acquiring = asyncio.ensure_future(waiting.acquire())
+        await asyncio.sleep(0.1)
+        assert not acquiring.done() and second.queued == 1
+        held[0].release()
+        await asyncio.wait_for(acquiring, 1)
+        assert second.active == 1 and first.active == 1
+        # Still two in total: a third request waits
+        with pytest.raises(AdmissionRejected):
+            third = worker(tmp_path, queue_timeout=0.2)
+            await third.ticket().acquire()
+        waiting.release()
+        held[1].release()
+    asyncio.run(scenario())
+
+
+def test_local_handoff_keeps_the_slot(tmp_path):
+    async def scenario():
+        controller = worker(tmp_path, max_active=1)
+        first = controller.ticket()
+        await first.acquire()
+        second = controller.ticket()
+        acquiring = asyncio.ensure_future(second.acquire())
+        await asyncio.sleep(0)
+        first.release()
+        await asyncio.wait_for(acquiring, 1)
+        assert second.slot == first.slot and controller.active == 1
+        second.release()
+        assert controller.active == 0 and not controller.slots.held
+    asyncio.run(scenario())
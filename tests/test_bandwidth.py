@@ -0,0 +1,32 @@
+import time
+
+from stream_control import BandwidthScheduler
+
+
+def test_idle_stream_gives_up_its_share():
+    scheduler = BandwidthScheduler(global_rate=1000)
+    busy = scheduler.open()
+    idle = scheduler.open()
+    now = time.monotonic()
+    busy.next_send = idle.next_send = now
+    assert scheduler.rate_for(busy, now) == 500
+
+    # idle stopped pulling chunks (slow client): busy gets the whole ceiling
+    idle.next_send = now - 1
+    assert scheduler.rate_for(busy, now) == 1000
+
+    idle.close()
+    assert scheduler.rate_for(busy, now) == 1000
+
+
+def test_weights_and_per_stream_cap():
+    scheduler = BandwidthScheduler(global_rate=1000, per_stream_rate=300)
+    high = scheduler.open(weight=4)
+    low = scheduler.open()
+    now = time.monotonic()
+    high.next_send = low.next_send = now
+    assert scheduler.rate_for(high, now) == 800
+    assert scheduler.rate_for(low, now) == 200
+    # low alone is capped by per_stream_rate * weight
+    high.next_send = now - 1
+    assert scheduler.rate_for(low, now) == 300
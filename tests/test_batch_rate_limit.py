@@ -0,0 +1,110 @@
+"""Requests naming several links pay for every link in the rate limiters"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+from rate_limiter import MemoryBucketStore, TokenBucketLimiter, check_all, create_bucket_store
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    store = MemoryBucketStore()
+    ip = TokenBucketLimiter(0.001, 5, store)
+    link = TokenBucketLimiter(0.001, 2, store)
+    monkeypatch.setattr(api_server, "ip_limiter", ip)
+    monkeypatch.setattr(api_server, "link_limiter", link)
+
+    async def get_usable_link(link_code):
+        # Stop right after the rate limit: the archive itself is not under test
+        raise api_server.HTTPException(status_code=404, detail="stub")
+
+    monkeypatch.setattr(api_server, "get_usable_link", get_usable_link)
+    with TestClient(api_server.app) as client:
+        yield client
+
+
+def test_zip_costs_one_ip_token_per_link(limits):
+    assert limits.get("/zip", params={"codes": "a,b,c"}).status_code == 404
+    # 3 of 5 IP tokens spent: another 3 links no longer fit
+    response = limits.get("/zip", params={"codes": "d,e,f"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    assert limits.get("/zip", params={"codes": "d,e"}).status_code == 404
+
+
+def test_zip_checks_every_link_bucket(limits, monkeypatch):
+    monkeypatch.setattr(api_server, "ip_limiter", TokenBucketLimiter(0, 0, MemoryBucketStore()))
+    for _ in range(2):
+        assert limits.get("/zip", params={"codes": "hot,x"}).status_code == 404
+    # "hot" has used its burst of 2, whichever batch it comes in
+    assert limits.get("/zip", params={"codes": "y,hot"}).status_code == 429
+    assert limits.get("/stream/hot").status_code == 429
+
+
+def test_refused_zip_spends_no_tokens(limits):
+    for _ in range(2):
+        assert limits.get("/zip", params={"codes": "hot"}).status_code == 404
+    # "hot" is empty: the whole batch is refused, and a and b keep their tokens
+    assert limits.get("/zip", params={"codes": "a,b,hot"}).status_code == 429
+    assert limits.get("/zip", params={"codes": "a,b"}).status_code == 404
+    assert limits.get("/zip", params={"codes": "a"}).status_code == 404
+    # 2 + 2 + 1 of 5 IP tokens: the refused batch of 3 cost nothing
+    assert limits.get("/zip", params={"codes": "c"}).status_code == 429
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_takes_all_or_nothing(backend, tmp_path):
+    store = create_bucket_store(backend, str(tmp_path / "buckets.db"))
+    ip = TokenBucketLimiter(0.001, 3, store)
+    link = TokenBucketLimiter(0.001, 1, store)
+
+    async def scenario():
+        assert await check_all([(ip, "ip:x", 2), (link, "link:a", 1), (link, "link:b", 1)]) == [0, 0, 0]
+        refused = await check_all([(ip, "ip:x", 1), (link, "link:a", 1), (link, "link:c", 1)])
+        assert refused[0] == 0 and refused[1] > 0 and refused[2] == 0
+        # Nothing was taken by the refused charge: ip:x and link:c still have their tokens
+        assert await check_all([(ip, "ip:x", 1), (link, "link:c", 1)]) == [0, 0]
+        # A key named twice pays for both, capped at the burst like a single large cost
+        assert await check_all([(ip, "ip:y", 2), (ip, "ip:y", 2)]) == [0, 0]
+        assert (await check_all([(ip, "ip:y", 1)]))[0] > 0
+
+    asyncio.run(scenario())
+
+
+def test_cost_above_burst_can_still_pass(limits):
+    codes = ",".join(f"c{i}" for i in range(12))
+    assert limits.get("/zip", params={"codes": codes}).status_code == 404
+    assert limits.get("/zip", params={"codes": "z"}).status_code == 429
+
+
+def test_info_batch_costs_one_ip_token_per_link(limits, monkeypatch):
+    async def get_files_by_link_codes(codes):
+        return {}
+
+    monkeypatch.setattr(api_server, "get_files_by_link_codes", get_files_by_link_codes)
+    response = limits.post("/info/batch", json={"link_codes": ["a", "b", "c", "d"]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["items"]] == ["not_found"] * 4
+    assert limits.post("/info/batch", json={"link_codes": ["e", "f"]}).status_code == 429
+    assert limits.post("/info/batch", json={"link_codes": ["e"]}).status_code == 200
+
+
+def test_refused_info_batch_spends_no_tokens(limits, monkeypatch):
+    lookups = []
+
+    async def get_files_by_link_codes(codes):
+        lookups.append(list(codes))
+        return {}
+
+    monkeypatch.setattr(api_server, "get_files_by_link_codes", get_files_by_link_codes)
+    for _ in range(2):
+        assert limits.post("/info/batch", json={"link_codes": ["hot"]}).status_code == 200
+    # "hot" is empty: refused before the database is asked, a and b keep their tokens
+    assert limits.post("/info/batch", json={"link_codes": ["a", "b", "hot"]}).status_code == 429
+    assert lookups == [["hot"], ["hot"]]
+    assert limits.post("/info/batch", json={"link_codes": ["a", "b"]}).status_code == 200
+    assert limits.post("/info/batch", json={"link_codes": ["a"]}).status_code == 200
+    # 2 + 2 + 1 of 5 IP tokens: the refused batch of 3 cost nothing
+    assert limits.post("/info/batch", json={"link_codes": ["c"]}).status_code == 429
@@ -0,0 +1,67 @@
+import asyncio
+
+from stream_broadcast import BroadcastHub
+
+CHUNK = 64 * 1024
+FILE_SIZE = 64 * CHUNK
+
+
+def pattern(offset, length):
+    return bytes((offset + i) % 251 for i in range(length))
+
+
+def make_fetch(calls):
+    async def fetch(offset, length):
+        calls.append(offset)
+        end = FILE_SIZE if length is None else min(FILE_SIZE, offset + length)
+        while offset < end:
+            size = min(CHUNK, end - offset)
+            await asyncio.sleep(0)
+            yield pattern(offset, size)
+            offset += size
+    return fetch
+
+
+async def read_all(source, pause=0.0):
+    data = bytearray()
+    async for chunk in source:
+        data += chunk
+        if pause:
+            await asyncio.sleep(pause)
+    return bytes(data)
+
+
+def test_upstream_stays_within_lead_of_viewer():
+    async def scenario():
+        hub = BroadcastHub(window=32 * CHUNK, lead=4 * CHUNK)
+        calls = []
+        source = hub.stream("f", make_fetch(calls), 0, FILE_SIZE - 1, FILE_SIZE)
+        read = 0
+        async for chunk in source:
+            read += len(chunk)
+            broadcast = hub.broadcasts["f"]
+            assert broadcast.position - read <= 5 * CHUNK
+            await asyncio.sleep(0)
+            if read >= 16 * CHUNK:
+                break
+        await source.aclose()
+        assert hub.budget.used == 0
+    asyncio.run(scenario())
+
+
+def test_exhausted_budget_falls_back_to_direct_streams():
+    async def scenario():
+        hub = BroadcastHub(window=32 * CHUNK, lead=4 * CHUNK, max_bytes=4 * CHUNK)
+        calls = []
+        fetch = make_fetch(calls)
+        # The slow viewer's broadcast fills the whole budget
+        slow = asyncio.ensure_future(read_all(hub.stream("a", fetch, 0, FILE_SIZE - 1, FILE_SIZE), pause=0.001))
+        while hub.budget.used < hub.budget.max_bytes:
+            await asyncio.sleep(0)
+        other = await read_all(hub.stream("b", fetch, 0, FILE_SIZE - 1, FILE_SIZE))
+        assert other == pattern(0, FILE_SIZE)
+        assert "b" not in hub.broadcasts
+        assert hub.budget.used <= hub.budget.max_bytes + CHUNK
+        assert await slow == pattern(0, FILE_SIZE)
+        assert hub.budget.used == 0
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+"""JSON compression middleware"""
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from compression import JSONCompressionMiddleware
+
+BIG = {"items": [{"id": i, "name": f"file-{i}"} for i in range(200)]}
+
+
+async def big_json(request):
+    response = JSONResponse(BIG)
+    response.set_cookie("a", "1")
+    response.set_cookie("b", "2")
+    return response
+
+
+async def small_json(request):
+    return JSONResponse({"ok": True})
+
+
+async def stream(request):
+    async def body():
+        yield b"x" * 5000
+        yield b"y" * 5000
+    return StreamingResponse(body(), media_type="video/mp4")
+
+
+def make_client():
+    app = Starlette(routes=[
+        Route("/big", big_json), Route("/small", small_json), Route("/stream", stream),
+    ])
+    app.add_middleware(CORSMiddleware, allow_origins=["https://admin.example"], allow_credentials=True)
+    app.add_middleware(JSONCompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+def test_large_json_is_compressed_keeping_headers():
+    with make_client() as client:
+        response = client.get("/big", headers={"Accept-Encoding": "gzip", "Origin": "https://admin.example"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(response.content) == BIG  # httpx decodes gzip
+    vary = {v.strip() for v in response.headers["vary"].split(",")}
+    assert vary == {"Origin", "Accept-Encoding"}
+    assert len(response.headers.get_list("set-cookie")) == 2
+
+
+def test_small_json_and_streams_are_left_alone():
+    with make_client() as client:
+        small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+        streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "Accept-Encoding" in small.headers["vary"]
+    assert "content-encoding" not in streamed.headers
+    assert "Accept-Encoding" not in streamed.headers.get("vary", "")
+    assert streamed.content == b"x" * 5000 + b"y" * 5000
+
+
+def test_content_length_matches_compressed_body():
+    with make_client() as client:
+        with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+    assert int(response.headers["content-length"]) == len(raw) < len(json.dumps(BIG))
+    assert json.loads(gzip.decompress(raw)) == BIG
@@ -0,0 +1,41 @@
+"""Keyset pagination of the admin file listing"""
+import asyncio
+
+import pytest
+
+from database import sqlite_database
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_database, "db", sqlite_database.SQLiteDatabase(str(tmp_path / "files.db")))
+    sizes = [300, None, 100, None, 200, 100, None]
+    for i, size in enumerate(sizes):
+        file_id = asyncio.run(sqlite_database.add_file(f"file{i}.bin", f"file{i}.bin", i, "chat"))
+        # add_file always stores a size; legacy rows may carry NULL
+        conn = sqlite_database.db.get_connection()
+        conn.execute("UPDATE files SET file_size = ? WHERE id = ?", (size, file_id))
+        conn.commit()
+        conn.close()
+    return sizes
+
+
+def walk(descending, limit):
+    items, cursor = [], None
+    while True:
+        page = asyncio.run(sqlite_database.list_files(
+            sort="size", descending=descending, cursor=cursor, limit=limit))
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return page["total"], items
+
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_size_pages_include_null_sizes(files, descending, limit):
+    total, items = walk(descending, limit)
+    assert total == len(files)
+    assert len({item["id"] for item in items}) == len(files)
+    sizes = [-1 if item["file_size"] is None else item["file_size"] for item in items]
+    assert sizes == sorted(sizes, reverse=descending)
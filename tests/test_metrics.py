@@ -0,0 +1,86 @@
+"""Request metrics middleware and the multi-worker /metrics merge"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import api_server
+from metrics import LATENCY_BUCKETS, MetricsRegistry, RequestMetricsMiddleware
+
+
+def snapshot(pid, requests, latencies):
+    """A worker snapshot as flush() writes it; latencies are raw bucket counts + [sum, count]"""
+    key = [["method", "GET"], ["route", "/stream/{link_code}"], ["status", "200"]]
+    return {
+        "pid": pid,
+        "buckets": list(LATENCY_BUCKETS),
+        "counters": {"uxb_http_requests_total": [[key, requests]]},
+        "gauges": {},
+        "histograms": {"uxb_http_request_duration_seconds": [[[["route", "/stream/{link_code}"]], latencies]]},
+    }
+
+
+def test_metrics_sums_worker_snapshots(tmp_path, monkeypatch):
+    registry = MetricsRegistry(str(tmp_path))
+    monkeypatch.setattr(api_server, "metrics", registry)
+    first = [1] + [0] * (len(LATENCY_BUCKETS) - 1) + [0.004, 1]
+    second = [0, 2] + [0] * (len(LATENCY_BUCKETS) - 2) + [0.015, 2]
+    # pids that cannot exist: dead workers still contribute counters and histograms
+    (tmp_path / "worker-999990.json").write_text(json.dumps(snapshot(999990, 3, first)))
+    (tmp_path / "worker-999991.json").write_text(json.dumps(snapshot(999991, 4, second)))
+
+    body = TestClient(api_server.app).get("/metrics").text
+    lines = body.splitlines()
+    assert 'uxb_http_requests_total{method="GET",route="/stream/{link_code}",status="200"} 7' in lines
+    assert 'uxb_http_request_duration_seconds_bucket{route="/stream/{link_code}",le="0.005"} 1' in lines
+    assert 'uxb_http_request_duration_seconds_bucket{route="/stream/{link_code}",le="0.01"} 3' in lines
+    assert 'uxb_http_request_duration_seconds_bucket{route="/stream/{link_code}",le="+Inf"} 3' in lines
+    assert 'uxb_http_request_duration_seconds_sum{route="/stream/{link_code}"} 0.019' in lines
+    assert 'uxb_http_request_duration_seconds_count{route="/stream/{link_code}"} 3' in lines
+
+
+def test_duration_covers_the_whole_streamed_body(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+
+    async def slow_body(scope, receive, send):
+        await send({"type": "http.response.start", "status": 206, "headers": []})
+        for _ in range(3):
+            await asyncio.sleep(0.05)
+            await send({"type": "http.response.body", "body": b"x", "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    middleware = RequestMetricsMiddleware(slow_body, registry=registry)
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/x"}, receive, send))
+
+    assert registry.counters["uxb_http_requests_total"] == {
+        (("method", "GET"), ("route", "unmatched"), ("status", "206")): 1}
+    (latency,) = registry.histograms["uxb_http_request_duration_seconds"].values()
+    assert latency[-1] == 1
+    assert latency[-2] >= 0.15
+
+
+def test_failed_request_is_counted_once_as_500(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+
+    async def broken(scope, receive, send):
+        raise RuntimeError("boom")
+
+    async def send(message):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    middleware = RequestMetricsMiddleware(broken, registry=registry)
+    try:
+        asyncio.run(middleware({"type": "http", "method": "GET", "path": "/x"}, receive, send))
+    except RuntimeError:
+        pass
+    assert registry.counters["uxb_http_requests_total"] == {
+        (("method", "GET"), ("route", "unmatched"), ("status", "500")): 1}
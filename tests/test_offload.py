@@ -0,0 +1,76 @@
+"""Front-proxy offload of cached temp files (X-Accel-Redirect / X-Sendfile)"""
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+
+FILE_INFO = {
+    "id": 7,
+    "chat_id": -100123,
+    "message_id": 42,
+    "original_name": "clip.mp4",
+    "mime_type": "video/mp4",
+    "file_size": 4096,
+    "priority": 0,
+}
+PAYLOAD = bytes(range(256)) * 16
+
+
+class NoTelegram:
+    supports_ranges = True
+
+    def __getattr__(self, name):
+        raise AssertionError(f"Telegram was contacted ({name}) for a cached file")
+
+
+@pytest.fixture
+def cached_file(monkeypatch):
+    async def get_usable_link(link_code):
+        return dict(FILE_INFO, link_code=link_code)
+
+    monkeypatch.setattr(api_server, "get_usable_link", get_usable_link)
+    monkeypatch.setattr(api_server, "downloader", NoTelegram())
+    path = api_server.cached_temp_path(FILE_INFO)
+    path.write_bytes(PAYLOAD)
+    yield path
+    if path.exists():
+        path.unlink()
+
+
+@pytest.fixture
+def client():
+    with TestClient(api_server.app) as test_client:
+        yield test_client
+
+
+def test_stream_and_download_share_the_cached_copy(cached_file, client, monkeypatch):
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "x-accel")
+    # /download filled the cache through one link; /stream of another link reuses it
+    for url in ("/download/link-a", "/stream/link-b"):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["x-accel-redirect"] == "/_uxb_temp/" + cached_file.name
+        assert "content-length" not in response.headers
+        assert response.headers["etag"] == api_server.file_etag(FILE_INFO)
+        assert response.headers["last-modified"].endswith("GMT")
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-type"] == "video/mp4"
+        assert response.content == b""
+
+
+def test_range_is_left_to_the_proxy(cached_file, client, monkeypatch):
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "x-sendfile")
+    response = client.get("/stream/link-a", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 200
+    assert response.headers["x-sendfile"] == str(cached_file.resolve())
+    assert "content-range" not in response.headers
+    assert "content-length" not in response.headers
+
+
+def test_range_without_offload_is_served_from_disk(cached_file, client, monkeypatch):
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "")
+    response = client.get("/download/link-a", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-199/{len(PAYLOAD)}"
+    assert response.content == PAYLOAD[100:200]
+    assert response.headers["etag"] == api_server.file_etag(FILE_INFO)
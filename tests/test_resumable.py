@@ -0,0 +1,90 @@
+"""iter_resumable: mid-stream upstream failures resume at the last delivered byte"""
+import asyncio
+
+import pytest
+
+from telegram_downloader_integration import iter_resumable
+
+DATA = bytes(range(256)) * 64
+CHUNK = 1000
+
+
+class FlakySource:
+    """open_source() whose streams fail after delivering fail_after[i] bytes on attempt i"""
+
+    def __init__(self, fail_after, end=len(DATA)):
+        self.fail_after = list(fail_after)
+        self.end = end
+        self.opened = []
+
+    def __call__(self, position):
+        self.opened.append(position)
+        budget = self.fail_after.pop(0) if self.fail_after else None
+        return self._stream(position, budget)
+
+    async def _stream(self, position, budget):
+        delivered = 0
+        while position < self.end:
+            if budget is not None and delivered >= budget:
+                raise ConnectionError("upstream dropped")
+            size = min(CHUNK, self.end - position)
+            if budget is not None:
+                size = min(size, budget - delivered)
+            yield DATA[position:position + size]
+            position += size
+            delivered += size
+
+
+async def collect(source):
+    out = bytearray()
+    async for chunk in source:
+        out += chunk
+    return bytes(out)
+
+
+def test_resumes_at_last_delivered_byte():
+    source = FlakySource([2500, 0, 4096])
+    recovered = []
+
+    async def recover(error, attempt):
+        recovered.append((type(error).__name__, attempt))
+        return 0
+
+    data = asyncio.run(collect(iter_resumable(source, 0, len(DATA), retries=3, backoff=0, recover=recover)))
+    assert data == DATA
+    assert source.opened == [0, 2500, 2500, 6596]
+    # Progress resets the attempt counter
+    assert recovered == [("ConnectionError", 1), ("ConnectionError", 2), ("ConnectionError", 1)]
+
+
+def test_resumes_within_a_range():
+    source = FlakySource([300], end=5000)
+    data = asyncio.run(collect(iter_resumable(source, 1000, 5000, retries=1, backoff=0)))
+    assert data == DATA[1000:5000]
+    assert source.opened == [1000, 1300]
+
+
+def test_gives_up_after_retries_without_progress():
+    source = FlakySource([100, 0, 0, 0])
+    received = bytearray()
+
+    async def run():
+        async for chunk in iter_resumable(source, 0, len(DATA), retries=2, backoff=0):
+            received.extend(chunk)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert bytes(received) == DATA[:100]
+    # The first attempt plus two retries at the same offset
+    assert source.opened == [0, 100, 100]
+
+
+def test_recover_can_refuse_a_retry():
+    source = FlakySource([10])
+
+    async def recover(error, attempt):
+        raise FileNotFoundError("message deleted")
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(collect(iter_resumable(source, 0, len(DATA), retries=5, backoff=0, recover=recover)))
+    assert source.opened == [0]
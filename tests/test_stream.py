@@ -0,0 +1,236 @@
+"""/stream served from a stub downloader (no Telegram)"""
+import asyncio
+from urllib.parse import quote
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+
+PAYLOAD = bytes(range(256)) * 1024
+
+
+class StubDownloader:
+    """Serves PAYLOAD through the parallel fetch API and counts every call"""
+
+    supports_ranges = True
+
+    def __init__(self):
+        self.calls = []
+
+    async def stream_telegram_file_parallel(self, chat, message_id, offset=0, length=None, **kwargs):
+        self.calls.append(("stream_telegram_file_parallel", offset, length))
+        end = len(PAYLOAD) if length is None else min(len(PAYLOAD), offset + length)
+        for position in range(offset, end, 64 * 1024):
+            yield PAYLOAD[position:min(position + 64 * 1024, end)]
+
+
+def link(file_size, file_id=11):
+    return {
+        "id": file_id,
+        "chat_id": -100123,
+        "message_id": file_id,
+        "original_name": "clip.bin",
+        "mime_type": "application/octet-stream",
+        "file_size": file_size,
+        "priority": 0,
+    }
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    downloader = StubDownloader()
+    monkeypatch.setattr(api_server, "downloader", downloader)
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "")
+    return downloader
+
+
+@pytest.fixture
+def client():
+    with TestClient(api_server.app) as test_client:
+        yield test_client
+
+
+def serve(monkeypatch, file_info):
+    async def get_usable_link(link_code):
+        return dict(file_info, link_code=link_code)
+    monkeypatch.setattr(api_server, "get_usable_link", get_usable_link)
+
+
+def test_unknown_size_streams_whole_file(stub, client, monkeypatch):
+    serve(monkeypatch, link(file_size=0))
+    response = client.get("/stream/unknown-size")
+    assert response.status_code == 200
+    assert response.content == PAYLOAD
+    assert "content-length" not in response.headers
+    assert response.headers["accept-ranges"] == "none"
+    # Open-ended fetch, no cache layers in between
+    assert stub.calls == [("stream_telegram_file_parallel", 0, None)]
+
+
+def http_scope(path, method="GET"):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+
+
+class EndlessDownloader:
+    """Upstream that would never end on its own; records what it produced"""
+
+    supports_ranges = True
+
+    def __init__(self):
+        self.chunks = 0
+        self.closed = False
+
+    async def stream_telegram_file_parallel(self, chat, message_id, offset=0, length=None, **kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0)
+                self.chunks += 1
+                yield bytes(64 * 1024)
+        finally:
+            self.closed = True
+
+
+def test_client_disconnect_stops_upstream(monkeypatch):
+    upstream = EndlessDownloader()
+    monkeypatch.setattr(api_server, "downloader", upstream)
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "")
+    serve(monkeypatch, link(file_size=0, file_id=12))
+
+    async def scenario():
+        gone = asyncio.Event()
+        requested = []
+        body_messages = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                body_messages.append(len(message["body"]))
+                if len(body_messages) == 4:
+                    gone.set()  # the client hangs up after four chunks
+
+        await asyncio.wait_for(api_server.app(http_scope("/stream/endless"), receive, send), 10)
+        produced = upstream.chunks
+        await asyncio.sleep(0.2)
+        return produced, len(body_messages)
+
+    produced, delivered = asyncio.run(scenario())
+    assert upstream.closed
+    # Nothing is fetched once the response has been torn down ...
+    assert upstream.chunks == produced
+    # ... and what was fetched is bounded by the read-ahead ceiling, not the file
+    read_ahead_chunks = api_server.STREAM_READAHEAD_MAX_BYTES // (64 * 1024)
+    assert produced - delivered <= read_ahead_chunks + 2
+
+
+class BrokenDownloader:
+    """Upstream that fails after two chunks"""
+
+    supports_ranges = True
+
+    async def stream_telegram_file_parallel(self, chat, message_id, offset=0, length=None, **kwargs):
+        yield PAYLOAD[:1000]
+        yield PAYLOAD[1000:2000]
+        raise RuntimeError("upstream went away")
+
+
+def test_upstream_failure_aborts_the_response(monkeypatch):
+    monkeypatch.setattr(api_server, "downloader", BrokenDownloader())
+    monkeypatch.setattr(api_server, "FILE_OFFLOAD_MODE", "")
+    serve(monkeypatch, link(file_size=0, file_id=14))
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    async def scenario():
+        await asyncio.wait_for(api_server.app(http_scope("/stream/broken"), receive, send), 10)
+
+    # The error reaches the server (which drops the connection) instead of an
+    # HTTPException raised after the status line was sent
+    with pytest.raises(RuntimeError, match="upstream went away"):
+        asyncio.run(scenario())
+    assert messages[0]["type"] == "http.response.start" and messages[0]["status"] == 200
+    bodies = [m for m in messages if m["type"] == "http.response.body"]
+    assert b"".join(m.get("body", b"") for m in bodies) == PAYLOAD[:2000]
+    # No final empty body: a chunked response must not end as if it were complete
+    assert all(m.get("more_body") for m in bodies)
+
+
+class CountingDownloader:
+    """Any downloader method call is recorded; HEAD must not make one"""
+
+    supports_ranges = True
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            raise AssertionError(f"downloader.{name} called")
+        return call
+
+
+def test_head_never_calls_the_downloader(client, monkeypatch):
+    counting = CountingDownloader()
+    monkeypatch.setattr(api_server, "downloader", counting)
+    file_info = link(file_size=len(PAYLOAD), file_id=13)
+    serve(monkeypatch, file_info)
+
+    response = client.head("/stream/head-link")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(PAYLOAD))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == api_server.file_etag(file_info)
+
+    # /download reports the size of the copy on disk when there is one
+    cached = api_server.cached_temp_path(file_info)
+    cached.write_bytes(PAYLOAD[:1000])
+    try:
+        response = client.head("/download/head-link")
+    finally:
+        cached.unlink()
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1000"
+
+    assert counting.calls == []
+
+
+MATCHED_HEADERS = ("content-type", "content-disposition", "accept-ranges", "etag", "content-length")
+
+
+def test_head_headers_match_get(stub, client, monkeypatch):
+    file_info = dict(link(file_size=len(PAYLOAD), file_id=15), original_name="Фильм 01.bin")
+    serve(monkeypatch, file_info)
+
+    head = client.head("/stream/named-link")
+    get = client.get("/stream/named-link")
+    assert get.content == PAYLOAD
+    assert head.headers["content-disposition"] == "attachment; filename*=utf-8''" + quote(file_info["original_name"])
+    assert {h: head.headers.get(h) for h in MATCHED_HEADERS} == {h: get.headers.get(h) for h in MATCHED_HEADERS}
+
+    cached = api_server.cached_temp_path(file_info)
+    cached.write_bytes(PAYLOAD)
+    try:
+        head = client.head("/download/named-link")
+        get = client.get("/download/named-link")
+    finally:
+        cached.unlink()
+    assert get.content == PAYLOAD
+    assert {h: head.headers.get(h) for h in MATCHED_HEADERS} == {h: get.headers.get(h) for h in MATCHED_HEADERS}
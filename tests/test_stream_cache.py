@@ -0,0 +1,106 @@
+"""ChunkCache and HotChunkLRU in front of a recording fetch"""
+import asyncio
+import os
+
+from stream_cache import ChunkCache, HotChunkLRU
+
+CHUNK = 1000
+DATA = bytes(range(256)) * 20 + b"tail"  # 5124 bytes: five full chunks and a short one
+
+
+class Upstream:
+    """fetch(offset, length) over DATA in uneven pieces, recording every call"""
+
+    def __init__(self, piece=700):
+        self.piece = piece
+        self.calls = []
+
+    async def fetch(self, offset, length):
+        self.calls.append((offset, length))
+        end = len(DATA) if length is None else min(len(DATA), offset + length)
+        for position in range(offset, end, self.piece):
+            yield DATA[position:min(position + self.piece, end)]
+
+
+def read(cache, upstream, start, end):
+    async def collect():
+        return [chunk async for chunk in cache.stream("f", upstream.fetch, start, end, len(DATA))]
+    return asyncio.run(collect())
+
+
+def chunk_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".chunk"))
+
+
+def test_range_across_cached_and_missing_chunks(tmp_path):
+    cache = ChunkCache(str(tmp_path), CHUNK, max_bytes=1_000_000)
+    upstream = Upstream()
+    read(cache, upstream, 1000, 1999)
+    read(cache, upstream, 3500, 3600)
+    upstream.calls.clear()
+
+    parts = read(cache, upstream, 500, len(DATA) - 1)
+    assert b"".join(parts) == DATA[500:]
+    # Only the runs of missing chunks go upstream, each in one request
+    assert upstream.calls == [(0, 1000), (2000, 1000), (4000, len(DATA) - 4000)]
+    assert cache.present_ranges("f", len(DATA)) == [(0, len(DATA) - 1)]
+
+
+def test_bitmap_is_rebuilt_by_a_new_instance(tmp_path):
+    first = ChunkCache(str(tmp_path), CHUNK, max_bytes=1_000_000)
+    read(first, Upstream(), 0, 999)
+    read(first, Upstream(), 2000, 2999)
+    read(first, Upstream(), 5000, len(DATA) - 1)
+
+    second = ChunkCache(str(tmp_path), CHUNK, max_bytes=1_000_000)
+    assert [second.has_chunk("f", i) for i in range(6)] == [True, False, True, False, False, True]
+    assert second.present_ranges("f", len(DATA)) == [(0, 999), (2000, 2999), (5000, len(DATA) - 1)]
+    upstream = Upstream()
+    assert b"".join(read(second, upstream, 0, 999)) == DATA[:1000]
+    assert upstream.calls == []
+
+
+def test_eviction_drops_whole_chunks_and_their_bits(tmp_path):
+    cache = ChunkCache(str(tmp_path), CHUNK, max_bytes=3000)
+    assert b"".join(read(cache, Upstream(), 0, 4999)) == DATA[:5000]
+
+    files = chunk_files(str(tmp_path))
+    assert 0 < len(files) < 5
+    assert all(os.path.getsize(str(tmp_path / name)) == CHUNK for name in files)
+    assert sum(os.path.getsize(str(tmp_path / name)) for name in files) <= 3000
+    # The bitmap agrees with the disk, chunk by chunk; the oldest chunks went first
+    on_disk = {int(name.split(".")[1]) for name in files}
+    assert {i for i in range(5) if cache.has_chunk("f", i)} == on_disk
+    assert on_disk == set(range(5 - len(files), 5))
+
+
+def test_hot_lru_evicts_least_recently_used_by_bytes():
+    hot = HotChunkLRU(max_bytes=3000)
+    for index in range(3):
+        hot.put("f", index, bytes([index]) * 1000)
+    assert hot.get("f", 0) is not None  # 0 is now the most recently used
+    hot.put("f", 3, b"\3" * 1000)
+    assert [hot.contains("f", i) for i in range(4)] == [True, False, True, True]
+
+    # One large chunk pushes out as many of the oldest as it needs
+    hot.put("f", 4, b"\4" * 1500)
+    assert [hot.contains("f", i) for i in range(5)] == [False, False, False, True, True]
+    assert hot.resident_bytes == 2500
+    # Larger than the whole budget: never cached
+    hot.put("f", 5, b"\5" * 3001)
+    assert not hot.contains("f", 5) and hot.resident_bytes == 2500
+
+
+def test_memoryview_slices_outlive_their_hot_entry(tmp_path):
+    hot = HotChunkLRU(max_bytes=2 * CHUNK)
+    cache = ChunkCache(str(tmp_path), CHUNK, max_bytes=0, hot=hot)
+    upstream = Upstream()
+    read(cache, upstream, 0, 999)
+    upstream.calls.clear()
+    (part,) = read(cache, upstream, 100, 199)
+    assert upstream.calls == [] and isinstance(part, memoryview)
+
+    # Chunks 1 and 2 push chunk 0 out while the slice of it is still held
+    read(cache, upstream, 1000, 2999)
+    assert not hot.contains("f", 0)
+    assert part.tobytes() == DATA[100:200]
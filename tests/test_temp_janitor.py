@@ -0,0 +1,93 @@
+import os
+import time
+
+from temp_janitor import TempJanitor
+
+
+def write(directory, name, size, age=0.0):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def on_disk(directory):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory) if not name.startswith("."))
+
+
+def test_usage_is_a_running_total_shared_across_workers(tmp_path):
+    # Two workers sharing one directory, each registering only its own files
+    first = TempJanitor(str(tmp_path), max_bytes=10_000)
+    second = TempJanitor(str(tmp_path), max_bytes=10_000)
+    first.reconcile()
+    second.reconcile()
+    for i in range(4):
+        first.register(write(str(tmp_path), f"a{i}", 1000, age=100 - i))
+        second.register(write(str(tmp_path), f"b{i}", 1000, age=50 - i))
+    # Each worker sees the other's writes through the shared counter
+    assert second.total_bytes == 8000
+    assert first.total_bytes == 7000
+    assert first.maybe_sweep() == 0
+
+    # Over the quota: the worker that crossed it evicts from its own index
+    for i in range(4, 6):
+        first.register(write(str(tmp_path), f"a{i}", 1000, age=100 - i))
+        second.register(write(str(tmp_path), f"b{i}", 1000, age=50 - i))
+    assert second.total_bytes == 12_000
+    second.maybe_sweep()
+    assert second.total_bytes == on_disk(str(tmp_path)) == 9000
+    assert not (tmp_path / "b0").exists() and (tmp_path / "b3").exists()
+
+
+def test_store_and_evict_never_scan_the_directory(tmp_path, monkeypatch):
+    janitor = TempJanitor(str(tmp_path), max_bytes=2500)
+    janitor.reconcile()
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("directory scanned on the write path")
+
+    monkeypatch.setattr(os, "scandir", no_scan)
+    for i in range(5):
+        tmp = write(str(tmp_path), f".tmp-{i}", 1000)
+        janitor.install(tmp, tmp_path / f"f{i}")
+        janitor.maybe_sweep()
+    assert janitor.total_bytes <= 2500
+    # Replacing a file counts only the difference
+    janitor.install(write(str(tmp_path), ".tmp-r", 400), tmp_path / "f4")
+    assert janitor.total_bytes == on_disk(str(tmp_path))
+
+
+def test_reconcile_adopts_other_files_and_corrects_drift(tmp_path):
+    first = TempJanitor(str(tmp_path), max_bytes=10_000)
+    second = TempJanitor(str(tmp_path), max_bytes=10_000)
+    first.register(write(str(tmp_path), "a", 1000))
+    second.register(write(str(tmp_path), "b", 2000))
+    # Written or deleted behind the janitors' backs
+    write(str(tmp_path), "c", 500)
+    os.unlink(str(tmp_path / "a"))
+
+    gone = []
+    first.on_delete = gone.append
+    first.reconcile()
+    assert first.total_bytes == 2500
+    assert sorted(os.path.basename(p) for p in first.entries) == ["b", "c"]
+    assert gone == [str(tmp_path / "a")]
+    # The other worker sees the corrected total on its next update
+    second.delete(str(tmp_path / "b"))
+    assert second.total_bytes == 500
+
+
+def test_pinned_files_are_skipped(tmp_path):
+    janitor = TempJanitor(str(tmp_path), max_bytes=2500)
+    for i in range(3):
+        janitor.register(write(str(tmp_path), f"f{i}", 1000, age=10 - i))
+    janitor.pin(str(tmp_path / "f0"))
+    try:
+        assert janitor.maybe_sweep() == 1
+    finally:
+        janitor.unpin(str(tmp_path / "f0"))
+    assert (tmp_path / "f0").exists() and not (tmp_path / "f1").exists()
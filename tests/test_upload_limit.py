@@ -0,0 +1,113 @@
+"""Admin upload: streamed straight to disk, body capped on the receive stream"""
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import api_server
+import upload_stream
+
+
+BOUNDARY = "uxbtestboundary"
+
+
+def multipart_body(payload: bytes, filename: str = "clip.bin"):
+    head = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="description"\r\n\r\n'
+        f"hello\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    return head + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def chunked(body: bytes, size: int = 7000):
+    # A generator body is sent without Content-Length
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    added = []
+
+    async def fake_add_file(**kwargs):
+        added.append(kwargs)
+        return "file-1"
+
+    monkeypatch.setattr(api_server, "add_file", fake_add_file)
+    with TestClient(api_server.app) as test_client:
+        test_client.added = added
+        yield test_client
+
+
+def test_upload_is_parsed_into_place(client, monkeypatch):
+    written = []
+    real_receive = upload_stream.receive_multipart_upload
+
+    async def spy(request, file_path, **kwargs):
+        fields, upload = await real_receive(request, file_path, **kwargs)
+        written.append(upload.path.read_bytes())
+        return fields, upload
+
+    monkeypatch.setattr(api_server, "receive_multipart_upload", spy)
+    payload = bytes(range(256)) * 400
+    response = client.post(
+        "/api/admin/upload-file",
+        content=chunked(multipart_body(payload)),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["file_size"] == len(payload)
+    assert response.json()["sha256"] == hashlib.sha256(payload).hexdigest()
+    assert written == [payload]
+    assert client.added[0]["description"] == "hello"
+    assert client.added[0]["original_name"] == "clip.bin"
+
+
+def test_middleware_caps_body_without_content_length():
+    async def endpoint(request):
+        total = 0
+        async for chunk in request.stream():
+            total += len(chunk)
+        return JSONResponse({"total": total})
+
+    app = Starlette(routes=[Route("/upload", endpoint, methods=["POST"])])
+    app.add_middleware(upload_stream.BodySizeLimitMiddleware, max_size=10_000, paths=["/upload"])
+    # Behind a BaseHTTPMiddleware, like the real app's metrics middleware
+    app.add_middleware(BaseHTTPMiddleware, dispatch=lambda request, call_next: call_next(request))
+    with TestClient(app) as test_client:
+        assert test_client.post("/upload", content=chunked(b"x" * 50_000)).status_code == 413
+        response = test_client.post("/upload", content=chunked(b"x" * 5_000))
+        assert response.status_code == 200 and response.json() == {"total": 5_000}
+
+
+def test_oversized_file_part_is_removed(client, monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_UPLOAD_SIZE", 10_000)
+    before = set(api_server.TEMP_DIR.iterdir())
+    response = client.post(
+        "/api/admin/upload-file",
+        content=chunked(multipart_body(b"x" * 50_000)),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+    assert response.status_code == 413
+    assert client.added == []
+    assert set(api_server.TEMP_DIR.iterdir()) == before
+
+
+def test_false_content_length_is_rejected_up_front(client):
+    response = client.post(
+        "/api/admin/upload-file",
+        content=b"x",
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+            "Content-Length": str(api_server.MAX_UPLOAD_SIZE + 1),
+        },
+    )
+    assert response.status_code == 413
@@ -0,0 +1,135 @@
+"""URL ingestion against a local HTTP server"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import api_server
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MB
+
+
+async def serve_chunked(request):
+    response = web.StreamResponse()
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    for i in range(0, len(PAYLOAD), 50_000):
+        await response.write(PAYLOAD[i:i + 50_000])
+        await asyncio.sleep(0)
+    await response.write_eof()
+    return response
+
+
+async def serve_cut(request, body, length):
+    """Announce length bytes, send body, then drop the connection"""
+    response = web.StreamResponse(headers={"Content-Length": str(length)})
+    await response.prepare(request)
+    await response.write(body)
+    request.transport.close()
+    return response
+
+
+class FlakyOrigin:
+    """Drops the first response after `cut` bytes, then answers retries with `retry`"""
+
+    def __init__(self, cut, retry):
+        self.cut = cut
+        self.retry = retry
+        self.ranges = []
+
+    async def __call__(self, request):
+        self.ranges.append(request.headers.get("Range"))
+        if len(self.ranges) == 1:
+            return await serve_cut(request, PAYLOAD[:self.cut], len(PAYLOAD) + 1)
+        return await self.retry(request)
+
+
+async def serve_range(request):
+    start = int(request.headers["Range"][len("bytes="):-1])
+    return web.Response(status=206, body=PAYLOAD[start:], headers={
+        "Content-Range": f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}"})
+
+
+async def serve_whole(request):
+    return web.Response(body=PAYLOAD)
+
+
+async def serve_unsatisfiable(request):
+    return web.Response(status=416, headers={"Content-Range": f"bytes */{len(PAYLOAD)}"})
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    sleep = asyncio.sleep
+
+    async def instant(delay, *args, **kwargs):
+        return await sleep(0, *args, **kwargs)
+
+    monkeypatch.setattr(api_server.asyncio, "sleep", instant)
+
+
+async def fetch(dest, handler=serve_chunked):
+    app = web.Application()
+    app.router.add_get("/file.bin", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await api_server.fetch_url_to_path(f"http://127.0.0.1:{port}/file.bin", dest)
+    finally:
+        if api_server.http_session is not None:
+            await api_server.http_session.close()
+            api_server.http_session = None
+        await runner.cleanup()
+
+
+def test_chunked_response_is_written_whole(tmp_path):
+    dest = tmp_path / "file.bin"
+    written = asyncio.run(fetch(dest))
+    assert written == len(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_oversized_body_is_aborted_and_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_UPLOAD_SIZE", 300_000)
+    dest = tmp_path / "file.bin"
+    try:
+        asyncio.run(fetch(dest))
+    except api_server.HTTPException as e:
+        assert e.status_code == 413
+    else:
+        raise AssertionError("oversized body was accepted")
+    assert not dest.exists()
+
+
+def test_dropped_connection_resumes_from_written_offset(tmp_path, no_backoff):
+    origin = FlakyOrigin(cut=300_000, retry=serve_range)
+    dest = tmp_path / "file.bin"
+    written = asyncio.run(fetch(dest, origin))
+    assert written == len(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+    assert origin.ranges[0] is None
+    assert len(origin.ranges) == 2
+    offset = int(origin.ranges[1][len("bytes="):-1])
+    assert 0 < offset <= 300_000
+    assert origin.ranges[1] == f"bytes={offset}-"
+
+
+def test_retry_answered_with_200_rewrites_the_file(tmp_path, no_backoff):
+    origin = FlakyOrigin(cut=300_000, retry=serve_whole)
+    dest = tmp_path / "file.bin"
+    written = asyncio.run(fetch(dest, origin))
+    assert origin.ranges[1] is not None
+    assert written == len(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_416_after_complete_body_keeps_the_file(tmp_path, no_backoff):
+    origin = FlakyOrigin(cut=len(PAYLOAD), retry=serve_unsatisfiable)
+    dest = tmp_path / "file.bin"
+    written = asyncio.run(fetch(dest, origin))
+    assert origin.ranges[1] == f"bytes={len(PAYLOAD)}-"
+    assert written == len(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
@@ -0,0 +1,60 @@
+"""Multi-worker setup: per-worker Telegram sessions and the startup check"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from telegram_downloader_integration import discard_worker_session, worker_session_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_session(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE sessions (dc_id INTEGER, auth_key BLOB)")
+    conn.execute("INSERT INTO sessions VALUES (2, x'00ff')")
+    conn.commit()
+    return conn
+
+
+def test_worker_gets_a_private_copy_of_the_session(tmp_path):
+    session = tmp_path / "bot"
+    main = make_session(str(session) + ".session")
+    config_file = tmp_path / "telegram-upload.json"
+    config_file.write_text(json.dumps({"api_id": 1, "api_hash": "x", "session": str(session)}))
+
+    worker_config = worker_session_config(str(config_file), worker_id=os.getpid())
+    config = json.loads(open(worker_config).read())
+    assert config["api_id"] == 1
+    assert config["session"] == f"{session}-w{os.getpid()}"
+    copy = sqlite3.connect(config["session"] + ".session")
+    assert copy.execute("SELECT dc_id, auth_key FROM sessions").fetchall() == [(2, b"\x00\xff")]
+    copy.close()
+    main.close()
+
+    discard_worker_session(worker_config)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bot.session", "telegram-upload.json"]
+
+
+def test_copies_of_dead_workers_are_removed(tmp_path):
+    session = tmp_path / "bot"
+    make_session(str(session) + ".session").close()
+    config_file = tmp_path / "telegram-upload.json"
+    config_file.write_text(json.dumps({"api_id": 1, "api_hash": "x", "session": str(session)}))
+    # 2**22 is above the largest possible pid_max, so no such process can exist
+    worker_session_config(str(config_file), worker_id=2 ** 22)
+    live = worker_session_config(str(config_file), worker_id=os.getpid())
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == sorted(["bot.session", "telegram-upload.json",
+                            f"bot-w{os.getpid()}.session", f"bot-w{os.getpid()}.json"])
+    discard_worker_session(live)
+
+
+def test_several_workers_need_the_shared_rate_limit_backend():
+    env = dict(os.environ, API_WORKERS="2", RATE_LIMIT_BACKEND="memory")
+    result = subprocess.run([sys.executable, "-c", "import api_server"], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode != 0
+    assert "API_WORKERS=2 needs RATE_LIMIT_BACKEND=sqlite" in result.stderr
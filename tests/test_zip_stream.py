@@ -0,0 +1,103 @@
+"""Streaming ZIP output checked against the zipfile module"""
+import asyncio
+import io
+import struct
+import zipfile
+import zlib
+from datetime import datetime
+
+import pytest
+
+import zip_stream
+from zip_stream import ZipMember, plan_archive, stream_zip
+
+FILES = {
+    "a.bin": bytes(range(256)) * 300,
+    "dir/b.txt": b"hello zip\n" * 1000,
+    "empty": b"",
+    "Фото.jpg": b"\xff\xd8" + bytes(5000),
+}
+
+
+def source(data, piece=4096):
+    async def chunks():
+        for i in range(0, len(data), piece):
+            yield data[i:i + piece]
+    return chunks
+
+
+def members(known_sizes=True):
+    return [ZipMember(name, len(data) if known_sizes else None, source(data),
+                      modified=datetime(2024, 5, 6, 7, 8, 10))
+            for name, data in FILES.items()]
+
+
+def build(entries):
+    async def collect():
+        return b"".join([chunk async for chunk in stream_zip(entries, prefetch=2, buffer_bytes=8192)])
+    return asyncio.run(collect())
+
+
+def test_archive_opens_with_matching_crcs_and_contents():
+    archive = build(members())
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(FILES)
+        for info in zf.infolist():
+            data = FILES[info.filename]
+            assert info.CRC == zlib.crc32(data)
+            assert info.file_size == len(data)
+            assert zf.read(info) == data
+            assert info.date_time == (2024, 5, 6, 7, 8, 10)
+
+
+def test_planned_length_matches_the_output():
+    entries = members()
+    planned = plan_archive(entries)
+    assert planned == len(build(entries))
+    # Unknown sizes: no length can be promised
+    assert plan_archive(members(known_sizes=False)) is None
+
+
+def zip64_records(archive):
+    return struct.pack("<I", 0x06064B50) in archive, struct.pack("<I", 0x07064B50) in archive
+
+
+def test_member_over_the_zip32_limit_gets_zip64_records(monkeypatch):
+    # Pretend a.bin is over 4 GiB; the format constants stay real
+    big = "a.bin"
+    needs_zip64 = zip_stream._needs_zip64
+    entries = members()
+    monkeypatch.setattr(zip_stream, "_needs_zip64", lambda size, offset: size == len(FILES[big])
+                        or needs_zip64(size, offset))
+
+    planned = plan_archive(entries)
+    archive = build(entries)
+    assert planned == len(archive)
+    assert zip64_records(archive) == (True, True)
+    assert [m.zip64 for m in entries] == [m.name == big for m in entries]
+
+    # The local header of the big member carries the ZIP64 extra field
+    name = big.encode()
+    header = archive.index(struct.pack("<I", 0x04034B50) + struct.pack("<H", 45))
+    name_len, extra_len = struct.unpack("<HH", archive[header + 26:header + 30])
+    assert archive[header + 30:header + 30 + name_len] == name
+    assert extra_len == 20
+    assert struct.unpack("<HH", archive[header + 30 + name_len:header + 34 + name_len]) == (0x0001, 16)
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.read(big) == FILES[big]
+        assert zf.testzip() is None
+
+
+def test_unknown_sizes_use_zip64_throughout():
+    archive = build(members(known_sizes=False))
+    assert zip64_records(archive) == (True, True)
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert {name: zf.read(name) for name in zf.namelist()} == FILES
+
+
+def test_short_source_raises_ioerror():
+    entries = [ZipMember("short.bin", 10_000, source(bytes(6000)))]
+    with pytest.raises(IOError, match="expected 10000 bytes, got 6000"):
+        build(entries)
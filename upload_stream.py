@@ -0,0 +1,221 @@
+"""
+Admin upload ingestion without buffering
+BodySizeLimitMiddleware counts request body bytes as they arrive on the
+raw ASGI receive channel and answers 413 as soon as the limit is passed,
+whether or not the client sent a (truthful) Content-Length.
+receive_multipart_upload() parses a multipart/form-data body as it
+streams in and writes the file part straight to its destination, so an
+upload touches the disk once and memory use stays flat.
+"""
+import hashlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # older python-multipart releases
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Plain form fields next to the file are small; anything bigger is not a form field
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class BodyTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="File too large")
+
+
+class BodySizeLimitMiddleware:
+    """Pure ASGI middleware: 413 once a request body on `paths` exceeds max_size bytes"""
+
+    def __init__(self, app, max_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_size = max_size
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_size <= 0 or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_size:
+                await self._reject(scope, receive, send)
+                return
+
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Answer now and make the app see a disconnected client;
+                    # raising here would be wrapped by outer middleware into a 500
+                    rejected = True
+                    if not response_started:
+                        await self._reject(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # the 413 has already been sent
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # The app failing on the simulated disconnect is expected once rejected
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        await JSONResponse(status_code=413, content={"detail": "File too large"})(scope, receive, send)
+
+
+class UploadedFile:
+    """A file part written to disk by receive_multipart_upload()"""
+
+    def __init__(self, field_name: str, filename: str, path: Path):
+        self.field_name = field_name
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+
+async def receive_multipart_upload(request: Request, file_path: Callable[[str], Path],
+                                   max_size: int = 0, write_size: int = 1024 * 1024
+                                   ) -> Tuple[Dict[str, str], Optional[UploadedFile]]:
+    """
+    Parse the request's multipart body while it streams in.
+    Form fields are returned as strings; the first file part is written to
+    file_path(filename) in write_size pieces, with its size and SHA-256
+    computed on the way.
+    Further file parts are ignored. 413 past max_size file bytes (0 = no
+    cap), 400 for malformed bodies; a partial file is removed on failure.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    fields: Dict[str, str] = {}
+    upload: Optional[UploadedFile] = None
+    # Parser callbacks are synchronous: they queue events that are applied
+    # (with awaited file writes) after each network chunk
+    events: List[tuple] = []
+    header = {"field": b"", "value": b"", "disposition": b""}
+
+    def on_part_begin():
+        header["disposition"] = b""
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        if header["field"].lower() == b"content-disposition":
+            header["disposition"] = header["value"]
+        header["field"] = b""
+        header["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(header["disposition"])
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        events.append(("part", name, None if filename is None else filename.decode("utf-8", "replace")))
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end",))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    out = None
+    current: Optional[str] = None   # field name of a plain field part
+    field_data = bytearray()
+    pending = bytearray()           # file bytes not yet written
+    writing = False                 # inside the file part being stored
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+            for event in events:
+                if event[0] == "part":
+                    _, name, filename = event
+                    if filename is None:
+                        current, writing = name, False
+                        field_data = bytearray()
+                    elif upload is None:
+                        current, writing = None, True
+                        upload = UploadedFile(name, filename, file_path(filename))
+                        out = await aiofiles.open(upload.path, "wb")
+                    else:
+                        current, writing = None, False
+                elif event[0] == "data":
+                    data = event[1]
+                    if writing:
+                        upload.size += len(data)
+                        if max_size > 0 and upload.size > max_size:
+                            raise BodyTooLarge()
+                        upload.sha256.update(data)
+                        pending += data
+                        if len(pending) >= write_size:
+                            await out.write(bytes(pending))
+                            pending = bytearray()
+                    elif current is not None:
+                        field_data += data
+                        if len(field_data) > MAX_FIELD_BYTES:
+                            raise HTTPException(status_code=400, detail=f"Form field {current} too large")
+                else:
+                    if writing:
+                        if pending:
+                            await out.write(bytes(pending))
+                            pending = bytearray()
+                        await out.close()
+                        out = None
+                        writing = False
+                    elif current is not None:
+                        fields[current] = field_data.decode("utf-8", "replace")
+                        current = None
+            events.clear()
+        parser.finalize()
+        if writing:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+    except BaseException:
+        if out is not None:
+            await out.close()
+        if upload is not None and upload.path.exists():
+            upload.path.unlink()
+        raise
+    return fields, upload
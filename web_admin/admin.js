@@ -140,15 +140,31 @@ function loadDailyChart() {
 }
 
 // Files management
-async function loadFiles() {
+const FILES_PAGE_SIZE = 100;
+let filesCursor = null;
+let filesShown = 0;
+
+// append=false starts over from the first page; true fetches the page after filesCursor
+async function loadFiles(append = false) {
     try {
-        const response = await fetch(`${API_BASE}/admin/files`);
-        const files = await response.json();
+        const params = new URLSearchParams({ limit: FILES_PAGE_SIZE });
+        if (append && filesCursor) params.set('cursor', filesCursor);
+        const response = await fetch(`${API_BASE}/admin/files?${params}`);
+        const page = await response.json();
+        const files = page.items;
         
         const tbody = document.getElementById('files-table');
-        tbody.innerHTML = '';
+        if (!append) {
+            tbody.innerHTML = '';
+            filesShown = 0;
+        }
+        filesCursor = page.next_cursor;
+        filesShown += files.length;
         
-        if (files.length === 0) {
+        document.getElementById('files-count').textContent = `نمایش ${filesShown} از ${page.total} فایل`;
+        document.getElementById('files-more').style.display = filesCursor ? '' : 'none';
+        
+        if (filesShown === 0) {
             tbody.innerHTML = '<tr><td colspan="6" class="text-center text-muted">فایلی یافت نشد</td></tr>';
             return;
         }
@@ -181,6 +197,10 @@ async function loadFiles() {
     }
 }
 
+function loadMoreFiles() {
+    if (filesCursor) loadFiles(true);
+}
+
 function refreshFiles() {
     loadFiles();
     showNotification('فایل‌ها بروزرسانی شدند', 'success');
@@ -0,0 +1,218 @@
+"""
+Streaming ZIP writer for multi-file downloads
+Members are stored (no compression: media does not shrink) and written one
+after another straight from their byte sources, so memory use does not
+depend on file sizes and nothing touches the disk. Sizes go into data
+descriptors after each member; when every member size is known up front,
+the exact archive length can be computed before sending (Content-Length).
+ZIP64 records are used per member/archive only where the limits require.
+The next few members are fetched in parallel with the one being written,
+each through a bounded ReadAheadBuffer.
+"""
+import zlib
+import struct
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from stream_control import ReadAheadBuffer
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+
+# General purpose flags: bit 3 = sizes/CRC in a data descriptor, bit 11 = UTF-8 names
+FLAGS = 0x0008 | 0x0800
+UNIX_FILE_ATTRS = (0o100644 << 16)
+
+
+class ZipMember:
+    """One archive entry: its name, expected size (None if unknown) and a source factory"""
+
+    def __init__(self, name: str, size: Optional[int],
+                 open_source: Callable[[], AsyncIterator[bytes]],
+                 modified: Optional[datetime] = None):
+        self.name = name
+        self.size = size
+        self.open_source = open_source
+        self.modified = modified or datetime.now()
+        self.zip64 = False
+        self.offset = 0
+        self.crc = 0
+        self.written = 0
+
+    @property
+    def encoded_name(self) -> bytes:
+        return self.name.encode("utf-8")
+
+    def dos_time(self):
+        t = self.modified
+        if t.year < 1980:
+            return 0, (1 << 5) | 1
+        return (t.hour << 11) | (t.minute << 5) | (t.second // 2), \
+               ((t.year - 1980) << 9) | (t.month << 5) | t.day
+
+
+def member_name(*parts: str) -> str:
+    """Archive path from folder/file parts; separators and '..' inside a part are neutralised"""
+    cleaned = []
+    for part in parts:
+        part = str(part).replace("/", "_").replace("\\", "_").strip()
+        cleaned.append("_" if part in ("", ".", "..") else part)
+    return "/".join(cleaned)
+
+
+def unique_names(names: List[str]) -> List[str]:
+    """Make archive names unique: 'a.mp4', 'a (1).mp4', ..."""
+    seen = set()
+    result = []
+    for name in names:
+        candidate = name
+        stem, dot, ext = name.rpartition(".")
+        if not dot or "/" in ext:
+            stem, dot, ext = name, "", ""
+        counter = 1
+        while candidate.lower() in seen:
+            candidate = f"{stem} ({counter}){dot}{ext}"
+            counter += 1
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def _needs_zip64(size: Optional[int], offset: int) -> bool:
+    # Unknown sizes might not fit in 32 bits, so they always get ZIP64 fields
+    return size is None or size >= ZIP32_LIMIT or offset >= ZIP32_LIMIT
+
+
+def _local_header(member: ZipMember) -> bytes:
+    mod_time, mod_date = member.dos_time()
+    name = member.encoded_name
+    if member.zip64:
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        sizes = (ZIP32_LIMIT, ZIP32_LIMIT)
+        version = 45
+    else:
+        extra = b""
+        sizes = (0, 0)
+        version = 20
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, version, FLAGS, 0, mod_time, mod_date,
+        0, sizes[0], sizes[1], len(name), len(extra)
+    ) + name + extra
+
+
+def _data_descriptor(member: ZipMember) -> bytes:
+    if member.zip64:
+        return struct.pack("<IIQQ", 0x08074B50, member.crc, member.written, member.written)
+    return struct.pack("<IIII", 0x08074B50, member.crc, member.written, member.written)
+
+
+def _central_entry(member: ZipMember) -> bytes:
+    mod_time, mod_date = member.dos_time()
+    name = member.encoded_name
+    if member.zip64:
+        extra = struct.pack("<HHQQQ", 0x0001, 24, member.written, member.written, member.offset)
+        size, offset, version = ZIP32_LIMIT, ZIP32_LIMIT, 45
+    else:
+        extra = b""
+        size, offset, version = member.written, member.offset, 20
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, FLAGS, 0,
+        mod_time, mod_date, member.crc, size, size, len(name), len(extra), 0, 0, 0,
+        UNIX_FILE_ATTRS, offset
+    ) + name + extra
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int, force_zip64: bool) -> bytes:
+    records = b""
+    if force_zip64 or count >= ZIP16_LIMIT or cd_offset >= ZIP32_LIMIT or cd_size >= ZIP32_LIMIT:
+        zip64_eocd_offset = cd_offset + cd_size
+        records += struct.pack(
+            "<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | 45, 45, 0, 0,
+            count, count, cd_size, cd_offset
+        )
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_eocd_offset, 1)
+    records += struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, min(count, ZIP16_LIMIT), min(count, ZIP16_LIMIT),
+        min(cd_size, ZIP32_LIMIT), min(cd_offset, ZIP32_LIMIT), 0
+    )
+    return records
+
+
+def plan_archive(members: List[ZipMember]) -> Optional[int]:
+    """
+    Decide ZIP64 use and offsets for every member; returns the exact archive
+    size when all member sizes are known, else None
+    """
+    offset = 0
+    any_zip64 = False
+    for member in members:
+        member.offset = offset
+        member.zip64 = _needs_zip64(member.size, offset)
+        any_zip64 = any_zip64 or member.zip64
+        if member.size is None:
+            offset = None
+            break
+        member.written = member.size
+        offset += len(_local_header(member)) + member.size + len(_data_descriptor(member))
+    if offset is None:
+        return None
+    cd_size = sum(len(_central_entry(member)) for member in members)
+    return offset + cd_size + len(_end_records(len(members), offset, cd_size, any_zip64))
+
+
+async def stream_zip(members: List[ZipMember], prefetch: int = 2,
+                     buffer_bytes: int = 4 * 1024 * 1024) -> AsyncIterator[bytes]:
+    """
+    Yield the archive. Each member's bytes come from member.open_source();
+    while one member is written, the next `prefetch` members already read
+    ahead (at most buffer_bytes each). A member whose size is known must
+    deliver exactly that many bytes, otherwise the precomputed length would
+    be wrong and IOError is raised.
+    """
+    opened: Dict[int, ReadAheadBuffer] = {}
+
+    def open_member(index: int):
+        if index < len(members) and index not in opened:
+            source = ReadAheadBuffer(members[index].open_source(), min_bytes=buffer_bytes,
+                                     max_bytes=buffer_bytes, route="zip")
+            source.start()
+            opened[index] = source
+
+    offset = 0
+    any_zip64 = False
+    try:
+        for index, member in enumerate(members):
+            for ahead in range(index, index + 1 + max(prefetch, 0)):
+                open_member(ahead)
+            async for chunk in _write_member(member, offset, opened.pop(index)):
+                offset += len(chunk)
+                yield chunk
+            any_zip64 = any_zip64 or member.zip64
+    finally:
+        for source in opened.values():
+            await source.aclose()
+
+    cd_offset = offset
+    central = b"".join(_central_entry(member) for member in members)
+    yield central
+    yield _end_records(len(members), cd_offset, len(central), any_zip64)
+
+
+async def _write_member(member: ZipMember, offset: int, source: ReadAheadBuffer) -> AsyncIterator[bytes]:
+    try:
+        member.offset = offset
+        member.zip64 = _needs_zip64(member.size, offset)
+        member.crc = 0
+        member.written = 0
+        yield _local_header(member)
+
+        async for chunk in source:
+            member.crc = zlib.crc32(chunk, member.crc)
+            member.written += len(chunk)
+            yield chunk
+        if member.size is not None and member.written != member.size:
+            raise IOError(f"{member.name}: expected {member.size} bytes, got {member.written}")
+
+        yield _data_descriptor(member)
+    finally:
+        await source.aclose()